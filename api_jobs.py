@@ -1,25 +1,37 @@
 # api_jobs.py
 from __future__ import annotations
 
+import json
 import multiprocessing as mp
 import os
 import secrets
+import signal
+import sys
 import threading
 import time
 import uuid
 from dataclasses import asdict, dataclass, field
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from multiprocessing import Process
 from pathlib import Path
 from typing import Dict, Optional
 
 # === usa o seu modelo real ===
 import torch
-from flask import Blueprint, abort, jsonify, request, send_file, url_for
+from flask import Blueprint, abort, jsonify, request, send_file, stream_with_context, url_for
 from werkzeug.exceptions import HTTPException
 
+import metrics
+from job_store import STORE
+from scheduler import SCHEDULER, Overloaded, Ticket, estimate_cost
+from spool import Spool
 from model.model import FlowNet
-from model.util import interpolate_video
+from model.graph import GRAPH_BACKEND, preset_shapes, wrap_graph
+from model.progress import SharedProgress
+from model.quantized import PRECISIONS, load_flownet
+from model.segments import interpolate_video_segmented
+from model.util import SCENE_CUT_THRESHOLD, STATIC_THRESHOLD, interpolate_video
+from model.video_io import READERS, count_frames, ffmpeg_available, live_path
 
 _PROCS: dict[str, Process] = {}
 
@@ -30,8 +42,17 @@ TTL_SECONDS = 24 * 60 * 60         # RF-11 TTL 24h
 UPLOAD_DIR  = Path("static/uploads");  UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 OUTPUT_DIR  = Path("static/outputs");  OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Com DUPLICAJA_SPOOL os jobs vão para um spool compartilhado e rodam nos
+# worker.py de outras máquinas (uploads/ e outputs/ precisam estar no mesmo
+# volume, no mesmo caminho); sem ele rodam aqui, pelo SCHEDULER.
+SPOOL = Spool(os.environ["DUPLICAJA_SPOOL"]) if os.environ.get("DUPLICAJA_SPOOL") else None
+SPOOL_POLL_SECONDS = 1.0
+SSE_KEEPALIVE_SECONDS = 15.0
+LIVE_CHUNK = 64 * 1024
+LIVE_WAIT_SECONDS = 30.0             # quanto o /live espera o primeiro fragmento aparecer
+
 PRESETS = {                         # RF-06
-    "youtube_60fps": {"multi": 2, "fps_alvo": 60, "downscale": 1.0},
+    "youtube_60fps": {"multi": 2, "fps_alvo": 60, "downscale": 1.0, "precision": "bf16"},
     "stories_30fps": {"multi": 2, "fps_alvo": 30, "downscale": 0.75},
     "qualidade_120": {"multi": 4, "fps_alvo": 120, "downscale": 1.0},
     "mobile_leve":   {"multi": 2, "fps_alvo": 48, "downscale": 0.5},
@@ -174,7 +195,6 @@ def _send_file_with_range(path: Path):
     return resp
 
 # ========= MODELO (carrega 1x aqui) =========
-torch.backends.cudnn.benchmark = True
 _device = torch.device("cpu")
 _model = FlowNet(base=16).to(_device)
 _model.eval()
@@ -183,6 +203,15 @@ try:
 except Exception as e:
     # se não tiver o peso, os jobs vão falhar com msg clara
     print("ATENÇÃO: best_model.pth não carregado:", e)
+# variantes por precisão (model.quantized); a int8 é calibrada na 1ª vez que um job pede
+_MODELS = {"fp32": wrap_graph(_model)}
+_MODELS_LOCK = threading.Lock()
+
+def _get_model(precision: str):
+    with _MODELS_LOCK:
+        if precision not in _MODELS:
+            _MODELS[precision] = load_flownet("best_model.pth", precision)
+        return _MODELS[precision]
 
 # ========= STORE DE JOBS =========
 @dataclass
@@ -203,7 +232,16 @@ class Job:
     multi: Optional[int] = None
     fps_alvo: Optional[int] = None
     downscale: Optional[float] = None
-    manter_audio: bool = True   # ignorado no motor atual
+    manter_audio: bool = True   # áudio só é mapeado quando há ffmpeg
+    batch_size: Optional[int] = None   # pares por inferência (None = automático)
+    reader: str = "cv2"                 # decodificador: cv2 | ffmpeg | auto
+    perf: Optional[Dict] = None         # tempo por etapa + filas/pool (do sidecar)
+    segments: Optional[int] = None      # None/1 = serial; 0 = automático (núcleos); N = N trechos em paralelo
+    progress: Optional[Dict] = None     # {frames_done, frames_total, fps, eta_s} durante a interpolação
+    stream: bool = False                # MP4 fragmentado tocável em /live enquanto processa
+    scene_threshold: Optional[float] = None   # corte de cena (0..1); None = padrão, 0 = desligado
+    static_threshold: Optional[float] = None  # par parado (0..1); None = padrão, 0 = desligado
+    precision: str = "fp32"             # fp32 | int8 (FlowNet quantizado, só por job) | bf16 (channels_last + bfloat16)
 
     ttl_seconds: int = TTL_SECONDS
     _cancel: bool = field(default=False, repr=False)
@@ -215,50 +253,124 @@ class Job:
         d = asdict(self); d.pop("_cancel", None)
         d["status_label_pt"] = LABEL_PT.get(self.status, self.status)
         d["expires_at"] = self.expires_at().isoformat() + "Z"
+        d["queue"] = SCHEDULER.info(self.id) if SPOOL is None else {"state": SPOOL.state(self.id)}
         if self.status == "completed" and self.output_name:
             d["result_url"] = url_for("jobs.get_result", id=self.id, token=self.token, _external=True)
+        # só quando o writer de fato grava o MP4 fragmentado (sem ffmpeg, no local
+        # ou no worker, ele nunca aparece e o /live daria 404)
+        if self.stream and self.status == "processing" and _live_file(self).exists():
+            d["live_url"] = url_for("jobs.get_live", id=self.id, token=self.token, _external=True)
         return d
 
+def _live_file(job: Job) -> Path:
+    return Path(live_path(OUTPUT_DIR / _out_name(job.input_name, job.fps_alvo)))
+
+# só os jobs vivos (na fila/rodando) ficam em memória; o histórico fica no STORE
 _JOBS: Dict[str, Job] = {}
 _LOCK = threading.Lock()
+# acorda os streams SSE a cada mudança de job; _VERSION evita perder um aviso
+_CHANGED = threading.Condition()
+_VERSION = 0
+
+def _notify():
+    global _VERSION
+    with _CHANGED:
+        _VERSION += 1
+        _CHANGED.notify_all()
+
+def _set_progress(job: Job, snap: Optional[Dict]):
+    """Atualiza só a memória (o store recebe o valor na próxima transição)."""
+    if not snap:
+        return
+    job.progress = snap
+    if snap["frames_total"]:
+        job.progresso = round(0.05 + 0.85 * snap["frames_done"] / snap["frames_total"], 3)
+    _notify()
+
+def _epoch(dt: datetime) -> float:
+    return dt.replace(tzinfo=timezone.utc).timestamp()   # datas do job são UTC "ingênuas"
+
+def _to_row(job: Job) -> Dict:
+    d = asdict(job); d.pop("_cancel", None)
+    d["created_at"] = job.created_at.isoformat()
+    d["updated_at"] = job.updated_at.isoformat()
+    return d
+
+def _from_row(d: Dict) -> Job:
+    d = dict(d)
+    d["created_at"] = datetime.fromisoformat(d["created_at"])
+    d["updated_at"] = datetime.fromisoformat(d["updated_at"])
+    return Job(**d)
+
+def _save(job: Job):
+    """Persiste o job; jobs encerrados saem da memória."""
+    STORE.save("jobs", job.id, job.status, _to_row(job),
+               _epoch(job.created_at), _epoch(job.updated_at), _epoch(job.expires_at()))
+    with _LOCK:
+        if job.status in ("queued", "processing"):
+            _JOBS[job.id] = job
+        else:
+            _JOBS.pop(job.id, None)
+    _notify()
 
 def _put(job: Job):
-    with _LOCK: _JOBS[job.id] = job
+    _save(job)
 
 def _get(jid: str) -> Optional[Job]:
-    with _LOCK: return _JOBS.get(jid)
-
-def _cancel(jid: str):
     with _LOCK:
         j = _JOBS.get(jid)
-        if not j: return
-        j._cancel = True
-        j.status = "canceled"
-        j.etapa  = "cancelado"
-        j.updated_at = datetime.utcnow()
-        # limpeza
-        try:
-            if j.output_name: (OUTPUT_DIR / j.output_name).unlink(missing_ok=True)
-            (UPLOAD_DIR / j.input_name).unlink(missing_ok=True)
-        except: pass
+    if j is not None:
+        return j
+    d = STORE.load("jobs", jid)
+    return _from_row(d) if d else None
 
 def _sweep():
     while True:
         time.sleep(30)
-        now = datetime.utcnow()
-        with _LOCK:
-            rm = []
-            for jid, j in _JOBS.items():
-                if now > j.expires_at():
-                    try:
-                        if j.output_name: (OUTPUT_DIR / j.output_name).unlink(missing_ok=True)
-                        (UPLOAD_DIR / j.input_name).unlink(missing_ok=True)
-                    except: pass
-                    rm.append(jid)
-            for jid in rm:
+        # só os expirados, pelo índice de expiração
+        for jid, d in STORE.expired("jobs", time.time()):
+            j = _from_row(d)
+            try:
+                if j.output_name: (OUTPUT_DIR / j.output_name).unlink(missing_ok=True)
+                (UPLOAD_DIR / j.input_name).unlink(missing_ok=True)
+            except: pass
+            with _LOCK:
                 _JOBS.pop(jid, None)
-
-threading.Thread(target=_sweep, daemon=True).start()
+            STORE.delete("jobs", jid)
+            SCHEDULER.forget(jid)
+
+def _recover_jobs():
+    """Na subida: re-enfileira o que estava na fila e marca o que foi interrompido."""
+    for d in STORE.with_status("jobs", ("queued", "processing")):
+        job = _from_row(d)
+        if SPOOL is not None and SPOOL.state(job.id) is not None:
+            _save(job)   # segue no spool (ou já tem resultado); o _spool_poll acompanha
+            continue
+        if job.status == "queued" and (UPLOAD_DIR / job.input_name).exists():
+            try:
+                _submit(job)
+                _save(job)
+                continue
+            except Overloaded:
+                pass
+        (UPLOAD_DIR / job.input_name).unlink(missing_ok=True)
+        job.status = "failed"; job.message = "interrompido: o servidor reiniciou antes de concluir o job"
+        job.updated_at = datetime.utcnow()
+        _save(job)
+
+@metrics.register_collector
+def _collect_jobs():
+    by_status = STORE.counts_by_status("jobs")
+    procs = list(_PROCS.values())
+    yield ("jobs", "gauge", "Jobs no store, por API e status.",
+           [({"api": "jobs", "status": st}, n) for st, n in by_status.items()])
+    yield ("queue_depth", "gauge", "Jobs aguardando worker, por API.",
+           [({"api": "jobs"}, by_status.get("queued", 0))])
+    yield ("subprocesses_alive", "gauge", "Subprocessos de interpolação vivos.",
+           [({}, sum(1 for p in procs if p.is_alive()))])
+    if SPOOL is not None:
+        yield ("spool_jobs", "gauge", "Jobs no spool compartilhado, por estado.",
+               [({"state": st}, n) for st, n in SPOOL.depth().items()])
 
 # ========= WORKER =========
 def _out_name(input_name: str, fps: Optional[int]) -> str:
@@ -266,26 +378,151 @@ def _out_name(input_name: str, fps: Optional[int]) -> str:
     if not ext: ext = ".mp4"
     return f"{stem}_interp_{int(fps)}fps{ext}" if fps else f"{stem}_interp{ext}"
 
-def _interpolate_task(src_path: str, out_path: str, multi: int, fps_override: int | None, down: float):
+def _interpolate_task(src_path: str, out_path: str, multi: int, fps_override: int | None, down: float,
+                      batch_size: int | None = None, writer: str = "cv2", audio_path: str | None = None,
+                      reader: str = "cv2", segments: int | None = None, threads: int | None = None,
+                      progress: SharedProgress | None = None, live: bool = False,
+                      scene_threshold: float | None = SCENE_CUT_THRESHOLD,
+                      static_threshold: float | None = STATIC_THRESHOLD, precision: str = "fp32"):
     # roda a tarefa real (processo separado) — retorna 6 valores
-    avg_fps, frames, fps_in, fps_out, W, H = interpolate_video(
-        in_path=src_path,
-        out_path=out_path,
-        multi=multi,
-        fps_override=fps_override,
-        down=down,
-        model=_model,
-        device=_device
-    )
+    # o _run_job já carregou o modelo desta precisão no pai (herdado no fork, sem
+    # tocar no _MODELS_LOCK, que outra thread do pai podia estar segurando)
+    model = _MODELS.get(precision) or _get_model(precision)
+    if threads:
+        torch.set_num_threads(threads)   # cota do escalonador para este job
+    stats = {}
+    if segments is not None and segments != 1:
+        # trechos em processos filhos; o terminate() do cancelamento vira
+        # SystemExit para que eles sejam encerrados junto (ver _run_segments)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+        avg_fps, frames, fps_in, fps_out, W, H = interpolate_video_segmented(
+            src_path, out_path,
+            multi=multi,
+            fps_override=fps_override,
+            down=down,
+            segments=segments or None,
+            cores=threads,
+            batch_size=batch_size,
+            reader=reader,
+            audio_path=audio_path,
+            stats=stats,
+            model=model,
+            progress=progress,
+            scene_threshold=scene_threshold,
+            static_threshold=static_threshold,
+            precision=precision,
+        )
+    else:
+        avg_fps, frames, fps_in, fps_out, W, H = interpolate_video(
+            in_path=src_path,
+            out_path=out_path,
+            multi=multi,
+            fps_override=fps_override,
+            down=down,
+            model=model,
+            device=_device,
+            batch_size=batch_size,
+            writer=writer,
+            audio_path=audio_path,
+            reader=reader,
+            stats=stats,
+            progress=progress,
+            live=live,
+            scene_threshold=scene_threshold,
+            static_threshold=static_threshold,
+        )
     # Guardamos as métricas em um arquivo sidecar simples (para não perder no processo)
     sidecar = out_path + ".meta"
     with open(sidecar, "w", encoding="utf-8") as f:
-        # Escreve 6 campos; leitura no worker é retrocompatível (2–6)
-        f.write(f"{avg_fps}|{frames}|{fps_in}|{fps_out}|{W}|{H}")
+        # Escreve 6 campos + JSON de desempenho; leitura no worker é retrocompatível (2–7)
+        f.write(f"{avg_fps}|{frames}|{fps_in}|{fps_out}|{W}|{H}|{json.dumps(stats, separators=(',', ':'))}")
+
+def _worker(job: Job, ticket: Ticket):
+    metrics.WORKERS_BUSY.inc(api="jobs")
+    try:
+        _run_job(job, ticket.threads)
+        # só jobs concluídos calibram a vazão do escalonador
+        return job.status == "completed"
+    finally:
+        _save(job)
+        metrics.WORKERS_BUSY.dec(api="jobs")
+        metrics.JOBS_FINISHED.inc(api="jobs", status=job.status)
+        metrics.JOB_LATENCY.observe((datetime.utcnow() - job.created_at).total_seconds(), api="jobs")
+
+def _on_queued_cancel(job: Job):
+    # cancelado antes de sair da fila do escalonador: nunca rodou
+    metrics.JOBS_FINISHED.inc(api="jobs", status="canceled")
+
+def _job_cost(job: Job) -> float:
+    # custo estimado a partir do probe: ordena a fila e decide a admissão
+    src = UPLOAD_DIR / job.input_name
+    cap = cv2.VideoCapture(str(src))
+    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0); H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+    cap.release()
+    return estimate_cost(count_frames(src), W, H, int(job.multi or 1), float(job.downscale or 1.0))
+
+def _threshold(value: Optional[float], default: float) -> float:
+    return default if value is None else float(value)
+
+def _spool_spec(job: Job) -> Dict:
+    src = (UPLOAD_DIR / job.input_name).resolve()
+    return {
+        "input_path": str(src),
+        "output_path": str((OUTPUT_DIR / _out_name(job.input_name, job.fps_alvo)).resolve()),
+        "multi": int(job.multi or 1),
+        "fps_override": int(job.fps_alvo) if job.fps_alvo else None,
+        "down": float(job.downscale or 1.0),
+        "batch_size": int(job.batch_size) if job.batch_size else None,
+        "reader": job.reader,
+        "segments": int(job.segments) if job.segments is not None else None,
+        "audio": bool(job.manter_audio),
+        "stream": bool(job.stream),
+        "scene_threshold": _threshold(job.scene_threshold, SCENE_CUT_THRESHOLD),
+        "static_threshold": _threshold(job.static_threshold, STATIC_THRESHOLD),
+        "precision": job.precision,
+    }
+
+def _submit(job: Job):
+    if SPOOL is not None:
+        SPOOL.enqueue(job.id, _spool_spec(job))
+        return
+    SCHEDULER.submit(job.id, lambda t: _worker(job, t), api="jobs",
+                     on_cancel=lambda t: _on_queued_cancel(job), cost=_job_cost(job))
+
+def _finish_output(job: Job, out: Path, web_ready: bool):
+    """Lê o sidecar de métricas, garante o MP4 web-safe e marca o job como concluído."""
+    # lê sidecar (retrocompatível: aceita 2 a 7 campos)
+    meta_path = str(out) + ".meta"
+    avg_fps = None; frames = None
+    fps_in = None; fps_out = None; W = None; H = None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            txt = f.read().strip()
+            parts = txt.split("|", 6)
+            if len(parts) >= 2:
+                avg_fps = float(parts[0]) if parts[0] != "" else None
+                frames  = int(parts[1])   if parts[1] != "" else None
+            if len(parts) >= 3 and parts[2] != "": fps_in  = float(parts[2])
+            if len(parts) >= 4 and parts[3] != "": fps_out = float(parts[3])
+            if len(parts) >= 5 and parts[4] != "": W       = int(parts[4])
+            if len(parts) >= 6 and parts[5] != "": H       = int(parts[5])
+            if len(parts) >= 7 and parts[6] != "": job.perf = json.loads(parts[6])
+    except Exception:
+        pass
 
-def _worker(job: Job):
+    if avg_fps:
+        metrics.JOB_FPS.observe(avg_fps, api="jobs")
+    job.output_name = out.name
+    job.etapa="finalizando"; job.progresso=0.9; job.updated_at=datetime.utcnow()
+    if not web_ready:
+        time.sleep(0.1)
+        ensure_web_mp4(str(out))
+    job.status="completed"; job.message=""; job.progresso=1.0; job.etapa="concluído"; job.updated_at=datetime.utcnow()
+
+def _run_job(job: Job, threads: int | None = None):
     try:
         job.status="processing"; job.etapa="iniciando"; job.progresso=0.05; job.updated_at=datetime.utcnow()
+        _save(job)
 
         src = (UPLOAD_DIR / job.input_name).resolve()
         if not src.exists():
@@ -293,14 +530,27 @@ def _worker(job: Job):
 
         out = (OUTPUT_DIR / _out_name(job.input_name, job.fps_alvo)).resolve()
 
-        job.etapa="interpolando"; job.progresso=0.3; job.updated_at=datetime.utcnow()
+        _get_model(job.precision)   # calibra o int8 aqui, uma vez, e não em cada subprocesso
+        job.etapa="interpolando"; job.updated_at=datetime.utcnow()
+        progress = SharedProgress()
 
-        # dispara em subprocesso
+        # dispara em subprocesso; com ffmpeg o arquivo já sai web-safe (H.264 + áudio)
+        web_ready = ffmpeg_available()
         p = mp.Process(
             target=_interpolate_task,
-            args=(str(src), str(out), int(job.multi or 1), int(job.fps_alvo) if job.fps_alvo else None, float(job.downscale or 1.0))
+            args=(str(src), str(out), int(job.multi or 1), int(job.fps_alvo) if job.fps_alvo else None, float(job.downscale or 1.0),
+                  int(job.batch_size) if job.batch_size else None,
+                  "ffmpeg" if web_ready else "cv2",
+                  str(src) if job.manter_audio else None,
+                  job.reader,
+                  int(job.segments) if job.segments is not None else None,
+                  threads, progress, bool(job.stream),
+                  _threshold(job.scene_threshold, SCENE_CUT_THRESHOLD),
+                  _threshold(job.static_threshold, STATIC_THRESHOLD),
+                  job.precision)
         )
-        p.daemon = True
+        # processo daemon não pode ter filhos: o modo segmentado cria um por trecho
+        p.daemon = job.segments is None or int(job.segments) == 1
         p.start()
         _PROCS[job.id] = p
 
@@ -315,6 +565,7 @@ def _worker(job: Job):
                 p.join(timeout=1)
                 try:
                     out.unlink(missing_ok=True)
+                    Path(live_path(out)).unlink(missing_ok=True)
                 except Exception:
                     pass
                 try:
@@ -324,36 +575,16 @@ def _worker(job: Job):
                 job.status="canceled"; job.etapa="cancelado"; job.updated_at=datetime.utcnow()
                 _PROCS.pop(job.id, None)
                 return
+            _set_progress(job, progress.snapshot())
             time.sleep(0.25)
 
         # terminou normal
         _PROCS.pop(job.id, None)
+        _set_progress(job, progress.snapshot())
         if p.exitcode != 0:
             raise RuntimeError("processo de interpolação terminou com erro")
 
-        # lê sidecar (retrocompatível: aceita 2 a 6 campos)
-        meta_path = str(out) + ".meta"
-        avg_fps = None; frames = None
-        fps_in = None; fps_out = None; W = None; H = None
-        try:
-            with open(meta_path, "r", encoding="utf-8") as f:
-                txt = f.read().strip()
-                parts = txt.split("|")
-                if len(parts) >= 2:
-                    avg_fps = float(parts[0]) if parts[0] != "" else None
-                    frames  = int(parts[1])   if parts[1] != "" else None
-                if len(parts) >= 3 and parts[2] != "": fps_in  = float(parts[2])
-                if len(parts) >= 4 and parts[3] != "": fps_out = float(parts[3])
-                if len(parts) >= 5 and parts[4] != "": W       = int(parts[4])
-                if len(parts) >= 6 and parts[5] != "": H       = int(parts[5])
-        except Exception:
-            pass
-
-        job.output_name = out.name
-        job.etapa="finalizando"; job.progresso=0.9; job.updated_at=datetime.utcnow()
-        time.sleep(0.1)
-        ensure_web_mp4(str(out))
-        job.status="completed"; job.message=""; job.progresso=1.0; job.etapa="concluído"; job.updated_at=datetime.utcnow()
+        _finish_output(job, out, web_ready)
     except Exception as e:
         if job.status != "canceled":
             job.status="failed"; job.message=str(e); job.updated_at=datetime.utcnow()
@@ -361,13 +592,94 @@ def _worker(job: Job):
         # limpeza do upload (privacidade) – mantém só o resultado
         try:
             (UPLOAD_DIR / job.input_name).unlink(missing_ok=True)
+            _live_file(job).unlink(missing_ok=True)
         except Exception:
             pass
 
+def _apply_spool_result(job: Job, res: Dict):
+    """Aplica o resultado publicado por um worker.py."""
+    try:
+        if res["status"] == "completed":
+            out = (OUTPUT_DIR / _out_name(job.input_name, job.fps_alvo)).resolve()
+            _finish_output(job, out, bool(res.get("web_ready")))
+        elif job.status != "canceled":
+            job.status = res["status"]; job.message = res.get("error") or ""
+            job.etapa = "cancelado" if job.status == "canceled" else job.etapa
+            job.updated_at = datetime.utcnow()
+    except Exception as e:
+        job.status="failed"; job.message=str(e); job.updated_at=datetime.utcnow()
+    finally:
+        (UPLOAD_DIR / job.input_name).unlink(missing_ok=True)
+        _live_file(job).unlink(missing_ok=True)
+
+def _spool_poll():
+    """Acompanha os jobs do spool: lease tomado -> processing; resultado -> estado final."""
+    while True:
+        time.sleep(SPOOL_POLL_SECONDS)
+        try:
+            SPOOL.requeue_expired()
+            with _LOCK:
+                live = list(_JOBS.values())
+            for job in live:
+                if job.status == "queued" and SPOOL.state(job.id) == "leased":
+                    job.status="processing"; job.etapa="interpolando"; job.progresso=0.05
+                    job.updated_at=datetime.utcnow()
+                    _save(job)
+                elif job.status == "processing":
+                    _set_progress(job, SPOOL.progress(job.id))
+            for jid, res in SPOOL.pop_results():
+                job = _get(jid)
+                if job is None:
+                    continue
+                if job.status in ("queued", "processing"):
+                    _apply_spool_result(job, res)
+                    _save(job)
+                metrics.JOBS_FINISHED.inc(api="jobs", status=job.status)
+                metrics.JOB_LATENCY.observe((datetime.utcnow() - job.created_at).total_seconds(), api="jobs")
+        except Exception as e:
+            print("spool: falha ao acompanhar jobs:", e)
+
 def _require_token(job: Job, token: Optional[str]):
     if not token or token != job.token:
         abort(403, description="token inválido")
 
+def _warm_graphs():
+    """Compila os grafos (model.graph) dos shapes dos presets antes do primeiro job."""
+    by_precision = {}
+    for p in PRESETS.values():
+        by_precision.setdefault(p.get("precision", "fp32"), []).append(p)
+    for precision, presets in by_precision.items():
+        try:
+            _get_model(precision).warmup(preset_shapes(presets))
+        except Exception as e:
+            print(f"grafos {precision}: aquecimento falhou:", e)
+
+_started = False
+_start_lock = threading.Lock()
+
+def start_background():
+    """Recupera os jobs do STORE e sobe as threads de manutenção — uma vez por processo.
+
+    Chamado pela inicialização do servidor (main.create_app / __main__), nunca no import:
+    com o reloader do debug o módulo é importado no pai e no filho.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    _recover_jobs()
+    threading.Thread(target=_sweep, daemon=True).start()
+    if GRAPH_BACKEND != "eager":
+        threading.Thread(target=_warm_graphs, daemon=True).start()
+    if SPOOL is not None:
+        threading.Thread(target=_spool_poll, daemon=True).start()
+
+@jobs_bp.before_app_request
+def _ensure_started():
+    # rede de segurança para quem registra o blueprint sem passar pela fábrica
+    start_background()
+
 # ========= ENDPOINTS =========
 @jobs_bp.post("/jobs")  # RF-07 + RF-06
 def create_job():
@@ -385,19 +697,52 @@ def create_job():
     # aplica preset
     preset_key = data.get("preset")
     params = PRESETS.get(preset_key, {}).copy() if preset_key else {}
-    for k in ["multi","fps_alvo","downscale","manter_audio"]:
+    for k in ["multi","fps_alvo","downscale","manter_audio","batch_size","reader","segments","stream","scene_threshold","static_threshold","precision"]:
         if k in data and data[k] is not None:
             params[k] = data[k]
+    if params.get("reader", "cv2") not in READERS:
+        return _err(400, f"reader deve ser um de {list(READERS)}")
+    if params.get("segments") is not None:
+        try:
+            params["segments"] = int(params["segments"])
+            if params["segments"] < 0: raise ValueError()
+        except (TypeError, ValueError):
+            return _err(400, "segments deve ser inteiro >= 0 (0 = automático)")
+    for k in ("scene_threshold", "static_threshold"):
+        if params.get(k) is not None:
+            try:
+                params[k] = float(params[k])
+                if not 0 <= params[k] <= 1: raise ValueError()
+            except (TypeError, ValueError):
+                return _err(400, f"{k} deve estar entre 0 e 1 (0 = desligado)")
+    if params.get("precision", "fp32") not in PRECISIONS:
+        return _err(400, f"precision deve ser um de {list(PRECISIONS)}")
+    if params.get("stream") and params.get("segments") not in (None, 1):
+        return _err(400, "stream não combina com segments (os trechos só são emendados no fim)")
 
     job = Job(
         id=jid, token=token, input_name=input_name,
         preset=preset_key,
         multi=params.get("multi"), fps_alvo=params.get("fps_alvo"),
         downscale=params.get("downscale"), manter_audio=bool(params.get("manter_audio", True)),
+        batch_size=params.get("batch_size"), reader=params.get("reader", "cv2"),
+        segments=params.get("segments"),
+        stream=bool(params.get("stream", False)),
+        scene_threshold=params.get("scene_threshold"),
+        static_threshold=params.get("static_threshold"),
+        precision=params.get("precision", "fp32"),
         ttl_seconds=int(data.get("ttl_seconds") or TTL_SECONDS),
     )
     _put(job)
-    threading.Thread(target=_worker, args=(job,), daemon=True).start()
+    try:
+        _submit(job)
+    except Overloaded as e:
+        with _LOCK: _JOBS.pop(job.id, None)
+        STORE.delete("jobs", job.id)
+        r = _err(429, str(e), {"retry_after_s": int(e.retry_after) + 1})
+        r.headers["Retry-After"] = str(int(e.retry_after) + 1)
+        return r
+    metrics.JOBS_SUBMITTED.inc(api="jobs")
     return _ok(job.to_public()), 202
 
 @jobs_bp.get("/jobs/<id>")  # RF-08
@@ -408,6 +753,86 @@ def get_job(id: str):
     _require_token(job, token)
     return _ok(job.to_public())
 
+@jobs_bp.get("/jobs/<id>/events")
+def job_events(id: str):
+    """Server-Sent Events: o job (como em GET /jobs/<id>) a cada mudança, até encerrar."""
+    job = _get(id)
+    if not job: return _err(404, "job não encontrado")
+    token = request.args.get("token") or request.headers.get("X-Job-Token")
+    _require_token(job, token)
+
+    def stream():
+        last = None
+        while True:
+            with _CHANGED:
+                seen = _VERSION
+            job = _get(id)
+            if job is None:
+                return
+            data = json.dumps(job.to_public(), default=str)
+            if data != last:
+                yield f"data: {data}\n\n"
+                last = data
+            if job.status not in ("queued", "processing"):
+                return
+            with _CHANGED:
+                woke = _CHANGED.wait_for(lambda: _VERSION != seen, timeout=SSE_KEEPALIVE_SECONDS)
+            if not woke:
+                yield ": keepalive\n\n"
+
+    resp = Response(stream_with_context(stream()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"   # nginx: não segurar o stream
+    return resp
+
+@jobs_bp.get("/jobs/<id>/live")
+def get_live(id: str):
+    """
+    MP4 fragmentado do job em andamento (stream=true), servido enquanto
+    cresce: a resposta só termina quando o job encerra. Depois disso o
+    resultado final fica em /result.
+    """
+    job = _get(id)
+    if not job: return _err(404, "job não encontrado")
+    token = request.args.get("token") or request.headers.get("X-Job-Token")
+    _require_token(job, token)
+    if not job.stream:
+        return _err(400, "job criado sem stream")
+    if job.status not in ("queued", "processing"):
+        return _err(404, "job encerrado; use /result")
+
+    path = _live_file(job)
+    t0 = time.time()
+    while True:
+        try:
+            f = open(path, "rb")   # aberto aqui: o remux final pode apagar o arquivo
+            break
+        except FileNotFoundError:
+            job = _get(id)
+            if job is None or job.status not in ("queued", "processing") or time.time() - t0 > LIVE_WAIT_SECONDS:
+                return _err(404, "stream ainda indisponível")
+            time.sleep(0.25)
+
+    def stream():
+        with f:
+            while True:
+                chunk = f.read(LIVE_CHUNK)
+                if chunk:
+                    yield chunk
+                    continue
+                job = _get(id)
+                if job is None or job.status not in ("queued", "processing"):
+                    rest = f.read()
+                    if rest:
+                        yield rest
+                    return
+                time.sleep(0.25)
+
+    resp = Response(stream(), mimetype="video/mp4", direct_passthrough=True)
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
 @jobs_bp.post("/jobs/<id>/cancel")  # RF-09
 def cancel_job(id: str):
     job = _get(id)
@@ -419,6 +844,13 @@ def cancel_job(id: str):
     job.status = "canceled"
     job.etapa  = "cancelado"
     job.updated_at = datetime.utcnow()
+    _save(job)
+    if SPOOL is not None:
+        # na fila do spool sai na hora; com worker, ele vê o pedido em até 1s e para
+        if SPOOL.cancel(job.id) == "canceled":
+            metrics.JOBS_FINISHED.inc(api="jobs", status="canceled")
+    else:
+        SCHEDULER.cancel(job.id)   # tira da fila se ainda não começou
 
     # se houver subprocesso, mata na hora
     p = _PROCS.pop(job.id, None)
@@ -431,6 +863,7 @@ def cancel_job(id: str):
     # limpeza de artefatos parciais
     try:
         (OUTPUT_DIR / _out_name(job.input_name, job.fps_alvo)).unlink(missing_ok=True)
+        _live_file(job).unlink(missing_ok=True)
     except Exception:
         pass
     try:
@@ -491,7 +924,7 @@ def get_result(id: str):
         meta_path = str(path) + ".meta"
         if os.path.exists(meta_path):
             with open(meta_path, "r", encoding="utf-8") as f2:
-                parts = f2.read().strip().split("|")
+                parts = f2.read().strip().split("|", 6)
             if len(parts) >= 1 and parts[0]:
                 resp.headers["X-Avg-FPS"]   = f"{float(parts[0]):.2f}"
             if len(parts) >= 2 and parts[1]:
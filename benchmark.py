@@ -0,0 +1,434 @@
+# benchmark.py
+"""
+Benchmark reprodutível do pipeline de interpolação.
+
+Gera vídeos sintéticos (formas em movimento sobre textura em pan) em
+480p/720p/1080p/4K, roda `interpolate_video` para cada combinação de
+resolução x multi x down e os kernels isolados (FlowNet.inference, warp,
+decodificadores), e grava um JSON comparável entre commits.
+
+Uso:
+    python benchmark.py --res 480p,720p --multi 1,2 --down 0.5,1.0
+    python benchmark.py --update-ref              # salva as saídas como referência
+    python benchmark.py --compare bench_old.json  # falha se houver regressão
+    python benchmark.py --int8                    # também roda o FlowNet int8
+    python benchmark.py --bf16                    # também roda channels_last + bfloat16
+    python benchmark.py --graph script            # também roda com grafos (model.graph)
+
+Cada caso roda num processo novo (spawn) para que o pico de RSS seja só dele.
+O PSNR compara a saída de cada caso com a referência salva (--ref-dir) do
+mesmo caso, quando existir. Com --int8 cada caso roda também com o modelo
+quantizado (model.quantized): o JSON traz speedup_vs_default e o PSNR/SSIM
+contra a saída fp32 do mesmo caso (quality_vs_default), e os kernels trazem
+inference_int8_ms. --bf16 faz o mesmo com a precisão "bf16" (quadros em
+channels_last e encoder sob autocast bfloat16; meta.bf16_supported diz se
+esta CPU roda bf16 de fato ou só channels_last fp32). Os kernels também conferem FlowNet.inference_to_size
+contra inference + resize bilinear (to_size_*_err, tolerância
+TO_SIZE_TOLERANCE; acima dela, ou se algum kernel ou caso levantar exceção,
+o benchmark sai com código 1; a varredura de tamanhos está em
+tests/test_resample.py). --graph faz o mesmo com o FlowNet em grafo por shape
+(model.graph), cujo cache de disco vai em <work>/graphs.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+RESOLUTIONS = {
+    "480p":  (854, 480),
+    "720p":  (1280, 720),
+    "1080p": (1920, 1080),
+    "4k":    (3840, 2160),
+}
+MULTIS = (1, 2, 3, 4)            # = main.ALLOWED_MULTIS
+DOWNS = (0.25, 0.5, 0.75, 1.0)   # MIN_DOWN..MAX_DOWN de main.py
+WEIGHTS = "best_model.pth"
+TO_SIZE_TOLERANCE = 1e-3   # maior diferença aceita entre inference_to_size e inference + resize
+DEFAULT_WORK = Path(tempfile.gettempdir()) / "duplicaja_bench"
+
+
+# ============================ vídeos sintéticos ============================
+def make_synthetic_video(path, W, H, frames=24, fps=24.0, seed=0):
+    """Textura suave em pan horizontal + círculos/retângulos em movimento."""
+    rng = np.random.default_rng(seed)
+    tex_h, tex_w = H, W + 8 * frames
+    noise = rng.random((tex_h // 8 + 1, tex_w // 8 + 1, 3), dtype=np.float32)
+    tex = cv2.resize(noise, (tex_w, tex_h), interpolation=cv2.INTER_CUBIC)
+    tex = np.clip(tex * 255, 0, 255).astype(np.uint8)
+
+    shapes = []
+    for _ in range(6):
+        shapes.append({
+            "pos": rng.uniform((0, 0), (W, H)),
+            "vel": rng.uniform((-W / 60, -H / 60), (W / 60, H / 60)),
+            "r": int(rng.uniform(0.03, 0.08) * min(W, H)),
+            "color": tuple(int(c) for c in rng.integers(0, 255, 3)),
+            "rect": bool(rng.integers(0, 2)),
+        })
+
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (W, H))
+    try:
+        for i in range(frames):
+            frame = tex[:, 8 * i:8 * i + W].copy()
+            for s in shapes:
+                x, y = (s["pos"] + s["vel"] * i).astype(int)
+                x, y = x % W, y % H
+                if s["rect"]:
+                    cv2.rectangle(frame, (x - s["r"], y - s["r"]), (x + s["r"], y + s["r"]), s["color"], -1)
+                else:
+                    cv2.circle(frame, (x, y), s["r"], s["color"], -1)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+def synthetic_video(work, res, frames):
+    W, H = RESOLUTIONS[res]
+    path = Path(work) / "inputs" / f"synth_{res}_{frames}f.mp4"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        make_synthetic_video(path, W, H, frames=frames)
+    return path
+
+
+# ============================ qualidade ============================
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return float("inf") if mse == 0 else 10 * math.log10(255.0 ** 2 / mse)
+
+def ssim(a, b):
+    """SSIM médio (janela gaussiana 11x11, σ=1.5) sobre a luminância."""
+    x = cv2.cvtColor(a, cv2.COLOR_RGB2GRAY).astype(np.float64)
+    y = cv2.cvtColor(b, cv2.COLOR_RGB2GRAY).astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    blur = lambda z: cv2.GaussianBlur(z, (11, 11), 1.5)
+    mx, my = blur(x), blur(y)
+    vx, vy, cxy = blur(x * x) - mx * mx, blur(y * y) - my * my, blur(x * y) - mx * my
+    m = ((2 * mx * my + c1) * (2 * cxy + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return float(m.mean())
+
+def compare_videos(path, ref_path):
+    """PSNR médio/mínimo e SSIM médio quadro a quadro entre dois vídeos."""
+    a, b = cv2.VideoCapture(str(path)), cv2.VideoCapture(str(ref_path))
+    ps, ss = [], []
+    try:
+        while True:
+            ra, fa = a.read()
+            rb, fb = b.read()
+            if not (ra and rb):
+                break
+            ps.append(psnr(fa, fb))
+            ss.append(ssim(fa[:, :, ::-1], fb[:, :, ::-1]))
+    finally:
+        a.release(); b.release()
+    if not ps:
+        return None
+    # quadros idênticos têm PSNR infinito: fora da média; None = tudo idêntico
+    finite = [p for p in ps if math.isfinite(p)]
+    return {
+        "frames": len(ps),
+        "identical_frames": len(ps) - len(finite),
+        "psnr_mean": round(sum(finite) / len(finite), 3) if finite else None,
+        "psnr_min": round(min(finite), 3) if finite else None,
+        "ssim_mean": round(sum(ss) / len(ss), 5),
+    }
+
+
+# ============================ execução ============================
+def _load_model(weights, precision="fp32", graph="eager"):
+    from model.quantized import load_flownet
+    return load_flownet(weights, precision, graph=graph)
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0   # KiB no Linux
+
+def _run_case(case, weights, results):
+    """Roda num processo novo; devolve métricas por `results` (mp.Queue)."""
+    try:
+        import torch
+        from model.util import interpolate_video
+        if case.get("threads"):
+            torch.set_num_threads(case["threads"])
+        options = dict(case.get("options", {}))
+        model = _load_model(weights, options.pop("precision", "fp32"), options.pop("graph", "eager"))
+        stats = {}
+        t = time.perf_counter()
+        avg_fps, frames, fps_in, fps_out, W, H = interpolate_video(
+            in_path=case["input"], out_path=case["output"],
+            multi=case["multi"], down=case["down"],
+            model=model, device=torch.device("cpu"),
+            writer="cv2", stats=stats, **options
+        )
+        wall = time.perf_counter() - t
+        results.put({
+            "avg_fps": round(avg_fps, 3), "frames": frames, "wall_s": round(wall, 3),
+            "peak_rss_mb": round(_peak_rss_mb(), 1), "stages": stats.get("stages", {}),
+            "queues": stats.get("queues", {}), "pool": stats.get("pool", {}),
+        })
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+def run_case(case, weights):
+    ctx = mp.get_context("spawn")
+    q = ctx.Queue()
+    p = ctx.Process(target=_run_case, args=(case, weights, q))
+    p.start()
+    out = q.get()
+    p.join()
+    return out
+
+def _to_size_check(model, x0, x1, H, W, timeit):
+    """inference + resize bilinear (caminho antigo) vs inference_to_size: tempo e maior diferença."""
+    import torch.nn.functional as F
+    scale = H / float(x0.shape[-2])
+
+    def chained():
+        flow, mask = model.inference(x0, x1)
+        return (F.interpolate(flow, size=(H, W), mode="bilinear", align_corners=True) * scale,
+                F.interpolate(mask, size=(H, W), mode="bilinear", align_corners=True))
+
+    (f0, m0), (f1, m1) = chained(), model.inference_to_size(x0, x1, H, W, scale=scale)
+    return {"chained_ms": round(timeit(chained), 3),
+            "to_size_ms": round(timeit(lambda: model.inference_to_size(x0, x1, H, W, scale=scale)), 3),
+            "to_size_flow_err": float((f0 - f1).abs().max()), "to_size_mask_err": float((m0 - m1).abs().max())}
+
+def _kernel_case(res, down, iters, weights, precisions, results):
+    try:
+        import torch
+        from model.util import warp
+        models = {p: _load_model(weights, p) for p in precisions}
+        W, H = RESOLUTIONS[res]
+        h, w = int(H * down), int(W * down)
+        x0, x1 = torch.rand(1, 3, h, w), torch.rand(1, 3, h, w)
+        img, flow = torch.rand(1, 3, H, W), torch.randn(1, 2, H, W) * 4
+
+        def timeit(fn):
+            fn()  # aquecimento
+            t = time.perf_counter()
+            for _ in range(iters):
+                fn()
+            return (time.perf_counter() - t) / iters * 1000.0
+
+        out = {}
+        with torch.inference_mode():
+            for p, model in models.items():
+                key = "inference_ms" if p == "fp32" else f"inference_{p}_ms"
+                out[key] = round(timeit(lambda: model.inference(x0, x1)), 3)
+            out["warp_ms"] = round(timeit(lambda: warp(img, flow)), 3)
+            if hasattr(models["fp32"], "inference_to_size"):
+                out.update(_to_size_check(models["fp32"], x0, x1, H, W, timeit))
+        out["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+        results.put(out)
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+def run_kernels(res, down, iters, weights, precisions=("fp32",)):
+    ctx = mp.get_context("spawn")
+    q = ctx.Queue()
+    p = ctx.Process(target=_kernel_case, args=(res, down, iters, weights, tuple(precisions), q))
+    p.start()
+    out = q.get()
+    p.join()
+    return out
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except Exception:
+        return None
+
+def case_id(res, multi, down, variant="default"):
+    return f"{res}_x{multi}_d{down:g}_{variant}"
+
+
+def run_benchmark(resolutions, multis, downs, frames=24, work=DEFAULT_WORK, weights=WEIGHTS,
+                  kernel_iters=5, variants=None, ref_dir=None, update_ref=False, threads=None, log=print):
+    """
+    variants: {nome: kwargs extras de interpolate_video}; "default" ({}) sempre roda.
+    Variantes diferentes de "default" também são comparadas com a saída
+    "default" do mesmo caso nesta execução (ex.: precisão reduzida vs fp32),
+    em qualidade e em fps. A chave "precision" de uma variante escolhe o
+    modelo (model.quantized) e "graph" o backend de model.graph, em vez de
+    irem para interpolate_video.
+    """
+    from model.video_io import ffmpeg_available, measure_decode_fps
+
+    work = Path(work); (work / "outputs").mkdir(parents=True, exist_ok=True)
+    ref_dir = Path(ref_dir) if ref_dir else work / "ref"
+    variants = {"default": {}, **(variants or {})}
+    precisions = ["fp32"] + sorted({v["precision"] for v in variants.values()
+                                    if v.get("precision", "fp32") != "fp32"})
+
+    report = {
+        "meta": {
+            "git": _git_rev(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "machine": platform.machine(),
+            "cpu_count": os.cpu_count(), "frames": frames, "threads": threads,
+        },
+        "cases": [], "kernels": [], "decoders": [],
+    }
+    try:
+        import torch
+        from model.quantized import bf16_supported
+        report["meta"]["torch"] = torch.__version__
+        report["meta"]["bf16_supported"] = bf16_supported()
+    except Exception:
+        pass
+
+    for res in resolutions:
+        src = synthetic_video(work, res, frames)
+        backends = ["cv2"] + (["ffmpeg"] if ffmpeg_available() else [])
+        report["decoders"].append({"res": res, **{b: round(measure_decode_fps(src, b), 2) for b in backends}})
+        log(f"[{res}] decode fps: {report['decoders'][-1]}")
+
+        for down in downs:
+            k = run_kernels(res, down, kernel_iters, weights, precisions)
+            report["kernels"].append({"res": res, "down": down, **k})
+            log(f"[{res} d{down:g}] kernels: {k}")
+
+            for multi in multis:
+                base_fps = None
+                for vname, opts in variants.items():
+                    cid = case_id(res, multi, down, vname)
+                    out = work / "outputs" / f"{cid}.mp4"
+                    case = {"input": str(src), "output": str(out), "multi": multi, "down": down,
+                            "options": opts, "threads": threads}
+                    r = run_case(case, weights)
+                    entry = {"id": cid, "res": res, "multi": multi, "down": down, "variant": vname, **r}
+
+                    ref = ref_dir / f"{cid}.mp4"
+                    if "error" not in r and ref.exists():
+                        entry["quality_vs_ref"] = compare_videos(out, ref)
+                    if "error" not in r and vname == "default":
+                        base_fps = r["avg_fps"]
+                    if "error" not in r and vname != "default":
+                        base = work / "outputs" / f"{case_id(res, multi, down)}.mp4"
+                        if base.exists():
+                            entry["quality_vs_default"] = compare_videos(out, base)
+                        if base_fps:
+                            entry["speedup_vs_default"] = round(r["avg_fps"] / base_fps, 3)
+                    if update_ref and "error" not in r:
+                        ref_dir.mkdir(parents=True, exist_ok=True)
+                        shutil.copyfile(out, ref)
+
+                    report["cases"].append(entry)
+                    log(f"[{cid}] fps={r.get('avg_fps')} rss={r.get('peak_rss_mb')}MB "
+                        f"{entry.get('quality_vs_ref') or ''}{r.get('error') or ''}"
+                        + (f" x{entry['speedup_vs_default']} vs default {entry.get('quality_vs_default')}"
+                           if "speedup_vs_default" in entry else ""))
+    return report
+
+
+# ============================ comparação ============================
+def equivalence_problems(report, tolerance=TO_SIZE_TOLERANCE):
+    """
+    Kernels em que inference_to_size se afastou do caminho inference + resize,
+    e kernels ou casos que falharam (uma exceção também é um problema). A
+    varredura de tamanhos fica em tests/test_resample.py; aqui só os do benchmark.
+    """
+    problems = []
+    for c in report.get("cases", []):
+        if c.get("error"):
+            problems.append(f"{c['id']}: {c['error']}")
+    for k in report.get("kernels", []):
+        if k.get("error"):
+            problems.append(f"kernels {k['res']} d{k['down']:g}: {k['error']}")
+        for key in ("to_size_flow_err", "to_size_mask_err"):
+            if k.get(key, 0.0) > tolerance:
+                problems.append(f"{k['res']} d{k['down']:g}: {key} = {k[key]:.2e}")
+    return problems
+
+def compare_reports(new, old, tolerance=0.10, psnr_drop=0.5):
+    """Lista regressões: fps caiu mais que `tolerance` ou PSNR caiu mais que `psnr_drop` dB."""
+    old_cases = {c["id"]: c for c in old.get("cases", [])}
+    problems = []
+    for c in new.get("cases", []):
+        o = old_cases.get(c["id"])
+        if not o or "avg_fps" not in c or "avg_fps" not in o:
+            continue
+        if o["avg_fps"] and c["avg_fps"] < o["avg_fps"] * (1 - tolerance):
+            problems.append(f"{c['id']}: fps {o['avg_fps']} -> {c['avg_fps']}")
+        q_new, q_old = c.get("quality_vs_ref"), o.get("quality_vs_ref")
+        if q_new and q_old and q_old["psnr_mean"] is not None and \
+                (q_new["psnr_mean"] or float("inf")) < q_old["psnr_mean"] - psnr_drop:
+            problems.append(f"{c['id']}: psnr {q_old['psnr_mean']} -> {q_new['psnr_mean']}")
+    return problems
+
+
+def _csv(arg, cast=str):
+    return [cast(x) for x in arg.split(",") if x.strip()]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark do DuplicaJa (vídeos sintéticos).")
+    ap.add_argument("--res", default=",".join(RESOLUTIONS), help="ex.: 480p,720p,1080p,4k")
+    ap.add_argument("--multi", default=",".join(map(str, MULTIS)))
+    ap.add_argument("--down", default=",".join(f"{d:g}" for d in DOWNS))
+    ap.add_argument("--frames", type=int, default=24)
+    ap.add_argument("--threads", type=int, default=None, help="torch.set_num_threads em cada caso")
+    ap.add_argument("--kernel-iters", type=int, default=5)
+    ap.add_argument("--work", default=str(DEFAULT_WORK))
+    ap.add_argument("--weights", default=WEIGHTS)
+    ap.add_argument("--ref-dir", default=None, help="saídas de referência (padrão: <work>/ref)")
+    ap.add_argument("--update-ref", action="store_true", help="salva as saídas desta execução como referência")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", default=None, help="JSON anterior; sai com código 1 se houver regressão")
+    ap.add_argument("--tolerance", type=float, default=0.10)
+    ap.add_argument("--int8", action="store_true", help="roda cada caso também com o FlowNet int8 (model.quantized)")
+    ap.add_argument("--bf16", action="store_true",
+                    help="roda cada caso também em channels_last + bfloat16 (precisão \"bf16\" de model.quantized)")
+    ap.add_argument("--graph", default=None, choices=("script", "compile"),
+                    help="roda cada caso também com o FlowNet em grafo (model.graph)")
+    args = ap.parse_args(argv)
+
+    for r in _csv(args.res):
+        if r not in RESOLUTIONS:
+            ap.error(f"resolução desconhecida: {r} (use {', '.join(RESOLUTIONS)})")
+
+    variants = {}
+    if args.int8:
+        variants["int8"] = {"precision": "int8"}
+    if args.bf16:
+        variants["bf16"] = {"precision": "bf16"}
+    if args.graph:
+        os.environ.setdefault("DUPLICAJA_GRAPH_CACHE", str(Path(args.work) / "graphs"))
+        variants[f"graph_{args.graph}"] = {"graph": args.graph}
+    report = run_benchmark(
+        _csv(args.res), _csv(args.multi, int), _csv(args.down, float),
+        frames=args.frames, work=args.work, weights=args.weights, kernel_iters=args.kernel_iters,
+        ref_dir=args.ref_dir, update_ref=args.update_ref, threads=args.threads,
+        variants=variants,
+    )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"resultados em {args.out}")
+    mismatches = equivalence_problems(report)
+    for p in mismatches:
+        print("EQUIVALÊNCIA:", p)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        problems = compare_reports(report, old, tolerance=args.tolerance)
+        for p in problems:
+            print("REGRESSÃO:", p)
+        return 1 if problems or mismatches else 0
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
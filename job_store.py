@@ -0,0 +1,101 @@
+# job_store.py
+"""
+Store persistente dos jobs das duas APIs (SQLite, sem dependências).
+Uma tabela `jobs` com chave (api, id); status e expiração são colunas
+indexadas, o resto do job vai como JSON em `data`. Contagens, varreduras
+por TTL e consultas por status viram queries indexadas, então o custo não
+cresce com o histórico.
+
+Cada API converte seu próprio Job de/para dict; aqui só se guarda.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DB_PATH = os.environ.get("DUPLICAJA_DB", "jobs.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    api        TEXT NOT NULL,
+    id         TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    expires_at REAL,
+    data       TEXT NOT NULL,
+    PRIMARY KEY (api, id)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status  ON jobs (api, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_expires ON jobs (expires_at) WHERE expires_at IS NOT NULL;
+"""
+
+
+class JobStore:
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        # uma conexão compartilhada (serializada pelo lock); WAL deixa leituras
+        # de outros processos (ex.: workers) rodarem durante as escritas
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def save(self, api: str, id: str, status: str, data: Dict,
+             created_at: float, updated_at: float, expires_at: Optional[float] = None):
+        """Insere ou substitui o job inteiro."""
+        row = (api, id, status, created_at, updated_at, expires_at, json.dumps(data, default=str))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (api, id, status, created_at, updated_at, expires_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+
+    def load(self, api: str, id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE api = ? AND id = ?", (api, id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def exists(self, api: str, id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM jobs WHERE api = ? AND id = ?", (api, id)).fetchone() is not None
+
+    def delete(self, api: str, id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE api = ? AND id = ?", (api, id))
+
+    def count(self, api: str, statuses: Iterable[str]) -> int:
+        statuses = list(statuses)
+        q = f"SELECT COUNT(*) FROM jobs WHERE api = ? AND status IN ({','.join('?' * len(statuses))})"
+        with self._lock:
+            return self._conn.execute(q, (api, *statuses)).fetchone()[0]
+
+    def counts_by_status(self, api: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE api = ? GROUP BY status", (api,)).fetchall()
+        return dict(rows)
+
+    def with_status(self, api: str, statuses: Iterable[str]) -> List[Dict]:
+        """Jobs nos status dados, do mais antigo para o mais novo."""
+        statuses = list(statuses)
+        q = (f"SELECT data FROM jobs WHERE api = ? AND status IN ({','.join('?' * len(statuses))}) "
+             "ORDER BY created_at")
+        with self._lock:
+            rows = self._conn.execute(q, (api, *statuses)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def expired(self, api: str, now: float, limit: int = 500) -> List[Tuple[str, Dict]]:
+        """Até `limit` jobs com expires_at <= now (varredura pelo índice de expiração)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM jobs WHERE expires_at <= ? AND api = ? ORDER BY expires_at LIMIT ?",
+                (now, api, limit)).fetchall()
+        return [(r[0], json.loads(r[1])) for r in rows]
+
+
+STORE = JobStore()
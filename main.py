@@ -3,30 +3,36 @@ import time
 import uuid
 import tempfile
 import threading
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import Optional, Dict
-from concurrent.futures import ThreadPoolExecutor, Future
 import cv2, subprocess, shlex  # + novos
 
 import torch
-from flask import Flask, render_template, request, send_file, jsonify, abort, redirect, url_for
+from flask import Flask, Response, render_template, request, send_file, jsonify, abort, redirect, url_for
 from werkzeug.exceptions import RequestEntityTooLarge, HTTPException
+import api_jobs
 from api_jobs import jobs_bp
+import metrics
+from job_store import STORE
+from scheduler import MAX_WORKERS, SCHEDULER, Overloaded, Ticket, estimate_cost
 from pathlib import Path
 from werkzeug.utils import secure_filename
 
 
+from model.graph import wrap_graph
 from model.model import FlowNet
 from model.util import interpolate_video
+from model.video_io import READERS, count_frames, ffmpeg_available
+from model.queues import JOB_QUEUE_BUDGET, set_process_budget
 
 # ============================ Configuração básica ============================
-torch.backends.cudnn.benchmark = True
 device = torch.device("cpu")
 print(f"Usando: {device}")
 
 model = FlowNet(base=16).to(device)
 model.eval()
 model.load_state_dict(torch.load("best_model.pth", map_location=device))
+model = wrap_graph(model)   # DUPLICAJA_GRAPH (model.graph); os grafos em disco são os do api_jobs
 print("Modelo carregado")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -110,6 +116,10 @@ def index():
 def saude():
     return "Sistema ativo!"
 
+@app.get("/metrics")
+def metrics_route():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 # ------ Rota de upload (o front manda o arquivo aqui antes do /api/jobs) ------
 UPLOAD_DIR = Path("static/uploads"); UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -125,6 +135,7 @@ def upload():
     fname = secure_filename(f.filename or "video.mp4")
     savepath = (UPLOAD_DIR / fname).resolve()
     f.save(savepath)
+    metrics.UPLOAD_BYTES.inc(os.path.getsize(savepath), route="/upload")
     return jsonify({"filename": fname})
 
 # ============================ Suporte a /interpolate síncrono (RNF-05) ======
@@ -146,6 +157,10 @@ def interpolate_route():
         down  = float(request.form.get('down', 1) or 1)
         audio_opt = (request.form.get('audio', 'keep') or 'keep').lower()
         keep_audio = audio_opt in ('keep','manter','1','true','yes')
+        batch_size = int(request.form.get('batch_size', 0) or 0) or None
+        reader = (request.form.get('reader', 'cv2') or 'cv2').lower()
+        if reader not in READERS:
+            raise ValueError(f"reader deve ser um de {list(READERS)}")
     except Exception as e:
         return api_error(400, "invalid_params", f"Parâmetros inválidos: {e}")
 
@@ -154,6 +169,7 @@ def interpolate_route():
     tmp_in  = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4", dir=tmp_dir); tmp_in.close()
     tmp_out = tempfile.NamedTemporaryFile(delete=False, suffix=f"_x{multi}.mp4", dir=tmp_dir); tmp_out.close()
     f.save(tmp_in.name)
+    metrics.UPLOAD_BYTES.inc(os.path.getsize(tmp_in.name), route="/interpolate")
 
     # probe + validação de combinação (RF-15/16)
     fps_in, W, H = probe_video(tmp_in.name)
@@ -165,22 +181,58 @@ def interpolate_route():
             except Exception: pass
         return api_error(422, "invalid_combo", str(ve))
 
-    try:
-        avg_fps, frames, fps_in, fps_out, W, H = interpolate_video(
-            in_path=tmp_in.name, out_path=tmp_out.name,
-            multi=multi, fps_override=fps, down=down,
-            model=model, device=device
-        )
+    # a interpolação ocupa uma vaga do SCHEDULER como os jobs (RNF-02); a
+    # requisição só espera o resultado
+    result, finished = {}, threading.Event()
 
-        # RF-12: remux de áudio (opcional)
-        if keep_audio:
-            maybe_remux_audio(tmp_out.name, tmp_in.name)
+    def _work(t: Ticket):
+        metrics.WORKERS_BUSY.inc(api="web")
+        try:
+            # com ffmpeg, o H.264 e o áudio (RF-12) saem no mesmo passo
+            use_ffmpeg = ffmpeg_available()
+            result["out"] = interpolate_video(
+                in_path=tmp_in.name, out_path=tmp_out.name,
+                multi=multi, fps_override=fps, down=down,
+                model=model, device=device, cancel_event=t.cancel_event,
+                batch_size=batch_size, reader=reader,
+                writer="ffmpeg" if use_ffmpeg else "cv2",
+                audio_path=tmp_in.name if keep_audio else None
+            )
+            # RF-12: remux de áudio (opcional) — só no caminho sem ffmpeg
+            if keep_audio and not use_ffmpeg:
+                maybe_remux_audio(tmp_out.name, tmp_in.name)
+            return True
+        except Exception as e:
+            result["error"] = e
+            return False
+        finally:
+            metrics.WORKERS_BUSY.dec(api="web")
+            finished.set()
 
-    except Exception as e:
+    sync_id = f"sync-{uuid.uuid4().hex}"
+    try:
+        SCHEDULER.submit(sync_id, _work, api="web",
+                         on_cancel=lambda t: finished.set(),
+                         cost=estimate_cost(count_frames(tmp_in.name), W, H, multi, down))
+    except Overloaded as e:
+        for p in (tmp_in.name, tmp_out.name):
+            try: os.remove(p)
+            except Exception: pass
+        resp, status = api_error(429, "overloaded", str(e), {"retry_after_s": int(e.retry_after) + 1})
+        resp.headers["Retry-After"] = str(int(e.retry_after) + 1)
+        return resp, status
+    finished.wait()
+    # o ticket só vira "done" depois que _work retorna: o _janitor o descarta
+    with jobs_lock:
+        _ENDED.add(sync_id)
+
+    if "out" not in result:
         for p in (tmp_in.name, tmp_out.name):
             try: os.remove(p)
             except Exception: pass
-        return api_error(500, "inference_failed", f"Falha na inferência: {e}")
+        err = result.get("error", "cancelado")
+        return api_error(500, "inference_failed", f"Falha na inferência: {err}")
+    avg_fps, frames, fps_in, fps_out, W, H = result["out"]
 
     # limpa entrada SEMPRE
     try: os.remove(tmp_in.name)
@@ -207,12 +259,20 @@ def interpolate_route():
 
 
 # ============================ Arquitetura de Jobs (RNF-06 + RNF-02) =========
-MAX_WORKERS = 2              # RNF-02: processar 2 simultâneos
+# RNF-02: MAX_WORKERS (scheduler.py) jobs simultâneos, somando as duas APIs
 MAX_PENDING = 500            # RNF-06: fila suporta 50+ com folga
 RESULT_TTL_SEC = 24 * 3600   # boa prática (pode ajustar conforme US-011)
 
-executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+# filas de quadros limitadas em bytes: cada job tem seu orçamento e o processo soma os MAX_WORKERS
+set_process_budget(MAX_WORKERS * JOB_QUEUE_BUDGET)
+# os jobs daqui rodam neste processo e torch.set_num_threads vale para o processo
+# todo: a cota por job do escalonador (ticket.threads) não tem como ser aplicada
+# a um job só, então fixa uma vez a cota de todos (núcleos / MAX_WORKERS). O
+# api_jobs.py roda cada job num processo e aplica a cota por job
+torch.set_num_threads(SCHEDULER.threads_per_job)
 jobs_lock = threading.Lock()
+# jobs encerrados (e /interpolate atendidos) cujo ticket o _janitor ainda precisa descartar do SCHEDULER
+_ENDED: set = set()
 
 @dataclass
 class Job:
@@ -228,25 +288,69 @@ class Job:
     avg_fps: Optional[float] = None
     frames: Optional[int] = None
     error: Optional[str] = None
-    future: Optional[Future] = None
+    ticket: Optional[Ticket] = None
     
     fps_in: Optional[float] = None
     fps_out: Optional[float] = None
     width: Optional[int] = None
     height: Optional[int] = None
     keep_audio: bool = True
+    batch_size: Optional[int] = None
+    reader: str = "cv2"
+    perf: Optional[dict] = None   # tempo por etapa + filas/pool
         
     cancel_event: threading.Event = field(default_factory=threading.Event)
 
+# só os jobs vivos (na fila/rodando) ficam em memória; o histórico fica no STORE
 JOBS: Dict[str, Job] = {}
+_RUNTIME_FIELDS = ("ticket", "cancel_event")
+_STORED_FIELDS = [f.name for f in fields(Job) if f.name not in _RUNTIME_FIELDS]
+
+def _save(j: Job):
+    """Persiste o job (chamar com jobs_lock). Jobs encerrados saem da memória."""
+    # o resultado expira RESULT_TTL_SEC após a última atualização (varrido pelo _janitor)
+    expires = j.updated_at + RESULT_TTL_SEC if j.out_path and j.status == "completed" else None
+    STORE.save("web", j.id, j.status, {k: getattr(j, k) for k in _STORED_FIELDS},
+               j.created_at, j.updated_at, expires)
+    if j.status in ("queued", "processing"):
+        JOBS[j.id] = j
+    else:
+        JOBS.pop(j.id, None)
+        _ENDED.add(j.id)
+
+def _load_job(job_id: str) -> Optional[Job]:
+    with jobs_lock:
+        j = JOBS.get(job_id)
+    if j is not None:
+        return j
+    data = STORE.load("web", job_id)
+    return Job(**data) if data else None
 
 def _submit_job(job: Job):
-    def _runner(j: Job):
+    def _runner(j: Job, t: Ticket):
+        # threads: fixadas para o processo todo no início do módulo (ver set_num_threads acima)
+        metrics.WORKERS_BUSY.inc(api="web")
+        try:
+            _run(j)
+        finally:
+            metrics.WORKERS_BUSY.dec(api="web")
+            metrics.JOBS_FINISHED.inc(api="web", status=j.status)
+            metrics.JOB_LATENCY.observe(time.time() - j.created_at, api="web")
+            if j.status == "completed" and j.avg_fps:
+                metrics.JOB_FPS.observe(j.avg_fps, api="web")
+        # só jobs concluídos calibram a vazão do escalonador
+        return j.status == "completed"
+
+    def _run(j: Job):
         with jobs_lock:
             j.status = "processing"; j.updated_at = time.time()
+            _save(j)
 
         try:
             # 1) roda a interpolação recebendo os 6 valores (avg_fps, frames, fps_in, fps_out, W, H)
+            #    com ffmpeg o arquivo já sai H.264 com o áudio do original
+            use_ffmpeg = ffmpeg_available()
+            perf = {}
             avg_fps, frames, fps_in2, fps_out, W2, H2 = interpolate_video(
                 in_path=j.in_path,
                 out_path=j.out_path,
@@ -255,11 +359,16 @@ def _submit_job(job: Job):
                 down=j.down,
                 model=model,
                 device=device,
-                cancel_event=j.cancel_event
+                cancel_event=j.cancel_event,
+                batch_size=j.batch_size,
+                reader=j.reader,
+                writer="ffmpeg" if use_ffmpeg else "cv2",
+                audio_path=j.in_path if j.keep_audio else None,
+                stats=perf
             )
 
-            # 2) remux de áudio (se solicitado) ANTES de apagar a entrada
-            if j.keep_audio and not j.cancel_event.is_set():
+            # 2) remux de áudio (se solicitado e sem ffmpeg no passo acima) ANTES de apagar a entrada
+            if j.keep_audio and not use_ffmpeg and not j.cancel_event.is_set():
                 maybe_remux_audio(j.out_path, j.in_path)
 
             # 3) apaga a entrada sempre
@@ -277,12 +386,14 @@ def _submit_job(job: Job):
                 with jobs_lock:
                     j.status = "canceled"
                     j.updated_at = time.time()
+                    _save(j)
                 return
 
             # 5) atualiza o job com TODOS os metadados
             with jobs_lock:
                 j.avg_fps = avg_fps
                 j.frames = frames
+                j.perf = perf
                 # guarda os metadados (se não vierem None/0)
                 if fps_in2: j.fps_in = fps_in2
                 if fps_out: j.fps_out = fps_out
@@ -290,6 +401,7 @@ def _submit_job(job: Job):
                     j.width, j.height = W2, H2
                 j.status = "completed"
                 j.updated_at = time.time()
+                _save(j)
 
         except Exception as e:
             # falha → limpar resíduos
@@ -300,14 +412,35 @@ def _submit_job(job: Job):
                 j.status = "failed"
                 j.error = str(e)
                 j.updated_at = time.time()
+                _save(j)
 
-    job.future = executor.submit(_runner, job)
+    def _on_cancel(j: Job):
+        # cancelado ainda na fila: nunca rodou, só limpa a entrada
+        try: os.remove(j.in_path)
+        except Exception: pass
+        with jobs_lock:
+            j.status = "canceled"
+            j.updated_at = time.time()
+            _save(j)
+        metrics.JOBS_FINISHED.inc(api="web", status=j.status)
+
+    cost = estimate_cost(count_frames(job.in_path), job.width or 0, job.height or 0, job.multi, job.down)
+    job.ticket = SCHEDULER.submit(job.id, lambda t: _runner(job, t), api="web",
+                                  on_cancel=lambda t: _on_cancel(job), cost=cost)
+
+@metrics.register_collector
+def _collect_jobs():
+    by_status = STORE.counts_by_status("web")
+    yield ("jobs", "gauge", "Jobs no store, por API e status.",
+           [({"api": "web", "status": st}, n) for st, n in by_status.items()])
+    yield ("queue_depth", "gauge", "Jobs aguardando worker, por API.",
+           [({"api": "web"}, by_status.get("queued", 0))])
+    yield ("workers_max", "gauge", "Capacidade de workers, por API.",
+           [({"api": "web"}, MAX_WORKERS)])
 
 def _validate_queue_capacity():
-    with jobs_lock:
-        queued = sum(1 for j in JOBS.values() if j.status in ("queued", "processing"))
-        if queued >= MAX_PENDING:
-            abort(429, description="Fila cheia. Tente novamente em instantes.")
+    if STORE.count("web", ("queued", "processing")) >= MAX_PENDING:
+        abort(429, description="Fila cheia. Tente novamente em instantes.")
 
 @app.post("/jobs")
 def create_job():
@@ -329,6 +462,10 @@ def create_job():
         down  = float(request.form.get('down', 1) or 1)
         audio_opt = (request.form.get('audio', 'keep') or 'keep').lower()
         keep_audio = audio_opt in ('keep','manter','1','true','yes')
+        batch_size = int(request.form.get('batch_size', 0) or 0) or None
+        reader = (request.form.get('reader', 'cv2') or 'cv2').lower()
+        if reader not in READERS:
+            raise ValueError(f"reader deve ser um de {list(READERS)}")
     except Exception as e:
         return api_error(400, "invalid_params", f"Parâmetros inválidos: {e}")
 
@@ -336,6 +473,7 @@ def create_job():
     tmp_dir = tempfile.gettempdir()
     tmp_in  = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4", dir=tmp_dir); tmp_in.close()
     f.save(tmp_in.name)
+    metrics.UPLOAD_BYTES.inc(os.path.getsize(tmp_in.name), route="/jobs")
 
     job_id = uuid.uuid4().hex
     out_path = os.path.join(tmp_dir, f"{job_id}_x{multi}.mp4")
@@ -361,17 +499,28 @@ def create_job():
         fps_in=fps_in,
         width=W,
         height=H,
-        keep_audio=keep_audio
+        keep_audio=keep_audio,
+        batch_size=batch_size,
+        reader=reader
     )
+    # admissão por custo: recusa se o trabalho pendente passaria do orçamento
+    try:
+        _submit_job(job)
+    except Overloaded as e:
+        try: os.remove(tmp_in.name)
+        except Exception: pass
+        resp, status = api_error(429, "overloaded", str(e), {"retry_after_s": int(e.retry_after) + 1})
+        resp.headers["Retry-After"] = str(int(e.retry_after) + 1)
+        return resp, status
     with jobs_lock:
-        JOBS[job_id] = job
+        _save(job)
 
-    _submit_job(job)
-    return jsonify({"job_id": job_id, "status": "queued"}), 202
+    metrics.JOBS_SUBMITTED.inc(api="web")
+    return jsonify({"job_id": job_id, "status": "queued", "queue": SCHEDULER.info(job_id)}), 202
 
 @app.get("/jobs/<job_id>")
 def get_job(job_id):
-    job = JOBS.get(job_id)
+    job = _load_job(job_id)
     if not job:
         abort(404, description="Job não encontrado.")
     with jobs_lock:
@@ -384,23 +533,25 @@ def get_job(job_id):
             "updated_at": job.updated_at,
             "has_result": bool(job.out_path and os.path.exists(job.out_path) and job.status == "completed"),
             "error": job.error,
+            "perf": job.perf,
         }
+    payload["queue"] = SCHEDULER.info(job.id)
     return jsonify(payload)
 
 @app.post("/jobs/<job_id>/cancel")
 def cancel_job(job_id):
-    job = JOBS.get(job_id)
+    job = _load_job(job_id)
     if not job:
         abort(404, description="Job não encontrado.")
     with jobs_lock:
         if job.status in ("completed", "failed", "canceled"):
             return jsonify({"status": job.status})  # nada a fazer
         job.cancel_event.set()
-    return jsonify({"status": "canceling"})
+    return jsonify({"status": SCHEDULER.cancel(job_id) or "canceling"})
 
 @app.get("/jobs/<job_id>/result")
 def job_result(job_id):
-    job = JOBS.get(job_id)
+    job = _load_job(job_id)
     if not job:
         abort(404, description="Job não encontrado.")
     if job.status != "completed" or not job.out_path or not os.path.exists(job.out_path):
@@ -421,30 +572,92 @@ def job_result(job_id):
     def _cleanup_on_close(path, jid):
         try: os.remove(path)
         except Exception: pass
-        with jobs_lock:
-            j = JOBS.get(jid)
-            if j:
+        j = _load_job(jid)
+        if j:
+            with jobs_lock:
                 j.out_path = None
                 j.updated_at = time.time()
+                _save(j)
     resp.call_on_close(lambda p=job.out_path, jid=job.id: _cleanup_on_close(p, jid))
     return resp
 
-# (opcional) limpador periódico de sobras por TTL
+# (opcional) limpador periódico de sobras por TTL (consulta pelo índice de expiração)
 def _janitor():
     while True:
         time.sleep(60)
         now = time.time()
+        # tickets dos jobs encerrados (o forget ignora quem ainda não saiu do worker)
         with jobs_lock:
-            for j in list(JOBS.values()):
-                if j.out_path and os.path.exists(j.out_path) and (now - j.updated_at) > RESULT_TTL_SEC:
-                    try: os.remove(j.out_path)
-                    except Exception: pass
-                    j.out_path = None
-                    j.updated_at = now
-
-janitor_thread = threading.Thread(target=_janitor, daemon=True)
-janitor_thread.start()
+            ended = list(_ENDED)
+        for jid in ended:
+            SCHEDULER.forget(jid)
+            if SCHEDULER.info(jid) is None:
+                with jobs_lock:
+                    _ENDED.discard(jid)
+        for _, data in STORE.expired("web", now):
+            j = Job(**data)
+            try: os.remove(j.out_path)
+            except Exception: pass
+            with jobs_lock:
+                j.out_path = None
+                j.updated_at = now
+                _save(j)
+
+def _recover_jobs():
+    """Na subida: re-enfileira o que estava na fila e marca o que foi interrompido."""
+    for data in STORE.with_status("web", ("queued", "processing")):
+        j = Job(**data)
+        if j.status == "queued" and j.in_path and os.path.exists(j.in_path):
+            try:
+                _submit_job(j)
+                with jobs_lock:
+                    _save(j)
+                continue
+            except Overloaded:
+                pass
+        for p in (j.in_path, j.out_path):
+            try: os.remove(p)
+            except Exception: pass
+        with jobs_lock:
+            j.status = "failed"
+            j.error = "interrompido: o servidor reiniciou antes de concluir o job"
+            j.updated_at = time.time()
+            _save(j)
+
+_started = False
+_start_lock = threading.Lock()
+
+def start_background():
+    """Recuperação dos jobs (das duas APIs) e a thread do janitor — uma vez por processo."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    api_jobs.start_background()
+    _recover_jobs()
+    threading.Thread(target=_janitor, daemon=True).start()
+
+@app.before_request
+def _ensure_started():
+    # quem sobe com "main:app" (sem a fábrica) recupera no primeiro request
+    start_background()
+
+def create_app():
+    """Fábrica para o WSGI: gunicorn "main:create_app()"."""
+    start_background()
+    return app
 
 if __name__ == "__main__":
-    # Para desenvolvimento: atende múltiplas conexões; produção → use um WSGI (gunicorn/uwsgi) com threads=2
-    app.run(debug=True, threaded=True)
+    # Com o reloader do debug este arquivo roda no pai (que só vigia os fontes) e no
+    # filho (WERKZEUG_RUN_MAIN=true); só quem atende recupera os jobs.
+    use_reloader = True
+    if not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background()
+    # Para desenvolvimento: atende múltiplas conexões; produção → use um WSGI com a
+    # fábrica (gunicorn "main:create_app()").
+    # Conte as conexões longas ao escolher as threads: cada aba acompanhando um job
+    # segura o SSE (/events) e, com a prévia ao vivo, também o /live até o fim do job.
+    # threads=2 só aguenta um job acompanhado por vez; use gthread com mais threads
+    # (ex.: --worker-class gthread --threads 16) ou um worker assíncrono (gevent)
+    app.run(debug=True, threaded=True, use_reloader=use_reloader)
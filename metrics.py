@@ -0,0 +1,166 @@
+# metrics.py
+"""
+Métricas no formato texto do Prometheus, sem dependências.
+Contadores/histogramas são atualizados nos pontos de evento (submissão,
+upload, fim de job); valores instantâneos (fila, status, processos vivos)
+vêm de coletores chamados na hora do scrape.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+PREFIX = "duplicaja_"
+
+LATENCY_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+FPS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 240)
+
+
+def _key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted(labels.items()))
+
+def _fmt_labels(items) -> str:
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+def _fmt_value(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = PREFIX + name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_fmt_labels(k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        k = _key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        k = _key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple, list] = {}   # labels -> [contagens..., soma, total]
+
+    def observe(self, value: float, **labels):
+        k = _key(labels)
+        with self._lock:
+            s = self._series.get(k)
+            if s is None:
+                s = self._series[k] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(k, list(s)) for k, s in self._series.items()]
+        lines = self._header()
+        for k, s in series:
+            for i, b in enumerate(self.buckets):
+                lines.append(f"{self.name}_bucket{_fmt_labels(k + (('le', _fmt_value(float(b))),))} {s[i]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(k)} {_fmt_value(s[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(k)} {s[-1]}")
+        return lines
+
+
+# ========= registro =========
+_METRICS: List[_Metric] = []
+_COLLECTORS: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict, float]]]]]] = []
+_REG_LOCK = threading.Lock()
+
+def _register(m: _Metric) -> _Metric:
+    with _REG_LOCK:
+        _METRICS.append(m)
+    return m
+
+def counter(name: str, help: str) -> Counter:
+    return _register(Counter(name, help))
+
+def gauge(name: str, help: str) -> Gauge:
+    return _register(Gauge(name, help))
+
+def histogram(name: str, help: str, buckets=LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, buckets))
+
+def register_collector(fn):
+    """
+    `fn()` é chamada a cada scrape e devolve tuplas
+    (nome, tipo, ajuda, [(labels, valor), ...]). Deve ser barata: copiar
+    o que precisa sob lock e contar fora dele.
+    """
+    with _REG_LOCK:
+        _COLLECTORS.append(fn)
+    return fn
+
+def render() -> str:
+    with _REG_LOCK:
+        metrics, collectors = list(_METRICS), list(_COLLECTORS)
+    lines: List[str] = []
+    for m in metrics:
+        lines += m.render()
+    # coletores diferentes podem contribuir para a mesma família (ex.: as duas APIs)
+    families: Dict[str, Tuple[str, str, list]] = {}
+    for fn in collectors:
+        try:
+            collected = list(fn())
+        except Exception:
+            continue
+        for name, kind, help, samples in collected:
+            families.setdefault(name, (kind, help, []))[2].extend(samples)
+    for name, (kind, help, samples) in families.items():
+        name = PREFIX + name
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{_fmt_labels(_key(lbl))} {_fmt_value(v)}" for lbl, v in samples]
+    return "\n".join(lines) + "\n"
+
+
+# ========= métricas compartilhadas pelas duas APIs =========
+JOBS_SUBMITTED = counter("jobs_submitted_total", "Jobs aceitos, por API.")
+JOBS_FINISHED  = counter("jobs_finished_total", "Jobs encerrados, por API e status final.")
+UPLOAD_BYTES   = counter("upload_bytes_total", "Bytes de vídeo recebidos, por rota.")
+JOB_LATENCY    = histogram("job_latency_seconds", "Tempo de ponta a ponta (criação até o fim), por API.")
+JOB_FPS        = histogram("job_fps", "Quadros/s médios de interpolação por job, por API.", FPS_BUCKETS)
+WORKERS_BUSY   = gauge("workers_busy", "Workers ocupados no momento, por API.")
@@ -0,0 +1,80 @@
+import threading
+
+import numpy as np
+import torch
+
+
+class BufferPool:
+    """
+    Pool (por job) de tensores e arrays reutilizáveis, chaveado por
+    (forma, dtype, device). O laço de interpolação pede buffers com
+    `tensor()`/`array()` e devolve com `release()`; a thread de gravação
+    devolve os quadros depois de escrevê-los.
+
+    Os contadores (`stats()`) permitem verificar que, em regime, não há
+    novas alocações: `allocations` para de crescer e só `reuses` sobe.
+    """
+
+    def __init__(self, device=None):
+        self.device = device or torch.device("cpu")
+        self._free = {}       # chave -> [buffers livres]
+        self._owned = {}      # id(buffer) -> chave (só buffers emprestados)
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+        self.releases = 0
+        self.bytes_allocated = 0
+
+    def _acquire(self, key, make):
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                buf = free.pop()
+                self.reuses += 1
+            else:
+                buf = None
+        if buf is None:
+            buf = make()
+            with self._lock:
+                self.allocations += 1
+                self.bytes_allocated += buf.nbytes if isinstance(buf, np.ndarray) else buf.numel() * buf.element_size()
+        with self._lock:
+            self._owned[id(buf)] = (key, buf)
+        return buf
+
+    def tensor(self, shape, dtype=torch.float32, memory_format=torch.contiguous_format):
+        shape = tuple(int(s) for s in shape)
+        key = ("t", shape, dtype, self.device, memory_format)
+        return self._acquire(key, lambda: torch.empty(shape, dtype=dtype, device=self.device,
+                                                      memory_format=memory_format))
+
+    def array(self, shape, dtype=np.uint8):
+        shape = tuple(int(s) for s in shape)
+        key = ("a", shape, np.dtype(dtype))
+        return self._acquire(key, lambda: np.empty(shape, dtype=dtype))
+
+    def release(self, buf):
+        """Devolve um buffer ao pool. Buffers que não vieram do pool são ignorados."""
+        if buf is None:
+            return
+        with self._lock:
+            entry = self._owned.pop(id(buf), None)
+            if entry is None:
+                return
+            key, _ = entry
+            self._free.setdefault(key, []).append(buf)
+            self.releases += 1
+
+    def in_use(self):
+        with self._lock:
+            return len(self._owned)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+                "releases": self.releases,
+                "in_use": len(self._owned),
+                "bytes_allocated": self.bytes_allocated,
+            }
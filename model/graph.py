@@ -0,0 +1,224 @@
+# model/graph.py
+"""
+Grafos otimizados do FlowNet (flow_net + mask_head), um por shape de entrada.
+
+GraphFlowNet embrulha um FlowNet (fp32 ou o int8/bf16 de model.quantized) com o
+mesmo inference(img0, img1) -> (flow, mask), inference_to_size e
+inference_field, mas roda o encoder (model.encode, a parte pesada) num grafo
+compilado para o shape (B, h, w) do lote:
+
+    "script"   torch.jit.trace + freeze; cada grafo é salvo em disco
+               (<cache>/<modelo>_<B>x<h>x<w>.pt) e os próximos processos só
+               fazem torch.jit.load. Saída idêntica ao eager.
+    "compile"  torch.compile (inductor); o cache de disco é o do próprio
+               inductor (TORCHINDUCTOR_CACHE_DIR, apontado para <cache>/inductor).
+               Mais rápido com várias threads, mas não bit a bit igual.
+    "eager"    sem grafo (padrão).
+
+O backend padrão vem de DUPLICAJA_GRAPH e o diretório de DUPLICAJA_GRAPH_CACHE.
+A reconstrução até (H, W) (model.decode / model.model.reconstruct_field), o
+warp e o blend continuam em eager: vão em faixas de linhas de altura variável
+e escrevem em buffers do pool (out=), o que um grafo fixo trocaria por
+alocações novas a cada lote.
+
+Lotes menores que o cheio (pares pulados por corte de cena/quadro parado, o
+último lote) usam o menor grafo já pronto (em memória ou no disco) com o
+mesmo (h, w) e B maior, com os pares repetidos até completar; só sem nenhum
+o shape é compilado na hora. warmup(shapes) compila os lotes cheios dos
+shapes comuns antes do primeiro job (ver preset_shapes).
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+
+from model.model import reconstruct, reconstruct_field
+from model.util import SYNTH_MEM_BUDGET, auto_batch_size
+
+GRAPH_BACKENDS = ("eager", "script", "compile")
+GRAPH_BACKEND = os.environ.get("DUPLICAJA_GRAPH", "eager")
+GRAPH_CACHE_DIR = os.environ.get("DUPLICAJA_GRAPH_CACHE", os.path.join(tempfile.gettempdir(), "duplicaja_graphs"))
+# (W, H) aquecidos por padrão: paisagem 720p/1080p e vertical 1080x1920 (stories)
+COMMON_RESOLUTIONS = ((1280, 720), (1920, 1080), (1080, 1920))
+
+Shape = Tuple[int, int, int]   # (B, h, w) do quadro pequeno
+
+_build_lock = threading.Lock()
+
+def _reset_lock_after_fork():
+    # o aquecimento roda numa thread do api_jobs; um filho criado por fork no
+    # meio de uma compilação herdaria o lock fechado
+    global _build_lock
+    _build_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_lock_after_fork)
+
+
+class _Encode(nn.Module):
+    """forward(img0, img1) = model.encode, para o trace enxergar um módulo."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, img0, img1):
+        return self.model.encode(img0, img1)
+
+
+def model_digest(model: nn.Module) -> str:
+    """Hash dos pesos (e da classe): nomeia os grafos em disco."""
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    h = hashlib.sha1(buf.getvalue())
+    h.update(f"encode|{type(model).__name__}|{torch.__version__}|{torch.backends.quantized.engine}"
+             f"|{getattr(model, 'autocast', '')}".encode())
+    return h.hexdigest()[:16]
+
+
+class GraphFlowNet:
+    """inference/inference_to_size com o encoder num grafo compilado para cada shape (B, h, w)."""
+
+    def __init__(self, model: nn.Module, backend: str = "script", cache_dir: str = GRAPH_CACHE_DIR):
+        if backend not in GRAPH_BACKENDS or backend == "eager":
+            raise ValueError(f"backend deve ser um de {GRAPH_BACKENDS[1:]}")
+        self.model = model
+        # o trace é feito no layout em que interpolate_video vai entregar os quadros
+        self.memory_format = getattr(model, "memory_format", torch.contiguous_format)
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.digest = model_digest(model)
+        self._graphs: Dict[Shape, object] = {}
+        self.stats = {"built": 0, "loaded": 0, "build_s": 0.0}
+        os.makedirs(cache_dir, exist_ok=True)
+        if backend == "compile":
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(cache_dir, "inductor"))
+
+    def _path(self, shape: Shape) -> str:
+        B, h, w = shape
+        return os.path.join(self.cache_dir, f"{self.digest}_{B}x{h}x{w}.pt")
+
+    def _build(self, shape: Shape):
+        B, h, w = shape
+        if self.backend == "compile":
+            t = time.perf_counter()
+            graph = torch.compile(_Encode(self.model).eval(), dynamic=False)
+            with torch.no_grad():
+                x = torch.zeros(B, 3, h, w).contiguous(memory_format=self.memory_format)
+                graph(x, x)   # compila agora, não no primeiro lote
+            self.stats["built"] += 1
+            self.stats["build_s"] += time.perf_counter() - t
+            return graph
+
+        path = self._path(shape)
+        if os.path.exists(path):
+            try:
+                graph = torch.jit.load(path, map_location="cpu")
+                self.stats["loaded"] += 1
+                return graph
+            except Exception as e:
+                print(f"grafo em cache ignorado ({path}): {e}")
+        t = time.perf_counter()
+        x = torch.zeros(B, 3, h, w).contiguous(memory_format=self.memory_format)
+        with torch.no_grad():
+            graph = torch.jit.freeze(torch.jit.trace(_Encode(self.model).eval(), (x, x)))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            torch.jit.save(graph, tmp)
+            os.replace(tmp, path)   # segmentos em paralelo podem gerar o mesmo shape
+        except OSError as e:
+            print(f"grafo não gravado ({path}): {e}")
+        self.stats["built"] += 1
+        self.stats["build_s"] += time.perf_counter() - t
+        return graph
+
+    def graph(self, shape: Shape):
+        g = self._graphs.get(shape)
+        if g is None:
+            with _build_lock:
+                g = self._graphs.get(shape)
+                if g is None:
+                    g = self._graphs[shape] = self._build(shape)
+        return g
+
+    def _batch_for(self, B: int, h: int, w: int) -> int:
+        """Menor B' >= B com grafo pronto para (h, w) (em memória ou, no script, em disco); B se não houver."""
+        ready = [b for (b, hh, ww) in self._graphs if (hh, ww) == (h, w) and b >= B]
+        if self.backend == "script" and not ready:
+            prefix, suffix = f"{self.digest}_", f"x{h}x{w}.pt"
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(prefix) and name.endswith(suffix):
+                    b = name[len(prefix):-len(suffix)]
+                    if b.isdigit() and int(b) >= B:
+                        ready.append(int(b))
+        return min(ready, default=B)
+
+    @torch.no_grad()
+    def encode(self, img0, img1):
+        B, _, h, w = img0.shape
+        Bg = self._batch_for(B, h, w)
+        if Bg > B:
+            # completa o lote repetindo o último par; a saída extra é descartada
+            pad = (Bg - B, -1, -1, -1)
+            img0 = torch.cat([img0, img0[-1:].expand(pad)])
+            img1 = torch.cat([img1, img1[-1:].expand(pad)])
+        return self.graph((Bg, h, w))(img0, img1)[:B]
+
+    @torch.no_grad()
+    def inference(self, img0, img1):
+        return self.model.decode(self.encode(img0, img1))
+
+    @torch.no_grad()
+    def inference_to_size(self, img0, img1, H, W, scale=1.0, flow_out=None, mask_out=None):
+        """Como FlowNet.inference_to_size, com o encoder no grafo."""
+        return reconstruct(self.encode(img0, img1), self.model.n_up, self.model.mask_head,
+                           H, W, scale, flow_out, mask_out)
+
+    @torch.no_grad()
+    def inference_field(self, img0, img1, H, W, scale=1.0):
+        """Como FlowNet.inference_field, com o encoder no grafo."""
+        return reconstruct_field(self.encode(img0, img1), self.model.n_up, self.model.mask_head, H, W, scale)
+
+    def warmup(self, shapes: Iterable[Shape], log=print) -> List[Shape]:
+        """Compila (ou carrega do disco) cada shape; devolve os que ficaram prontos."""
+        ready = []
+        for shape in shapes:
+            t = time.perf_counter()
+            try:
+                self.graph(tuple(shape))
+            except Exception as e:
+                log(f"aquecimento de {shape} falhou: {e}")
+                continue
+            ready.append(tuple(shape))
+            log(f"grafo {self.backend} {shape} pronto em {time.perf_counter() - t:.1f}s")
+        return ready
+
+
+def wrap_graph(model, backend: str = GRAPH_BACKEND, cache_dir: str = GRAPH_CACHE_DIR):
+    """GraphFlowNet(model) ou o próprio model com backend "eager"."""
+    if backend == "eager" or isinstance(model, GraphFlowNet):
+        return model
+    return GraphFlowNet(model, backend, cache_dir)
+
+
+def preset_shapes(presets: Sequence[Dict], resolutions=COMMON_RESOLUTIONS) -> List[Shape]:
+    """
+    Shapes (B, h, w) que interpolate_video usa para cada {multi, downscale}
+    nas resoluções dadas, com o batch automático (o lote cheio; os lotes
+    parciais rodam nele, completados — ver GraphFlowNet.encode).
+    """
+    shapes = []
+    for p in presets:
+        multi, down = int(p.get("multi") or 1), float(p.get("downscale") or 1.0)
+        for W, H in resolutions:
+            shape = (auto_batch_size(H, W, multi, synth_mem=SYNTH_MEM_BUDGET, down=down), int(H * down), int(W * down))
+            if shape not in shapes:
+                shapes.append(shape)
+    return shapes
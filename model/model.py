@@ -1,5 +1,165 @@
+import functools
+
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+
+# acima disto (linhas ou colunas da saída grossa do encoder) as matrizes densas
+# de reconstruct custam mais que os Upsample encadeados: cai no caminho antigo
+RESAMPLE_MAX_COARSE = 256
+
+
+@functools.lru_cache(maxsize=128)
+def _resize_matrix(n_in, n_out):
+    # interpolação linear com align_corners=True como matriz (n_out x n_in), em float64.
+    # A posição de origem i*(n_in-1)/(n_out-1) vai em inteiros: em float ela
+    # pode passar de n_in-1 por arredondamento e apontar além da borda
+    M = torch.zeros(n_out, n_in, dtype=torch.float64)
+    if n_in == 1 or n_out == 1:
+        M[:, 0] = 1.0
+        return M
+    den = n_out - 1
+    for i in range(n_out):
+        i0, rem = divmod(i * (n_in - 1), den)
+        if rem == 0:
+            M[i, i0] = 1.0
+        else:
+            M[i, i0] = (den - rem) / den
+            M[i, i0 + 1] = rem / den
+    return M
+
+
+@functools.lru_cache(maxsize=128)
+def _lerp_taps(n_in, n_out):
+    # as linhas de _resize_matrix(n_in, n_out) como (i0, i1, peso de i1): no
+    # máximo dois pesos não nulos por linha, então qualquer trecho delas sai
+    # com gather + lerp, sem a matriz densa
+    den = max(n_out - 1, 1)
+    i0, w = [], []
+    for i in range(n_out):
+        q, rem = divmod(i * (n_in - 1), den) if n_in > 1 and n_out > 1 else (0, 0)
+        i0.append(q)
+        w.append(rem / den)
+    i0 = torch.tensor(i0)
+    return i0, torch.clamp(i0 + 1, max=n_in - 1), torch.tensor(w, dtype=torch.float32)
+
+
+def resize_rows(x, H, W, y0, y1, out=None):
+    """
+    Linhas y0:y1 do resize bilinear (align_corners) de x (B, C, h, w) para
+    (H, W): na altura, as linhas y0:y1 de _resize_matrix (gather + lerp); na
+    largura, o resize linear 1D de cada linha, cujos pesos só dependem de w
+    e W. Cada linha da saída só depende dos índices dela, então qualquer
+    faixa é igual, bit a bit, ao trecho do resize do quadro inteiro.
+    """
+    i0, i1, wy = _lerp_taps(x.shape[-2], H)
+    rows = x.index_select(-2, i0[y0:y1]).lerp_(x.index_select(-2, i1[y0:y1]), wy[y0:y1, None])
+    B, C, r, w = rows.shape
+    if out is None:
+        out = rows.new_empty(B, C, r, W)
+    torch.ops.aten.upsample_linear1d.out(rows.view(B, C * r, w), [W], True, None, out=out.view(B, C * r, W))
+    return out
+
+
+@functools.lru_cache(maxsize=64)
+def resample_matrix(n_in, n_up):
+    """Matriz de um eixo que reproduz os n_up Upsample(x2) encadeados do flow_net."""
+    M, n = torch.eye(n_in, dtype=torch.float64), n_in
+    for _ in range(n_up):
+        M, n = _resize_matrix(n, 2 * n) @ M, 2 * n
+    return M.float()
+
+
+@functools.lru_cache(maxsize=64)
+def shifted_matrices(n_in, n_up, k):
+    """
+    As k versões da matriz mid com as linhas deslocadas de -(k//2)..k//2
+    (zeros fora da borda): uma conv kxk (padding k//2) sobre Ay @ X @ Ax^T
+    vira uma soma de produtos destas matrizes com X.
+    """
+    M = resample_matrix(n_in, n_up)
+    out = torch.zeros(k, M.shape[0], n_in)
+    for a in range(k):
+        d = a - k // 2
+        lo, hi = max(0, -d), min(M.shape[0], M.shape[0] - d)
+        out[a, lo:hi] = M[lo + d:hi + d]
+    return out
+
+
+def _mask_pre(coarse, conv, n_up):
+    # conv(Ay @ X @ Ax^T) calculada na grade grossa: por eixo, cada deslocamento
+    # do kernel é uma matriz (shifted_matrices); só a ativação roda em mid
+    O, C, ka, kb = conv.weight.shape
+    h, w = coarse.shape[-2:]
+    By = shifted_matrices(h, n_up, ka)                       # (ka, Hm, h)
+    Bx = shifted_matrices(w, n_up, kb)                       # (kb, Wm, w)
+    T = torch.matmul(coarse.unsqueeze(2), Bx.transpose(1, 2))  # (B, C, kb, h, Wm)
+    U = torch.einsum("ocaq,bcqhw->boahw", conv.weight, T)      # (B, O, ka, h, Wm)
+    Hm = By.shape[1]
+    pre = torch.matmul(By.permute(1, 0, 2).reshape(Hm, ka * h), U.reshape(U.shape[0], O, ka * h, -1))
+    if conv.bias is not None:
+        pre += conv.bias.view(1, O, 1, 1)
+    return pre
+
+
+def _conv_foldable(conv):
+    # conv densa, passo 1 e padding "same" com zeros: comuta com a reamostragem linear
+    k = conv.kernel_size
+    return (isinstance(conv, nn.Conv2d) and conv.stride == (1, 1) and conv.dilation == (1, 1)
+            and conv.groups == 1 and conv.padding_mode == "zeros"
+            and conv.padding == (k[0] // 2, k[1] // 2) and k[0] % 2 == 1 and k[1] % 2 == 1)
+
+
+class FlowField:
+    """
+    Fluxo (B, 4, H, W) e máscara (B, 1, H, W) de B pares sem materializá-los:
+    guarda a saída na resolução dos Upsample (fluxo já x scale) e rows(y0, y1)
+    gera só as linhas pedidas (resize_rows). A síntese em faixas pede uma
+    faixa por vez, e o campo inteiro nunca fica em memória.
+    """
+
+    def __init__(self, flow, mask, H, W):
+        self.flow, self.mask, self.H, self.W = flow, mask, H, W
+
+    def __len__(self):
+        return self.flow.shape[0]
+
+    def rows(self, y0, y1, flow_out=None, mask_out=None):
+        """(fluxo, máscara) das linhas y0:y1, em flow_out/mask_out se dados."""
+        return (resize_rows(self.flow, self.H, self.W, y0, y1, flow_out),
+                resize_rows(self.mask, self.H, self.W, y0, y1, mask_out))
+
+
+def reconstruct_field(coarse, n_up, mask_head, H, W, scale=1.0):
+    """
+    FlowField em (H, W) a partir da saída grossa do encoder. Os n_up
+    Upsample viram um reamostrador separável (Ay @ X @ Ax^T) e a conv do
+    mask_head (linear) é aplicada na grade grossa, dobrada nas matrizes; só a
+    ativação (sigmoid, não linear) roda na resolução dos Upsample, como antes.
+    O custo das matrizes cresce com o lado da saída grossa: acima de
+    RESAMPLE_MAX_COARSE usa os Upsample encadeados.
+    """
+    h, w = coarse.shape[-2:]
+    if max(h, w) > RESAMPLE_MAX_COARSE:
+        flow = coarse
+        for _ in range(n_up):
+            flow = F.interpolate(flow, scale_factor=2, mode="bilinear", align_corners=True)
+        mask = mask_head(flow)
+    else:
+        my, mx = resample_matrix(h, n_up), resample_matrix(w, n_up)
+        flow = torch.matmul(my, torch.matmul(coarse, mx.t()))
+        conv = mask_head[0]
+        if _conv_foldable(conv):
+            mask = mask_head[1:](_mask_pre(coarse, conv, n_up))
+        else:
+            mask = mask_head(flow)
+    return FlowField(flow.mul_(scale), mask, H, W)
+
+
+def reconstruct(coarse, n_up, mask_head, H, W, scale=1.0, flow_out=None, mask_out=None):
+    """(flow, mask) inteiros em (H, W): reconstruct_field com uma faixa só."""
+    return reconstruct_field(coarse, n_up, mask_head, H, W, scale).rows(0, H, flow_out, mask_out)
+
 
 class FlowNet(nn.Module):
     def __init__(self, base=16):
@@ -29,3 +189,30 @@ class FlowNet(nn.Module):
         flow = self.flow_net(x)
         mask = self.mask_head(flow)
         return flow, mask
+
+    @property
+    def n_up(self):
+        """Quantos Upsample(x2) fecham o flow_net."""
+        return sum(isinstance(m, nn.Upsample) for m in self.flow_net)
+
+    def encode(self, img0, img1):
+        """Saída grossa do flow_net (antes dos Upsample); inference() = decode(encode())."""
+        return self.flow_net[:len(self.flow_net) - self.n_up](torch.cat([img0, img1], dim=1))
+
+    def decode(self, coarse):
+        flow = self.flow_net[len(self.flow_net) - self.n_up:](coarse)
+        return flow, self.mask_head(flow)
+
+    @torch.no_grad()
+    def inference_to_size(self, img0, img1, H, W, scale=1.0, flow_out=None, mask_out=None):
+        """
+        Mesmo que inference() seguido do resize bilinear (align_corners) para
+        (H, W) e de flow * scale, num só passo; igual a menos de arredondamento.
+        flow_out/mask_out: buffers (B, 4, H, W) e (B, 1, H, W) para a saída.
+        """
+        return reconstruct(self.encode(img0, img1), self.n_up, self.mask_head, H, W, scale, flow_out, mask_out)
+
+    @torch.no_grad()
+    def inference_field(self, img0, img1, H, W, scale=1.0):
+        """inference_to_size sem materializar a saída: um FlowField, gerado por faixa de linhas."""
+        return reconstruct_field(self.encode(img0, img1), self.n_up, self.mask_head, H, W, scale)
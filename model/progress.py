@@ -0,0 +1,41 @@
+# model/progress.py
+"""
+Progresso de uma interpolação visível de fora do processo que a roda.
+
+interpolate_video(progress=...) chama progress(feitos, total, fps) a cada
+lote. SharedProgress guarda esses três números num mp.Array (memória
+compartilhada): o subprocesso escreve, o processo pai lê um snapshot sem
+fila nem arquivo. No modo segmentado cada trecho tem o seu, somados no pai.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+from typing import Dict, Optional
+
+
+def progress_dict(done: float, total: float, fps: float) -> Dict:
+    """{frames_done, frames_total, fps, eta_s} (eta_s None até haver fps)."""
+    total = max(total, done)   # a contagem do container pode ser aproximada
+    eta = (total - done) / fps if fps > 0 else None
+    return {"frames_done": int(done), "frames_total": int(total), "fps": round(fps, 2),
+            "eta_s": round(eta, 1) if eta is not None else None}
+
+
+class SharedProgress:
+    """Callable progress(feitos, total, fps) que pode ser passado a outro processo."""
+
+    def __init__(self, ctx=None):
+        self._arr = (ctx or mp).Array("d", 3)
+
+    def __call__(self, done: float, total: float, fps: float):
+        with self._arr.get_lock():
+            self._arr[:] = [done, total, fps]
+
+    def read(self):
+        with self._arr.get_lock():
+            return tuple(self._arr[:])
+
+    def snapshot(self) -> Optional[Dict]:
+        """progress_dict do último valor, ou None se nada foi publicado ainda."""
+        done, total, fps = self.read()
+        return progress_dict(done, total, fps) if total or done else None
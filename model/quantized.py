@@ -0,0 +1,301 @@
+# model/quantized.py
+"""
+Variantes de precisão do FlowNet para servir em CPU ("fp32", "int8", "bf16").
+
+As convoluções do flow_net rodam em int8 (quantização estática pós-treino,
+eager mode do torch.ao), com cada Conv2d+ReLU fundida num só kernel; os
+Upsample e o mask_head continuam em fp32, depois do DeQuantStub, para que o
+fluxo saia com a resolução fina de sempre. A calibração passa alguns pares
+de quadros pelo modelo preparado para medir a faixa das ativações.
+
+O modelo calibrado fica em cache ao lado dos pesos (best_model.int8.pth),
+marcado com o tamanho/mtime do .pth, o engine e a origem da calibração;
+só a primeira carga calibra (os segmentos e workers reaproveitam).
+
+Quadros de calibração: vídeos em DUPLICAJA_CALIB_VIDEOS (separados por
+os.pathsep) ou, sem eles, pares sintéticos (textura suave em pan).
+O int8 é opt-in por job (nenhum preset o usa): calibrado nos pares
+sintéticos, em conteúdo muito texturizado ele chega a ~30 dB de PSNR médio
+(mínimo ~20 dB) contra o fp32. Para servir, calibre com vídeos reais e
+confira com benchmark.py --int8 (quality_vs_default).
+
+"bf16" (Bf16FlowNet) não calibra nada: o encoder roda em channels_last sob
+torch.autocast("cpu", bfloat16) quando o oneDNN tem bf16 nesta CPU (AVX512-BF16
+/AMX), e em channels_last fp32 quando não tem. Como no int8, a reamostragem
+e o mask_head ficam em fp32. O modelo tem memory_format = channels_last e
+interpolate_video guarda os quadros nesse layout do começo ao fim.
+"""
+from __future__ import annotations
+
+import copy
+import os
+import warnings
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import DeQuantStub, QuantStub, convert, fuse_modules, get_default_qconfig, prepare
+
+from model.model import FlowNet, reconstruct, reconstruct_field
+
+PRECISIONS = ("fp32", "int8", "bf16")
+CALIB_PAIRS = 16
+CALIB_SIZE = (288, 512)   # (H, W) dos quadros de calibração
+ENGINES = ("x86", "fbgemm", "qnnpack")   # ordem de preferência (qnnpack = ARM)
+
+
+def quant_engine() -> str:
+    """Primeiro engine quantizado disponível neste build do torch."""
+    supported = torch.backends.quantized.supported_engines
+    for e in ENGINES:
+        if e in supported:
+            return e
+    raise RuntimeError(f"torch sem engine quantizado (disponíveis: {supported})")
+
+
+def bf16_supported() -> bool:
+    """True se o oneDNN desta CPU roda convoluções em bfloat16 nativo."""
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def _split(flow_net: nn.Sequential) -> int:
+    """Índice do fim do encoder: tudo até a última Conv2d; o resto são os Upsample."""
+    return max(i for i, m in enumerate(flow_net) if isinstance(m, nn.Conv2d)) + 1
+
+
+class QuantFlowNet(nn.Module):
+    """Mesmo inference(img0, img1) -> (flow, mask) do FlowNet, com o encoder em int8."""
+
+    def __init__(self, fp32: FlowNet):
+        super().__init__()
+        layers = list(fp32.flow_net)
+        split = _split(fp32.flow_net)
+        self.quant = QuantStub()
+        self.encoder = copy.deepcopy(nn.Sequential(*layers[:split]))
+        self.dequant = DeQuantStub()
+        self.upsample = copy.deepcopy(nn.Sequential(*layers[split:]))
+        self.mask_head = copy.deepcopy(fp32.mask_head)
+        fuse_modules(self.encoder, [[str(i), str(i + 1)] for i, m in enumerate(self.encoder)
+                                    if isinstance(m, nn.Conv2d) and i + 1 < len(self.encoder)
+                                    and isinstance(self.encoder[i + 1], nn.ReLU)], inplace=True)
+
+    def forward(self, x):
+        return self.upsample(self.dequant(self.encoder(self.quant(x))))
+
+    @property
+    def n_up(self):
+        return len(self.upsample)
+
+    def encode(self, img0, img1):
+        """Saída grossa do encoder int8, já em fp32."""
+        return self.dequant(self.encoder(self.quant(torch.cat([img0, img1], dim=1))))
+
+    def decode(self, coarse):
+        flow = self.upsample(coarse)
+        return flow, self.mask_head(flow)
+
+    @torch.no_grad()
+    def inference(self, img0, img1):
+        flow = self(torch.cat([img0, img1], dim=1))
+        return flow, self.mask_head(flow)
+
+    @torch.no_grad()
+    def inference_to_size(self, img0, img1, H, W, scale=1.0, flow_out=None, mask_out=None):
+        """Como FlowNet.inference_to_size."""
+        return reconstruct(self.encode(img0, img1), self.n_up, self.mask_head, H, W, scale, flow_out, mask_out)
+
+    @torch.no_grad()
+    def inference_field(self, img0, img1, H, W, scale=1.0):
+        """Como FlowNet.inference_field."""
+        return reconstruct_field(self.encode(img0, img1), self.n_up, self.mask_head, H, W, scale)
+
+
+class Bf16FlowNet(nn.Module):
+    """Mesmo inference(img0, img1) -> (flow, mask) do FlowNet, com o encoder em channels_last/bfloat16."""
+
+    memory_format = torch.channels_last
+
+    def __init__(self, fp32: FlowNet, autocast: Optional[bool] = None):
+        super().__init__()
+        layers = list(fp32.flow_net)
+        split = _split(fp32.flow_net)
+        self.encoder = copy.deepcopy(nn.Sequential(*layers[:split])).to(memory_format=torch.channels_last)
+        self.upsample = copy.deepcopy(nn.Sequential(*layers[split:]))
+        self.mask_head = copy.deepcopy(fp32.mask_head)
+        self.autocast = bf16_supported() if autocast is None else autocast
+
+    def encode(self, img0, img1):
+        """Fluxo grosso do encoder, de volta em fp32 (NCHW)."""
+        x = torch.cat([img0, img1], dim=1).contiguous(memory_format=torch.channels_last)
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.autocast):
+            coarse = self.encoder(x)
+        # fluxo em bf16 teria ~3 dígitos: upsample, escala e máscara seguem em fp32
+        return coarse.float().contiguous()
+
+    @property
+    def n_up(self):
+        return len(self.upsample)
+
+    def decode(self, coarse):
+        flow = self.upsample(coarse)
+        return flow, self.mask_head(flow)
+
+    @torch.no_grad()
+    def inference(self, img0, img1):
+        return self.decode(self.encode(img0, img1))
+
+    @torch.no_grad()
+    def inference_to_size(self, img0, img1, H, W, scale=1.0, flow_out=None, mask_out=None):
+        """Como FlowNet.inference_to_size."""
+        return reconstruct(self.encode(img0, img1), self.n_up, self.mask_head, H, W, scale, flow_out, mask_out)
+
+    @torch.no_grad()
+    def inference_field(self, img0, img1, H, W, scale=1.0):
+        """Como FlowNet.inference_field."""
+        return reconstruct_field(self.encode(img0, img1), self.n_up, self.mask_head, H, W, scale)
+
+
+def _to_tensor(frame_bgr: np.ndarray, size: Tuple[int, int]) -> torch.Tensor:
+    H, W = size
+    rgb = cv2.resize(frame_bgr, (W, H), interpolation=cv2.INTER_AREA)[:, :, ::-1]
+    return torch.from_numpy(rgb.copy()).permute(2, 0, 1).float().unsqueeze(0) / 255.0
+
+
+def synthetic_pairs(n: int = CALIB_PAIRS, size: Tuple[int, int] = CALIB_SIZE, seed: int = 0):
+    """Pares (I0, I1) de textura suave deslocada de 1 a 8 px, com formas sólidas em movimento."""
+    rng = np.random.default_rng(seed)
+    H, W = size
+    pairs = []
+    for _ in range(n):
+        noise = rng.random((H // 8 + 2, W // 8 + 2, 3), dtype=np.float32)
+        tex = cv2.resize(noise, (W + 16, H + 16), interpolation=cv2.INTER_CUBIC)
+        tex = np.clip(tex * 255, 0, 255).astype(np.uint8)
+        dx, dy = rng.integers(-8, 9, 2)
+        f0 = tex[8:8 + H, 8:8 + W].copy()
+        f1 = tex[8 + dy:8 + dy + H, 8 + dx:8 + dx + W].copy()
+        for _ in range(4):
+            x, y = int(rng.integers(0, W)), int(rng.integers(0, H))
+            r = int(rng.uniform(0.03, 0.08) * min(W, H))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            vx, vy = (int(v) for v in rng.integers(-12, 13, 2))
+            cv2.circle(f0, (x, y), r, color, -1)
+            cv2.circle(f1, (x + vx, y + vy), r, color, -1)
+        pairs.append((_to_tensor(f0, size), _to_tensor(f1, size)))
+    return pairs
+
+
+def video_pairs(paths: Sequence[str], n: int = CALIB_PAIRS, size: Tuple[int, int] = CALIB_SIZE):
+    """Até `n` pares de quadros consecutivos, espalhados igualmente pelos vídeos."""
+    per_video = max(1, -(-n // max(1, len(paths))))
+    pairs = []
+    for path in paths:
+        cap = cv2.VideoCapture(str(path))
+        try:
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            starts = np.linspace(0, max(0, total - 2), per_video).astype(int) if total > 1 else [0]
+            for s in starts:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(s))
+                ok0, f0 = cap.read()
+                ok1, f1 = cap.read()
+                if ok0 and ok1:
+                    pairs.append((_to_tensor(f0, size), _to_tensor(f1, size)))
+        finally:
+            cap.release()
+    if not pairs:
+        raise RuntimeError(f"nenhum par de quadros lido para calibração em {list(paths)}")
+    return pairs[:n]
+
+
+def quantize_flownet(model: FlowNet, pairs: Optional[List] = None, engine: Optional[str] = None) -> QuantFlowNet:
+    """Funde, calibra em `pairs` [(I0, I1)] e converte; pairs=None só monta a estrutura (para load_state_dict)."""
+    engine = engine or quant_engine()
+    torch.backends.quantized.engine = engine
+    q = QuantFlowNet(model).eval()
+    q.qconfig = get_default_qconfig(engine)
+    q.upsample.qconfig = None
+    q.mask_head.qconfig = None
+    with warnings.catch_warnings():
+        # sem pares os observers ficam vazios: os qparams vêm do load_state_dict
+        if not pairs:
+            warnings.simplefilter("ignore")
+        prepare(q, inplace=True)
+        if pairs:
+            with torch.no_grad():
+                for i0, i1 in pairs:
+                    q(torch.cat([i0, i1], dim=1))
+        convert(q, inplace=True)
+    return q
+
+
+def _calib_videos() -> List[str]:
+    env = os.environ.get("DUPLICAJA_CALIB_VIDEOS", "")
+    return [p for p in env.split(os.pathsep) if p]
+
+
+def int8_cache_path(weights: str) -> str:
+    stem, _ = os.path.splitext(weights)
+    return stem + ".int8.pth"
+
+
+def _cache_key(weights: str, engine: str, calib: Sequence[str]) -> dict:
+    st = os.stat(weights)
+    return {"weights_size": st.st_size, "weights_mtime": st.st_mtime, "engine": engine,
+            "torch": str(torch.__version__), "calib": [os.path.abspath(p) for p in calib],
+            "pairs": CALIB_PAIRS, "size": list(CALIB_SIZE)}
+
+
+def load_flownet(weights: str = "best_model.pth", precision: str = "fp32",
+                 calib: Optional[Sequence[str]] = None, cache: bool = True, graph: Optional[str] = None):
+    """
+    FlowNet em modo eval na precisão pedida ("fp32", "int8" ou "bf16").
+    calib: vídeos para calibrar o int8 (padrão: DUPLICAJA_CALIB_VIDEOS ou
+    pares sintéticos). cache=False sempre recalibra e não grava nada.
+    graph: backend de model.graph ("eager", "script", "compile"; padrão
+    DUPLICAJA_GRAPH).
+    """
+    from model.graph import GRAPH_BACKEND, wrap_graph
+    return wrap_graph(_load(weights, precision, calib, cache), graph or GRAPH_BACKEND)
+
+
+def _load(weights, precision, calib, cache):
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision deve ser um de {PRECISIONS}")
+    model = FlowNet(base=16)
+    model.load_state_dict(torch.load(weights, map_location="cpu"))
+    model.eval()
+    if precision == "fp32":
+        return model
+    if precision == "bf16":
+        return Bf16FlowNet(model).eval()
+
+    engine = quant_engine()
+    calib = list(calib) if calib is not None else _calib_videos()
+    key = _cache_key(weights, engine, calib)
+    path = int8_cache_path(weights)
+    if cache and os.path.exists(path):
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")   # avisos de depreciação dos tensores quantizados
+                saved = torch.load(path, map_location="cpu")
+            if saved.get("key") == key:
+                q = quantize_flownet(model, None, engine)
+                q.load_state_dict(saved["state_dict"])
+                return q
+        except Exception as e:
+            print(f"cache int8 ignorado ({path}): {e}")
+
+    pairs = video_pairs(calib) if calib else synthetic_pairs()
+    q = quantize_flownet(model, pairs, engine)
+    if cache:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            torch.save({"key": key, "state_dict": q.state_dict()}, tmp)
+            os.replace(tmp, path)   # segmentos em paralelo podem calibrar juntos
+        except OSError as e:
+            print(f"cache int8 não gravado ({path}): {e}")
+    return q
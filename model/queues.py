@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import deque
+
+# Orçamentos padrão das filas de quadros (bytes). Uma fila de N quadros
+# não diz nada sobre memória: a 4K, 100 quadros RGB são ~2,5 GB.
+JOB_QUEUE_BUDGET = 512 * 1024 ** 2        # leitura + gravação de um job
+PROCESS_QUEUE_BUDGET = 1536 * 1024 ** 2   # todas as filas do processo
+
+# uma única condição para todas as filas: o orçamento do processo é compartilhado
+_cond = threading.Condition()
+
+
+class ByteBudget:
+    def __init__(self, limit):
+        self.limit = int(limit)
+        self.used = 0
+
+
+_process_budget = ByteBudget(PROCESS_QUEUE_BUDGET)
+
+def _reset_after_fork():
+    # o filho de um fork não herda as filas do pai (só o lock e os contadores):
+    # lock novo, já que outra thread podia segurá-lo no fork, e orçamento zerado
+    global _cond
+    _cond = threading.Condition()
+    _process_budget.used = 0
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def set_process_budget(limit_bytes):
+    """Ajusta o teto de bytes somado de todas as filas deste processo."""
+    with _cond:
+        _process_budget.limit = int(limit_bytes)
+        _cond.notify_all()
+
+def process_budget_usage():
+    with _cond:
+        return {"limit": _process_budget.limit, "used": _process_budget.used}
+
+
+def _nbytes(item):
+    return int(getattr(item, "nbytes", 0) or 0)
+
+
+class ByteQueue:
+    """
+    Fila FIFO limitada por bytes (orçamento do job E do processo), não por
+    contagem de quadros; a profundidade se adapta ao tamanho do quadro.
+    Uma fila vazia sempre aceita um item, então nunca trava por completo.
+
+    Contadores em `stats()`: tempo parado no put() indica consumidor lento
+    (a etapa seguinte é o gargalo); tempo parado no get() indica produtor lento.
+
+    close() abandona a fila (consumidor que desistiu, ex.: job cancelado):
+    devolve os bytes aos orçamentos, acorda quem está parado no put() e faz
+    os próximos put() descartarem o item e devolverem False.
+    """
+
+    def __init__(self, budget_bytes, process_budget=None):
+        self.budget = ByteBudget(budget_bytes)
+        self.process = process_budget or _process_budget
+        self._items = deque()
+        self.items_total = 0
+        self.max_depth = 0
+        self.max_bytes = 0
+        self.put_stalls = 0
+        self.put_wait = 0.0
+        self.get_stalls = 0
+        self.get_wait = 0.0
+        self.closed = False
+
+    def _fits(self, n):
+        if not self._items:
+            return True
+        return (self.budget.used + n <= self.budget.limit
+                and self.process.used + n <= self.process.limit)
+
+    def put(self, item):
+        """Enfileira `item`; False (item descartado) se a fila foi fechada."""
+        n = _nbytes(item)
+        with _cond:
+            if not self.closed and not self._fits(n):
+                t = time.perf_counter()
+                self.put_stalls += 1
+                while not self.closed and not self._fits(n):
+                    _cond.wait()
+                self.put_wait += time.perf_counter() - t
+            if self.closed:
+                return False
+            self._items.append((item, n))
+            self.budget.used += n
+            self.process.used += n
+            self.items_total += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self.max_bytes = max(self.max_bytes, self.budget.used)
+            _cond.notify_all()
+            return True
+
+    def get(self):
+        with _cond:
+            if not self._items:
+                t = time.perf_counter()
+                self.get_stalls += 1
+                while not self._items:
+                    _cond.wait()
+                self.get_wait += time.perf_counter() - t
+            item, n = self._items.popleft()
+            self.budget.used -= n
+            self.process.used -= n
+            _cond.notify_all()
+            return item
+
+    def close(self):
+        """Descarta o que está na fila e libera os orçamentos; put() passa a recusar."""
+        with _cond:
+            self.closed = True
+            self.budget.used -= sum(n for _, n in self._items)
+            self.process.used -= sum(n for _, n in self._items)
+            self._items.clear()
+            _cond.notify_all()
+
+    def qsize(self):
+        with _cond:
+            return len(self._items)
+
+    def stats(self):
+        with _cond:
+            return {
+                "depth": len(self._items),
+                "bytes": self.budget.used,
+                "budget_bytes": self.budget.limit,
+                "max_depth": self.max_depth,
+                "max_bytes": self.max_bytes,
+                "items": self.items_total,
+                "put_stalls": self.put_stalls,
+                "put_wait_s": round(self.put_wait, 4),
+                "get_stalls": self.get_stalls,
+                "get_wait_s": round(self.get_wait, 4),
+            }
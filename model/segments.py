@@ -0,0 +1,199 @@
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import time
+
+import torch
+
+from model.progress import SharedProgress
+from model.quantized import load_flownet
+from model.util import SCENE_CUT_THRESHOLD, STATIC_THRESHOLD, interpolate_video
+from model.video_io import count_frames, ffmpeg_available
+
+# Cada segmento roda em um processo próprio com `threads` threads do torch;
+# segmentos curtos demais não compensam o custo de subir o processo/modelo.
+THREADS_PER_SEGMENT = 2
+MIN_SEGMENT_FRAMES = 48
+MAX_SEGMENTS = 16
+
+
+def auto_segments(n_frames, cores=None, threads=THREADS_PER_SEGMENT):
+    """Quantos segmentos usar: núcleos / threads por segmento, limitado pelo tamanho do vídeo."""
+    cores = cores or os.cpu_count() or 1
+    by_cores = max(1, cores // max(1, threads))
+    by_length = max(1, n_frames // MIN_SEGMENT_FRAMES)
+    return max(1, min(by_cores, by_length, MAX_SEGMENTS))
+
+
+def plan_segments(n_frames, segments):
+    """
+    Divide [0, n_frames) em trechos inclusivos (start, end) que se sobrepõem
+    em um quadro: o último quadro de um segmento é o primeiro do seguinte,
+    então nenhum par (e nenhum intermediário) se perde na emenda. O último
+    trecho vai até o fim real do arquivo (end=None), já que a contagem do
+    container pode ser aproximada.
+    """
+    segments = max(1, min(int(segments), max(1, n_frames - 1)))
+    bounds = [round(k * (n_frames - 1) / segments) for k in range(segments + 1)]
+    plan = [(bounds[k], bounds[k + 1]) for k in range(segments)]
+    plan[-1] = (plan[-1][0], None)
+    return plan
+
+
+def _segment_task(args, results):
+    # roda em processo "spawn": carrega o próprio modelo e limita as threads
+    (k, in_path, out_path, start, end, last, multi, fps_override, down,
+     weights, precision, threads, batch_size, reader, scene_threshold, static_threshold, progress) = args
+    torch.set_num_threads(max(1, int(threads)))
+    model = load_flownet(weights, precision)
+    stats = {}
+    t = time.perf_counter()
+    result = interpolate_video(
+        in_path, out_path, multi=multi, fps_override=fps_override, down=down,
+        model=model, device=torch.device("cpu"), batch_size=batch_size,
+        writer="ffmpeg", reader=reader, stats=stats,
+        start_frame=start, end_frame=end, write_last=last, progress=progress,
+        scene_threshold=scene_threshold, static_threshold=static_threshold,
+    )
+    results.put((k, result, time.perf_counter() - t, stats))
+
+
+def _run_segments(tasks, workers, cancel_event=None, progress=None, total=0):
+    """
+    Roda as tarefas em até `workers` processos simultâneos e devolve
+    [(resultado, segundos, stats)] na ordem das tarefas, ou None se cancelado.
+    Um processo que morre sem publicar o resultado vira RuntimeError
+    (em vez de deixar a espera travada).
+    progress: recebe a soma dos quadros dos segmentos (de `total`) e o fps
+    agregado, a cada volta da espera.
+    """
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    t0 = time.perf_counter()
+    todo = list(tasks)
+    running = {}
+    done = {}
+    try:
+        while todo or running:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            while todo and len(running) < workers:
+                task = todo.pop(0)
+                p = ctx.Process(target=_segment_task, args=(task, results))
+                p.start()
+                running[task[0]] = p
+            if progress is not None:
+                done_frames = sum(t[-1].read()[0] for t in tasks)
+                elapsed = time.perf_counter() - t0
+                progress(done_frames, total, done_frames / elapsed if elapsed > 0 else 0.0)
+            try:
+                k, result, wall, stats = results.get(timeout=0.1)
+            except queue.Empty:
+                for k, p in running.items():
+                    if p.exitcode is not None and p.exitcode != 0:
+                        raise RuntimeError(f"segmento {k} terminou com código {p.exitcode}")
+                continue
+            done[k] = (result, wall, stats)
+            running.pop(k).join()
+        return [done[t[0]] for t in tasks]
+    finally:
+        for p in running.values():
+            if p.is_alive():
+                p.terminate()
+            p.join()
+
+
+def _concat(parts, out_path, audio_path=None):
+    """Emenda os segmentos sem re-encode (concat demuxer, -c copy) e mapeia o áudio."""
+    list_path = out_path + ".concat.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for p in parts:
+            f.write("file '" + os.path.abspath(p).replace("'", "'\\''") + "'\n")
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+           "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        cmd += ["-i", str(audio_path), "-map", "0:v:0", "-map", "1:a?",
+                "-c:a", "aac", "-b:a", "128k", "-shortest"]
+    cmd += ["-c:v", "copy", "-movflags", "+faststart", str(out_path)]
+    try:
+        proc = subprocess.run(cmd, stderr=subprocess.PIPE)
+    finally:
+        os.unlink(list_path)
+    if proc.returncode != 0:
+        err = proc.stderr.decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg concat terminou com código {proc.returncode}: {err}")
+
+
+def interpolate_video_segmented(in_path, out_path, multi=1, fps_override=None, down=0.25,
+                                weights="best_model.pth", segments=None, threads=None,
+                                batch_size=None, reader="cv2", audio_path=None,
+                                cancel_event=None, stats=None, model=None, cores=None, progress=None,
+                                scene_threshold=SCENE_CUT_THRESHOLD, static_threshold=STATIC_THRESHOLD,
+                                precision="fp32"):
+    """
+    Interpola `in_path` dividindo-o em `segments` trechos processados em
+    paralelo (um processo por trecho, `threads` threads do torch cada) e
+    emenda o resultado sem re-encode. Mesma saída de interpolate_video:
+    (avg_fps, frames_gerados, fps_in, fps_out, W, H).
+
+    segments=None escolhe pelo número de núcleos (`cores`, padrão: todos os
+    da máquina); sem ffmpeg (ou com um só segmento) cai no caminho serial,
+    usando `model` se dado.
+    cancel_event: qualquer objeto com is_set(); cancela matando os processos.
+    progress: como em interpolate_video, somando todos os segmentos.
+    precision: "fp32", "int8" ou "bf16" (model.quantized) do modelo de cada segmento.
+    Deve ser chamada de um processo não-daemon (cria filhos).
+    """
+    n_frames = count_frames(in_path)
+    cores = cores or os.cpu_count() or 1
+    threads = min(threads or THREADS_PER_SEGMENT, cores)
+    if segments is None:
+        segments = auto_segments(n_frames, cores, threads)
+    plan = plan_segments(n_frames, segments) if n_frames > 1 else [(0, None)]
+
+    if len(plan) == 1 or not ffmpeg_available():
+        if model is None:
+            model = load_flownet(weights, precision)
+        return interpolate_video(in_path, out_path, multi=multi, fps_override=fps_override, down=down,
+                                 model=model, batch_size=batch_size, reader=reader,
+                                 writer="auto", audio_path=audio_path,
+                                 cancel_event=cancel_event, stats=stats, progress=progress,
+                                 scene_threshold=scene_threshold, static_threshold=static_threshold)
+
+    tmp = tempfile.mkdtemp(prefix="seg_", dir=os.path.dirname(os.path.abspath(out_path)))
+    parts = [os.path.join(tmp, f"{k:03d}.mp4") for k in range(len(plan))]
+    tasks = [(k, str(in_path), parts[k], start, end, k == len(plan) - 1, multi, fps_override, down,
+              weights, precision, threads, batch_size, reader, scene_threshold, static_threshold,
+              SharedProgress(mp.get_context("spawn")))
+             for k, (start, end) in enumerate(plan)]
+    total = max(0, n_frames - 1) * (multi + 1) + 1
+
+    t0 = time.perf_counter()
+    try:
+        results = _run_segments(tasks, max(1, min(len(tasks), cores // threads)), cancel_event,
+                                progress, total)
+        if results is None:
+            return 0.0, 0, 0.0, 0.0, 0, 0
+        frames = sum(r[0][1] for r in results)
+        _concat([p for p, r in zip(parts, results) if r[0][1] > 0], str(out_path), audio_path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    elapsed = time.perf_counter() - t0
+    _, _, fps_in, fps_out, W, H = results[0][0]
+    if stats is not None:
+        stats["segments"] = [
+            {"start": t[3], "end": t[4], "frames": r[0][1], "avg_fps": round(r[0][0], 3),
+             "wall_s": round(r[1], 3), "stages": r[2].get("stages", {})}
+            for t, r in zip(tasks, results)
+        ]
+        stats["threads_per_segment"] = threads
+        stats["scene_cuts"] = sum(r[2].get("scene_cuts", 0) for r in results)
+        stats["static_pairs"] = sum(r[2].get("static_pairs", 0) for r in results)
+    avg_fps = frames / elapsed if elapsed > 0 else 0.0
+    if progress is not None:
+        progress(frames, frames, avg_fps)
+    return avg_fps, frames, fps_in, fps_out, W, H
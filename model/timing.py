@@ -0,0 +1,76 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Tempo por etapa do pipeline (thread-safe: leitura, inferência e gravação
+    rodam em threads diferentes). Guarda total/contagem e uma amostra
+    (reservoir) de até `max_samples` durações por etapa para os percentis.
+    """
+
+    def __init__(self, max_samples=4096):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._total = {}
+        self._count = {}
+        self._max = {}
+        self._samples = {}
+        self._rng = random.Random(0)
+
+    @contextmanager
+    def stage(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t)
+
+    def add(self, name, seconds):
+        with self._lock:
+            n = self._count.get(name, 0) + 1
+            self._count[name] = n
+            self._total[name] = self._total.get(name, 0.0) + seconds
+            self._max[name] = max(self._max.get(name, 0.0), seconds)
+            samples = self._samples.setdefault(name, [])
+            if len(samples) < self.max_samples:
+                samples.append(seconds)
+            else:
+                j = self._rng.randrange(n)
+                if j < self.max_samples:
+                    samples[j] = seconds
+
+    def summary(self):
+        """{etapa: {count, total_s, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}}"""
+        out = {}
+        with self._lock:
+            for name, n in self._count.items():
+                s = sorted(self._samples[name])
+                pct = lambda q: s[min(len(s) - 1, int(q * len(s)))] * 1000.0
+                out[name] = {
+                    "count": n,
+                    "total_s": round(self._total[name], 4),
+                    "mean_ms": round(self._total[name] / n * 1000.0, 3),
+                    "p50_ms": round(pct(0.50), 3),
+                    "p90_ms": round(pct(0.90), 3),
+                    "p99_ms": round(pct(0.99), 3),
+                    "max_ms": round(self._max[name] * 1000.0, 3),
+                }
+        return out
+
+
+class _NullTimer:
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def add(self, name, seconds):
+        pass
+
+    def summary(self):
+        return {}
+
+
+NULL_TIMER = _NullTimer()
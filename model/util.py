@@ -1,30 +1,65 @@
 import torch
 import numpy as np
 import cv2
-from queue import Queue
 from tqdm import tqdm
+from tqdm.std import TqdmDefaultWriteLock
+import os
 import time
 import torch.nn.functional as F
 import threading
+from collections import OrderedDict
 
-_grid_cache = {}
+from model.buffers import BufferPool
+from model.model import FlowField
+from model.queues import JOB_QUEUE_BUDGET, ByteQueue
+from model.timing import NULL_TIMER, StageTimer
+from model.video_io import ffmpeg_available, finalize_fragmented, live_path, open_reader, open_writer
+
+# grade base por (H, W, device, dtype); resoluções novas chegam a cada job,
+# então a menos usada sai quando passa de GRID_CACHE_SIZE entradas
+GRID_CACHE_SIZE = 8
+_grid_cache = OrderedDict()
 _grid_lock = threading.Lock()
 
-def warp(img, flow, f32=True):
-    B, C, H, W = img.shape
-    device, dtype = img.device, img.dtype
-    key = (H, W, device, dtype)
+def _reset_locks_after_fork():
+    # api_jobs roda cada job num filho criado por fork; se uma thread do pai
+    # (ex.: um job local do main.py) segurava um destes locks naquele
+    # instante, o filho travaria no primeiro acquire
+    global _grid_lock
+    _grid_lock = threading.Lock()
+    TqdmDefaultWriteLock.th_lock = threading.RLock()
+    tqdm.set_lock(TqdmDefaultWriteLock())
+
+os.register_at_fork(after_in_child=_reset_locks_after_fork)
 
-    if key not in _grid_cache:
-        with _grid_lock:
-            if key not in _grid_cache:
-                y = torch.linspace(-1, 1, H, device=device, dtype=dtype)
-                x = torch.linspace(-1, 1, W, device=device, dtype=dtype)
-                grid_y, grid_x = torch.meshgrid(y, x, indexing='ij')
-                base = torch.stack((grid_x, grid_y), dim=2)  # (H, W, 2)
-                _grid_cache[key] = base.unsqueeze(0)         # (1, H, W, 2)
+def _grid(H, W, device, dtype):
+    """
+    (grade base (1, H, W, 2) em [-1, 1], fator (4,) que leva dois fluxos em
+    pixels (x, y, x, y) para a mesma escala), do cache LRU.
+    """
+    key = (H, W, device, dtype)
+    with _grid_lock:
+        entry = _grid_cache.get(key)
+        if entry is not None:
+            _grid_cache.move_to_end(key)
+            return entry
+    y = torch.linspace(-1, 1, H, device=device, dtype=dtype)
+    x = torch.linspace(-1, 1, W, device=device, dtype=dtype)
+    grid_y, grid_x = torch.meshgrid(y, x, indexing='ij')
+    base = torch.stack((grid_x, grid_y), dim=2).unsqueeze(0)   # (1, H, W, 2)
+    norm = torch.tensor([2 / (W - 1), 2 / (H - 1)] * 2, device=device, dtype=dtype)
+    with _grid_lock:
+        entry = _grid_cache.setdefault(key, (base, norm))
+        _grid_cache.move_to_end(key)
+        while len(_grid_cache) > GRID_CACHE_SIZE:
+            _grid_cache.popitem(last=False)
+    return entry
 
-    grid = _grid_cache[key].expand(B, -1, -1, -1)  # (B, H, W, 2)
+def warp(img, flow, f32=True):
+    """Amostra `img` deslocado por `flow` (pixels); um warp avulso (a síntese usa _warp_blend)."""
+    B, C, H, W = img.shape
+    base, _ = _grid(H, W, img.device, img.dtype)
+    grid = base.expand(B, -1, -1, -1)  # (B, H, W, 2)
 
     flow_x = flow[:, 0, :, :] / ((W - 1) / 2)
     flow_y = flow[:, 1, :, :] / ((H - 1) / 2)
@@ -32,6 +67,113 @@ def warp(img, flow, f32=True):
     vgrid = grid + flow_norm
     return F.grid_sample(img, vgrid, align_corners=True, padding_mode='border')
 
+def timesteps(multi):
+    """Instantes intermediários t = i/(multi+1), i = 1..multi."""
+    return [(i + 1) / (multi + 1) for i in range(multi)]
+
+def _warp_blend(I0, I1, fn, base, mask, t0, t1, vgrid, out):
+    """
+    Os dois warps e a mistura de B pares em r linhas da saída.
+    I0/I1: (B, 3, H, W) inteiros; fn: (B, r, W, 4) fluxos f01|f10 já
+    normalizados; base: (1, r, W, 2) linhas da grade; mask: (B, 1, r, W);
+    t0/t1: (1, n, 1, 1, 1) com t e 1-t. Os n instantes vão empilhados na
+    altura da grade (vgrid: (2B, n*r, W, 2)), então cada fonte entra uma vez
+    só. out: (2B, 3, n*r, W); devolve a metade de I0, (B, 3, n, r, W), com
+    (I0*m + I1*(1-m)) * 255 escrito por cima (a escala dos bytes, só na faixa).
+    """
+    B, r, W = fn.shape[:3]
+    n = t0.shape[1]
+    g = vgrid.view(2, B, n, r, W, 2)
+    torch.addcmul(base, fn[:, None, ..., :2], t0, out=g[0])
+    torch.addcmul(base, fn[:, None, ..., 2:], t1, out=g[1])
+    # interpolation_mode=0 (bilinear), padding_mode=1 (border)
+    torch.ops.aten.grid_sampler_2d.out(I0, vgrid[:B], 0, 1, True, out=out[:B])
+    torch.ops.aten.grid_sampler_2d.out(I1, vgrid[B:], 0, 1, True, out=out[B:])
+    w = out.view(2, B, 3, n, r, W)
+    return torch.lerp(w[1], w[0], mask[:, :, None], out=w[0]).mul_(255.0)
+
+# temporários da síntese por lote; acima disso ela vai em faixas de linhas
+SYNTH_MEM_BUDGET = int(os.environ.get("DUPLICAJA_SYNTH_MEM", 1024 ** 3))
+
+def synth_bytes(B, n, H, W):
+    """Temporários da síntese de H linhas: fluxo (4), máscara (1) e fluxo normalizado (4), e grade (4) e amostras (6) por instante."""
+    return (9 + 10 * n) * B * H * W * 4
+
+def memory_format_of(t):
+    """torch.channels_last se o tensor 4D `t` está nesse layout (NHWC na memória), senão contiguous_format."""
+    if t.dim() == 4 and not t.is_contiguous() and t.is_contiguous(memory_format=torch.channels_last):
+        return torch.channels_last
+    return torch.contiguous_format
+
+def synthesize(I0, I1, field, ts, pool=None, timer=None, max_mem=None):
+    """
+    Gera os quadros intermediários de B pares a partir de UM fluxo por par.
+    I0/I1: (B, 3, H, W); field: model.model.FlowField com o fluxo e a
+    máscara dos pares em (H, W), gerados por faixa de linhas.
+    A saída vai em faixas horizontais: para cada faixa o campo gera as
+    linhas dela e os dois warps de todos os pares e instantes `ts` saem de um
+    grid_sample só (_warp_blend) sobre I0/I1 inteiros, então nenhuma faixa
+    precisa de margem para o fluxo. Todos os temporários vêm de `pool`; com
+    I0/I1 em channels_last as amostras também ficam nesse layout, e a cópia
+    para os arrays HWC vira só a conversão para uint8 (sem transpor).
+    Retorna B listas de arrays HWC uint8 (RGB) do pool, na ordem de `ts`.
+    max_mem: teto (bytes, synth_bytes) dos temporários de cada faixa; None
+    faz o quadro todo numa faixa só. Qualquer altura de faixa dá a mesma
+    saída, bit a bit: cada linha do campo e da saída só depende dos índices
+    dela e de I0/I1.
+    """
+    pool = pool or BufferPool(I0.device)
+    timer = timer or NULL_TIMER
+    B, _, H, W = I0.shape
+    n = len(ts)
+    rows = H
+    if max_mem:
+        rows = int(max(1, min(H, max_mem // synth_bytes(B, n, 1, W))))
+    base, norm = _grid(H, W, I0.device, I0.dtype)
+    t0 = torch.tensor(ts, device=I0.device, dtype=I0.dtype).view(1, n, 1, 1, 1)
+    t1 = torch.tensor([1 - t for t in ts], device=I0.device, dtype=I0.dtype).view(1, n, 1, 1, 1)
+    imgs = [[pool.array((H, W, 3)) for _ in ts] for _ in range(B)]
+
+    for y0 in range(0, H, rows):
+        y1 = min(H, y0 + rows)
+        r = y1 - y0
+        flow   = pool.tensor((B, 4, r, W), I0.dtype)
+        mask   = pool.tensor((B, 1, r, W), I0.dtype)
+        fn     = pool.tensor((B, r, W, 4), I0.dtype)
+        vgrid  = pool.tensor((2 * B, n * r, W, 2), I0.dtype)
+        warped = pool.tensor((2 * B, 3, n * r, W), I0.dtype, memory_format_of(I0))
+        with timer.stage("upsample"):
+            field.rows(y0, y1, flow, mask)
+        with timer.stage("warp"):
+            torch.mul(flow.permute(0, 2, 3, 1), norm, out=fn)
+            out = _warp_blend(I0, I1, fn, base[:, None, y0:y1], mask, t0, t1, vgrid, warped)
+        with timer.stage("to_bytes"):
+            for b in range(B):
+                for k in range(n):
+                    # float -> uint8 trunca como .byte()
+                    torch.from_numpy(imgs[b][k])[y0:y1].copy_(out[b, :, k].permute(1, 2, 0))
+        for buf in (flow, mask, fn, vgrid, warped):
+            pool.release(buf)
+    return imgs
+
+# ---- lote de pares (CPU gosta de lotes maiores) ----
+BATCH_MEM_BUDGET = 1024 ** 3   # bytes de tensores por lote
+MAX_BATCH = 8
+
+def auto_batch_size(H, W, multi, mem_budget=BATCH_MEM_BUDGET, max_batch=MAX_BATCH, synth_mem=None, down=1.0):
+    """
+    Escolhe quantos pares processar por chamada do modelo a partir da
+    resolução e do orçamento de memória. Por par (float32) ficam o quadro
+    (3 x H*W) e, na escala `down`, o quadro pequeno (3) e o fluxo (4) e a
+    máscara (1) do FlowField. Com a síntese em faixas (`synth_mem`) os
+    temporários dela ficam em synth_mem, fora da conta por par; sem faixas
+    entram os do quadro inteiro (synth_bytes).
+    """
+    per_pair = (3 + 8 * down * down) * H * W * 4
+    if not synth_mem:
+        per_pair += synth_bytes(1, max(multi, 1), H, W)
+    return int(max(1, min(max_batch, mem_budget // max(per_pair, 1))))
+
 def flow2rgb(flow):
     npf = flow.detach().cpu().numpy().transpose(1,2,3,0)[...,0]
     h,w,_,_ = flow.permute(0,2,3,1).shape
@@ -42,115 +184,337 @@ def flow2rgb(flow):
     rgb[...,2] += norm[...,1]
     return np.clip(rgb,0,1)
 
-def clear_write_buffer(write_buffer, vid_writer, cancel_event=None):
+def clear_write_buffer(write_buffer, vid_writer, cancel_event=None, pool=None, timer=None):
+    timer = timer or NULL_TIMER
     while True:
-        if cancel_event is not None and cancel_event.is_set():
-            break
         frame = write_buffer.get()
         if frame is None:
             break
-        vid_writer.write(frame[:, :, ::-1])
+        # cancelado: continua drenando (sem gravar) para o produtor não travar no put()
+        if cancel_event is None or not cancel_event.is_set():
+            with timer.stage("encode"):
+                vid_writer.write(frame)   # writers recebem RGB
+        if pool is not None:
+            pool.release(frame)   # quadro consumido: volta para o pool
 
-def build_read_buffer(read_buffer, path, cancel_event=None):
-    cap = cv2.VideoCapture(path)
+def build_read_buffer(read_buffer, path, cancel_event=None, pool=None, backend="cv2", shape=None, timer=None,
+                      start=0, count=None):
+    timer = timer or NULL_TIMER
+    if shape is None:
+        cap = cv2.VideoCapture(path)
+        shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+        cap.release()
+    H, W = shape[:2]
+    reader = open_reader(path, W, H, backend=backend, start=start, count=count)
     try:
         while True:
             if cancel_event is not None and cancel_event.is_set():
                 break
-            ret, frame = cap.read()
-            if not ret:
+            rgb = pool.array(shape) if pool is not None else np.empty(shape, np.uint8)
+            with timer.stage("decode"):
+                ok = reader.read_into(rgb)
+            if not ok:
+                if pool is not None:
+                    pool.release(rgb)
                 break
-            read_buffer.put(frame[:, :, ::-1].copy())
+            if not read_buffer.put(rgb):
+                break   # o consumidor fechou a fila (cancelado)
     finally:
-        cap.release()
+        reader.release()
         read_buffer.put(None)
 
+def _fill_stats(stats, read_buffer, write_buffer, pool, timer):
+    if stats is None:
+        return
+    stats["stages"] = timer.summary()
+    stats["queues"] = {"read": read_buffer.stats(), "write": write_buffer.stats()}
+    stats["pool"] = pool.stats()
+
+# ---- detecção de corte de cena ----
+SCENE_CUT_THRESHOLD = 0.5   # distância de histograma (0..1) acima da qual o par é um corte
+SCENE_HIST_BINS = 32
+
+def frame_histogram(small):
+    """
+    Histogramas RGB normalizados (3, bins) de um quadro pequeno (3, h, w) em
+    [0, 1]. Usa um pixel a cada 2x2 e um único bincount (histc por canal
+    custava ~6x mais); para comparar distribuições isso basta.
+    """
+    q = small[:, ::2, ::2].mul(SCENE_HIST_BINS - 1e-3).long()
+    q += torch.arange(0, 3 * SCENE_HIST_BINS, SCENE_HIST_BINS, device=q.device).view(3, 1, 1)
+    h = torch.bincount(q.flatten(), minlength=3 * SCENE_HIST_BINS).view(3, SCENE_HIST_BINS).float()
+    return h / h.sum(dim=1, keepdim=True).clamp_min(1)
+
+def histogram_distance(h0, h1):
+    """Metade da distância L1 entre histogramas, média dos canais: 0 = iguais, 1 = disjuntos."""
+    return float((h0 - h1).abs().sum(dim=1).mean()) / 2
+
+# ---- pares parados (tela gravada, slides) ----
+STATIC_THRESHOLD = 0.01   # maior diferença média por bloco (0..1) abaixo da qual o par é "parado"
+STATIC_BLOCK = 8          # lado do bloco, em pixels do quadro pequeno
+
+def pair_motion(A, B, block=STATIC_BLOCK):
+    """
+    Movimento de cada par (N,): a maior diferença absoluta média entre
+    blocos block×block. Pelo bloco (e não pela média do quadro) um objeto
+    pequeno andando, como um cursor, não passa por quadro parado.
+    """
+    d = (A - B).abs().mean(dim=1, keepdim=True)
+    return F.adaptive_max_pool2d(F.avg_pool2d(d, block, ceil_mode=True), 1).flatten()
+
+def _copy_frame(frame, pool):
+    # cópia do pool: o writer devolve cada array ao pool depois de gravar
+    arr = pool.array(frame.shape)
+    np.copyto(arr, frame)
+    return arr
+
+class FrameState:
+    """
+    Um quadro decodificado já preparado: array RGB original + tensores
+    normalizados (pequeno e full-res). Cada quadro é redimensionado e
+    convertido uma única vez; o último do lote segue para o próximo.
+    `hist` (detecção de corte) é calculado sob demanda e também segue.
+    """
+    __slots__ = ("frame", "small", "orig", "hist")
+
+    def __init__(self, frame, small, orig, hist=None):
+        self.frame = frame
+        self.small = small
+        self.orig  = orig
+        self.hist  = hist
+
+    @classmethod
+    def prepare(cls, frame, small_out, orig_out, scratch, timer=NULL_TIMER):
+        """
+        Redimensiona/normaliza `frame` direto nos tensores de destino. Com
+        destinos em channels_last (fatias de um lote NHWC) a cópia é linear.
+        """
+        h_s, w_s = scratch.shape[:2]
+        with timer.stage("resize"):
+            cv2.resize(frame, (w_s, h_s), dst=scratch, interpolation=cv2.INTER_AREA)
+        with timer.stage("upload"):
+            small_out.copy_(torch.from_numpy(scratch).permute(2,0,1)).div_(255.)
+            orig_out.copy_(torch.from_numpy(frame).permute(2,0,1)).div_(255.)
+        return cls(frame, small_out, orig_out)
+
 @torch.inference_mode()
-def interpolate_video(in_path, out_path, multi=1, fps_override=None, down=0.25, model=None, device=None, cancel_event=None):
-    """Executa a interpolação e grava em out_path. Retorna (avg_fps, frames_gerados)."""
+def interpolate_video(in_path, out_path, multi=1, fps_override=None, down=0.25, model=None, device=None, cancel_event=None,
+                      batch_size=None, pool=None, writer="auto", audio_path=None, reader="cv2",
+                      queue_budget=None, stats=None, start_frame=0, end_frame=None, write_last=True,
+                      progress=None, live=False, scene_threshold=SCENE_CUT_THRESHOLD,
+                      static_threshold=STATIC_THRESHOLD, synth_mem=SYNTH_MEM_BUDGET):
+    """
+    Executa a interpolação e grava em out_path. Retorna (avg_fps, frames_gerados).
+    batch_size: pares por chamada do modelo (None = automático por resolução/memória).
+    pool: BufferPool do job (criado se None); `pool.stats()` mostra as alocações.
+    writer: "ffmpeg" (H.264 web-safe direto, com o áudio de `audio_path`),
+            "cv2" (mp4v, fallback) ou "auto".
+    reader: decodificador da entrada — "cv2", "ffmpeg" (rawvideo rgb24 direto
+            nos buffers do pool) ou "auto".
+    queue_budget: bytes das filas de leitura+gravação deste job (metade cada);
+            também valem os limites do processo (model.queues).
+    stats: dict opcional preenchido com o tempo por etapa ("stages": total e
+            percentis de decode, resize, upload, scene, inference, upsample,
+            warp, to_bytes, read_wait, write_wait, encode) e contadores das
+            filas e do pool. "inference" vai até o FlowField (resolução dos
+            Upsample); "upsample" é a reamostragem dele até (H, W), faixa a
+            faixa dentro da síntese; "warp" inclui a mistura (_warp_blend).
+    Um `model` com memory_format = torch.channels_last (precisão "bf16" de
+    model.quantized) recebe os quadros nesse layout, do upload aos bytes.
+    start_frame/end_frame: trecho (inclusivo) da entrada a interpolar;
+    write_last=False omite o último quadro original (ele abre o próximo
+    segmento quando o vídeo é dividido — ver model.segments).
+    progress: callable(quadros_gravados, total_previsto, fps) chamado a cada
+            lote e no fim (ex.: model.progress.SharedProgress).
+    live: grava primeiro um MP4 fragmentado em video_io.live_path(out_path),
+            que já pode ser servido enquanto cresce, e no fim o remuxa para
+            out_path (sem re-encode). Exige ffmpeg; sem ele é ignorado.
+    scene_threshold: pares cuja distância de histograma (quadros pequenos)
+            passa disto são cortes de cena: sem inferência nem warp, os
+            intermediários repetem o quadro mais próximo. None/0 desliga.
+            Os pares pulados vão para stats["scene_cuts"].
+    static_threshold: pares quase idênticos (pair_motion abaixo disto) também
+            pulam o modelo e repetem o quadro; contados em
+            stats["static_pairs"]. None/0 desliga.
+    synth_mem: teto (bytes) dos temporários da síntese por lote (fluxo e
+            máscara em (H, W), warp e blend); acima dele ela vai em faixas de
+            linhas, com saída idêntica. None faz o quadro inteiro de uma vez.
+    """
 
     # (2) propriedades do vídeo
     cap_tmp = cv2.VideoCapture(in_path)
     W = int(cap_tmp.get(cv2.CAP_PROP_FRAME_WIDTH))
     H = int(cap_tmp.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps_in = cap_tmp.get(cv2.CAP_PROP_FPS)
+    n_in = int(cap_tmp.get(cv2.CAP_PROP_FRAME_COUNT) or 0) - start_frame
     cap_tmp.release()
+    if end_frame is not None:
+        n_in = end_frame - start_frame + 1
+    total_out = max(0, n_in - 1) * (multi + 1) + (1 if write_last else 0)
 
     fps_out = fps_override or (fps_in * (multi + 1))
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    vid_writer = cv2.VideoWriter(out_path, fourcc, fps_out, (W, H))
+    live = live and writer != "cv2" and ffmpeg_available()
+    if live:
+        vid_writer = open_writer(live_path(out_path), fps_out, W, H, backend="fmp4", audio_path=audio_path)
+    else:
+        vid_writer = open_writer(out_path, fps_out, W, H, backend=writer, audio_path=audio_path)
 
     # (3) threads de leitura/gravação
     from _thread import start_new_thread
-    read_buffer  = Queue(maxsize=100)
-    write_buffer = Queue(maxsize=100)
-    start_new_thread(build_read_buffer, (read_buffer, in_path, cancel_event))
-    start_new_thread(clear_write_buffer, (write_buffer, vid_writer, cancel_event))
+    queue_budget = queue_budget or JOB_QUEUE_BUDGET
+    read_buffer  = ByteQueue(queue_budget // 2)
+    write_buffer = ByteQueue(queue_budget // 2)
+    pool = pool or BufferPool(device)
+    timer = StageTimer() if stats is not None else NULL_TIMER
+    count = None if end_frame is None else max(0, end_frame - start_frame + 1)
+    start_new_thread(build_read_buffer, (read_buffer, in_path, cancel_event, pool, reader, (H, W, 3), timer,
+                                         start_frame, count))
+    writer_thread = threading.Thread(target=clear_write_buffer, args=(write_buffer, vid_writer, cancel_event, pool, timer), daemon=True)
+    writer_thread.start()
 
     pbar = tqdm(unit='frames', desc='Interpolando', leave=False)
-    last = read_buffer.get()
-    if last is None:
+    with timer.stage("read_wait"):
+        first = read_buffer.get()
+    if first is None:
+        write_buffer.put(None)
+        writer_thread.join()
         vid_writer.release()
-        return 0.0, 0
+        _fill_stats(stats, read_buffer, write_buffer, pool, timer)
+        if stats is not None:
+            stats["scene_cuts"] = stats["static_pairs"] = 0
+        return 0.0, 0, fps_in, fps_out, W, H
+
+    batch_size = max(1, int(batch_size)) if batch_size else auto_batch_size(H, W, multi, synth_mem=synth_mem, down=down)
+    h_s, w_s = int(H * down), int(W * down)
+    scale = H / float(h_s)
+    # janelas [last, f1..fN] em buffers do pool; alternam a cada lote
+    scratch = pool.array((h_s, w_s, 3))
+    # layout dos quadros: channels_last para modelos que pedem (Bf16FlowNet),
+    # e aí o upload HWC -> tensor e a volta para bytes não transpõem nada
+    fmt = getattr(model, "memory_format", torch.contiguous_format)
+    X_small = pool.tensor((batch_size + 1, 3, h_s, w_s), memory_format=fmt)
+    X_orig  = pool.tensor((batch_size + 1, 3, H, W), memory_format=fmt)
+    last = FrameState.prepare(first, X_small[0], X_orig[0], scratch, timer)
 
+    ts = timesteps(multi)
+    # modelos sem inference_field (ex.: um FlowNet de fora deste pacote): a saída
+    # de inference() vira o FlowField, reamostrada por faixa do mesmo jeito
+    to_field = getattr(model, "inference_field", None)
     frame_count = 0
+    scene_cuts = static_pairs = 0
     start = time.time()
+    eof = False
 
-    while True:
-        if cancel_event is not None and cancel_event.is_set():
-            break
-
-        cur = read_buffer.get()
-        if cur is None:
-            write_buffer.put(last)
-            frame_count += 1
-            break
-
-        h_s, w_s = int(H * down), int(W * down)
-        last_s = cv2.resize(last, (w_s, h_s), interpolation=cv2.INTER_AREA)
-        cur_s  = cv2.resize(cur,  (w_s, h_s), interpolation=cv2.INTER_AREA)
-
-        I0_small = torch.from_numpy(last_s.transpose(2,0,1))[None].to(device).float() / 255.
-        I1_small = torch.from_numpy(cur_s .transpose(2,0,1))[None].to(device).float() / 255.
-        I0_orig  = torch.from_numpy(last .transpose(2,0,1))[None].to(device).float() / 255.
-        I1_orig  = torch.from_numpy(cur  .transpose(2,0,1))[None].to(device).float() / 255.
-
-        write_buffer.put(last)
-        frame_count += 1
-
-        for i in range(multi):
+    try:
+        while not eof:
             if cancel_event is not None and cancel_event.is_set():
                 break
 
-            t = (i+1) / (multi+1)
-            flow_small, mask_small = model.inference(I0_small, I1_small)
+            # junta até batch_size pares consecutivos: [last, f1, ..., fN]
+            window = [last]
+            while len(window) <= batch_size:
+                with timer.stage("read_wait"):
+                    cur = read_buffer.get()
+                if cur is None:
+                    eof = True
+                    break
+                k = len(window)
+                window.append(FrameState.prepare(cur, X_small[k], X_orig[k], scratch, timer))
 
-            scale = H / float(h_s)
-            flow_up = F.interpolate(flow_small, size=(H, W), mode='bilinear', align_corners=True) * scale
-            mask_up = F.interpolate(mask_small, size=(H, W), mode='bilinear', align_corners=True)
+            n_pairs = len(window) - 1
+            mids = [[] for _ in range(n_pairs)]
+            static, cuts = [], []
+            if n_pairs > 0 and multi > 0 and (static_threshold or scene_threshold):
+                with timer.stage("scene"):
+                    if static_threshold:
+                        motion = pair_motion(X_small[:n_pairs], X_small[1:n_pairs + 1]).tolist()
+                        static = [k for k in range(n_pairs) if motion[k] < static_threshold]
+                    if scene_threshold:
+                        for st in window:
+                            if st.hist is None:
+                                st.hist = frame_histogram(st.small)
+                        cuts = [k for k in range(n_pairs) if k not in static and
+                                histogram_distance(window[k].hist, window[k + 1].hist) > scene_threshold]
+                static_pairs += len(static)
+                scene_cuts += len(cuts)
+            skip = static + cuts
+            keep = [k for k in range(n_pairs) if k not in skip]
+            if keep and multi > 0:
+                # uma inferência e um warp para os pares do lote que não são corte
+                n = len(keep)
+                if n == n_pairs:
+                    A, B = X_small[:n], X_small[1:n + 1]
+                    O0, O1 = X_orig[:n], X_orig[1:n + 1]
+                else:
+                    idx = torch.tensor(keep, device=X_small.device)
+                    A, B = X_small[idx], X_small[idx + 1]
+                    O0, O1 = X_orig[idx], X_orig[idx + 1]
+                # o fluxo em (H, W) só existe faixa a faixa, dentro da síntese
+                with timer.stage("inference"):
+                    if to_field is not None:
+                        field = to_field(A, B, H, W, scale=scale)
+                    else:
+                        flow_small, mask_small = model.inference(A, B)
+                        field = FlowField(flow_small * scale, mask_small, H, W)
+                for k, row in zip(keep, synthesize(O0, O1, field, ts, pool=pool, timer=timer, max_mem=synth_mem)):
+                    mids[k] = row
+            for k in skip:
+                # parado: copiar já é o resultado; corte: misturar as cenas criaria
+                # fantasmas. Nos dois casos repete o quadro mais próximo no tempo
+                mids[k] = [_copy_frame(window[k].frame if t < 0.5 else window[k + 1].frame, pool) for t in ts]
 
-            f01 = flow_up[:, :2] * t
-            f10 = flow_up[:, 2:] * (1 - t)
+            # devolve na ordem de saída: quadro original seguido dos intermediários
+            with timer.stage("write_wait"):
+                for k in range(n_pairs):
+                    write_buffer.put(window[k].frame)
+                    frame_count += 1
+                    for img in mids[k]:
+                        write_buffer.put(img)
+                        frame_count += 1
+            pbar.update(n_pairs * (1 + multi))
+            if progress is not None:
+                elapsed = time.time() - start
+                progress(frame_count, total_out, frame_count / elapsed if elapsed > 0 else 0.0)
 
-            w0 = warp(I0_orig, f01)
-            w1 = warp(I1_orig, f10)
-            out = w0 * mask_up + w1 * (1 - mask_up)
-
-            img_tensor = (out * 255.0).byte()
-            img = img_tensor[0].detach().cpu().permute(1,2,0).numpy()
-
-            write_buffer.put(img)
-            frame_count += 1
-
-        last = cur
-        pbar.update(1 + multi)
+            # o estado do último quadro (já convertido) abre o próximo lote,
+            # copiado para o slot 0 da outra janela
+            if n_pairs > 0:
+                next_small = pool.tensor(X_small.shape, memory_format=fmt)
+                next_orig  = pool.tensor(X_orig.shape, memory_format=fmt)
+                next_small[0].copy_(window[-1].small)
+                next_orig[0].copy_(window[-1].orig)
+                pool.release(X_small); pool.release(X_orig)
+                X_small, X_orig = next_small, next_orig
+                last = FrameState(window[-1].frame, X_small[0], X_orig[0], window[-1].hist)
+            if eof and write_last:
+                write_buffer.put(last.frame)
+                frame_count += 1
+    finally:
+        # cancelado (ou erro) no meio: o leitor pode estar parado no put(); fechar
+        # a fila o acorda e devolve ao orçamento do processo os quadros que sobraram
+        read_buffer.close()
 
     pbar.close()
     end = time.time()
     avg_fps = frame_count / (end - start) if end > start else 0.0
+    if progress is not None:
+        progress(frame_count, frame_count if eof else total_out, avg_fps)
+
+    for buf in (scratch, X_small, X_orig):
+        pool.release(buf)
 
+    # espera o writer esvaziar a fila antes de fechar o arquivo
     write_buffer.put(None)
-    time.sleep(0.5)
+    writer_thread.join()
     vid_writer.release()
+    if live:
+        if cancel_event is None or not cancel_event.is_set():
+            finalize_fragmented(live_path(out_path), out_path)
+        # quem já está lendo o arquivo ao vivo segue com o descritor aberto
+        os.unlink(live_path(out_path))
+    _fill_stats(stats, read_buffer, write_buffer, pool, timer)
+    if stats is not None:
+        stats["scene_cuts"] = scene_cuts
+        stats["static_pairs"] = static_pairs
 
     return avg_fps, frame_count, fps_in, fps_out, W, H
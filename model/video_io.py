@@ -0,0 +1,333 @@
+import bisect
+import functools
+import os
+import shutil
+import subprocess
+import time
+import weakref
+from fractions import Fraction
+
+import cv2
+import numpy as np
+
+
+# pipes de ffmpeg abertos neste processo. Um filho criado por fork herda as
+# pontas do pai: se ficasse com a ponta de escrita do stdin de um encoder, o
+# ffmpeg do pai só veria EOF quando o filho terminasse
+_PIPED = weakref.WeakSet()
+
+def _close_inherited_pipes():
+    for proc in list(_PIPED):
+        for f in (proc.stdin, proc.stdout, proc.stderr):
+            if f is not None:
+                try:
+                    f.close()
+                except Exception:
+                    pass
+    _PIPED.clear()
+
+os.register_at_fork(after_in_child=_close_inherited_pipes)
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def count_frames(path):
+    """Total de quadros declarado pelo container (pode ser aproximado)."""
+    cap = cv2.VideoCapture(str(path))
+    n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+    return max(0, n)
+
+
+# ============================ Leitura ============================
+READERS = ("cv2", "ffmpeg", "auto")
+_NOPTS = -(1 << 63)   # AV_NOPTS_VALUE, como o framecrc imprime um pacote sem pts
+SEEK_BACKOFF_S = (0.0, 1.0, 4.0)   # quanto antes do alvo o Cv2Reader mira a cada tentativa de seek
+
+
+def frame_times(path):
+    """
+    pts (s, na escala do container) de cada quadro de vídeo, em ordem de
+    apresentação, para achar o quadro N por tempo em vez de decodificar os N
+    anteriores. Só faz o demux (-c copy para o muxer framecrc), sem decodificar.
+    None sem ffmpeg ou se algum pacote não tem pts (ex.: AVI com B-frames).
+    """
+    if not ffmpeg_available():
+        return None
+    st = os.stat(path)
+    return _frame_times(str(path), st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=8)
+def _frame_times(path, mtime_ns, size):
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-copyts", "-i", path,
+           "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    tb, pts = None, []
+    for line in proc.stdout.splitlines():
+        if line.startswith("#tb 0:"):
+            tb = Fraction(line.split(":", 1)[1].strip())
+        elif line and not line.startswith("#"):
+            pts.append(int(line.split(",")[2]))
+    if proc.returncode != 0 or tb is None or not pts or _NOPTS in pts:
+        return None
+    return tuple(float(p * tb) for p in sorted(pts))
+
+
+class Cv2Reader:
+    """
+    Decodifica com OpenCV (BGR) e copia invertendo para RGB.
+    `start`/`count` limitam a um trecho. Até `start` o reader pula por tempo
+    (_seek) e confere pelo pts onde caiu; se não der para confirmar, avança
+    com grab() quadro a quadro (exato, mas decodifica todo o começo).
+    """
+    backend = "cv2"
+
+    def __init__(self, path, W, H, size=None, start=0, count=None):
+        self._cap = cv2.VideoCapture(str(path))
+        self._size = size
+        self._left = count
+        if start and not self._seek(path, start):
+            self._cap.release()
+            self._cap = cv2.VideoCapture(str(path))
+            for _ in range(start):
+                if not self._cap.grab():
+                    break
+
+    def _seek(self, path, start):
+        # o seek do OpenCV (CAP_PROP_POS_MSEC/POS_FRAMES) não é exato: mira o
+        # quadro start-1 e descobre qual quadro veio pelo pts dele
+        times = frame_times(path)
+        if times is None or start >= len(times) or not self._cap.grab():
+            return False
+        # CAP_PROP_POS_MSEC conta do início do stream; o quadro 0 dá a origem
+        origin = self._cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 - times[0]
+        # o OpenCV converte o tempo em quadro pelo fps médio: em VFR pode
+        # passar do alvo, então tenta de novo mirando mais cedo
+        for back in SEEK_BACKOFF_S:
+            self._cap.set(cv2.CAP_PROP_POS_MSEC, (times[start - 1] - times[0] - back) * 1000)
+            if not self._cap.grab():
+                return False
+            at = self._cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 - origin
+            i = bisect.bisect_left(times, at - 1e-3)
+            if i >= len(times) or abs(times[i] - at) > 1e-3:
+                return False   # pts que não é de quadro: não dá para saber onde está
+            if i < start:
+                break
+        else:
+            return False
+        for _ in range(start - 1 - i):
+            if not self._cap.grab():
+                return False
+        return True
+
+    def read_into(self, out):
+        if self._left is not None:
+            if self._left <= 0:
+                return False
+            self._left -= 1
+        ret, frame = self._cap.read()
+        if not ret:
+            return False
+        if self._size is not None:
+            frame = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+        np.copyto(out, frame[:, :, ::-1])
+        return True
+
+    def release(self):
+        self._cap.release()
+
+
+class FFmpegReader:
+    """
+    Decodifica com ffmpeg direto para rgb24 (`-f rawvideo`) e faz `readinto`
+    no array de destino: o quadro chega em ordem RGB sem cópia extra.
+    `size=(w, h)` já entrega o quadro reduzido (escala `area` do ffmpeg).
+    `start`/`count` limitam a um trecho por índice de quadro: com os pts
+    (frame_times) o ffmpeg pula até o keyframe anterior a `start` e o filtro
+    select corta exato pelo pts; sem eles, select por índice decodifica o começo.
+    """
+    backend = "ffmpeg"
+
+    def __init__(self, path, W, H, size=None, start=0, count=None):
+        cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+        filters = []
+        times = frame_times(path) if start else None
+        if times is not None and start < len(times):
+            # -copyts mantém os pts do container, então o corte no meio do
+            # intervalo entre start-1 e start não depende de onde o seek caiu.
+            # -ss conta do início do arquivo (<= times[0]): o seek só pode cair antes
+            mid = (times[start - 1] + times[start]) / 2
+            cmd += ["-copyts", "-noaccurate_seek", "-ss", f"{mid - times[0]:.6f}"]
+            filters.append(f"select=gte(t\\,{mid:.6f})")
+        elif start:
+            filters.append(f"select=gte(n\\,{int(start)})")
+        cmd += ["-i", str(path)]
+        if size is not None:
+            filters.append(f"scale={size[0]}:{size[1]}:flags=area")
+        if filters:
+            cmd += ["-vf", ",".join(filters)]
+        if count is not None:
+            cmd += ["-frames:v", str(int(count))]
+        cmd += ["-vsync", "0", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        _PIPED.add(self._proc)
+
+    def read_into(self, out):
+        view = memoryview(out).cast("B")
+        got = 0
+        while got < len(view):
+            n = self._proc.stdout.readinto(view[got:])
+            if not n:
+                return False   # EOF (quadro parcial é descartado)
+            got += n
+        return True
+
+    def release(self):
+        try:
+            self._proc.stdout.close()
+        except Exception:
+            pass
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.wait()
+
+
+def open_reader(path, W, H, backend="cv2", size=None, start=0, count=None):
+    """backend: "cv2" | "ffmpeg" | "auto" (ffmpeg se estiver no PATH)."""
+    if backend == "auto":
+        backend = "ffmpeg" if ffmpeg_available() else "cv2"
+    if backend == "ffmpeg":
+        return FFmpegReader(path, W, H, size=size, start=start, count=count)
+    return Cv2Reader(path, W, H, size=size, start=start, count=count)
+
+
+def measure_decode_fps(path, backend="cv2", size=None, max_frames=None):
+    """Quadros/s decodificados (em RGB, num buffer reaproveitado) por um backend."""
+    cap = cv2.VideoCapture(str(path))
+    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    w, h = size or (W, H)
+    buf = np.empty((h, w, 3), np.uint8)
+    reader = open_reader(path, W, H, backend=backend, size=size)
+    n = 0
+    start = time.perf_counter()
+    try:
+        while (max_frames is None or n < max_frames) and reader.read_into(buf):
+            n += 1
+    finally:
+        reader.release()
+    elapsed = time.perf_counter() - start
+    return n / elapsed if elapsed > 0 else 0.0
+
+
+# ============================ Gravação ============================
+FRAGMENT_SECONDS = 2.0   # duração de cada fragmento no modo fmp4 (atraso até o 1º quadro tocar)
+LIVE_SUFFIX = ".live.mp4"
+
+
+def live_path(out_path):
+    """Onde o modo progressivo grava o MP4 fragmentado de `out_path`."""
+    return str(out_path) + LIVE_SUFFIX
+
+class Cv2Writer:
+    """Fallback sem ffmpeg: mp4v via OpenCV (sem áudio, sem faststart)."""
+    backend = "cv2"
+    web_ready = False
+
+    def __init__(self, out_path, fps, W, H):
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self._w = cv2.VideoWriter(out_path, fourcc, fps, (W, H))
+
+    def write(self, frame):
+        # recebe RGB; o OpenCV espera BGR
+        self._w.write(frame[:, :, ::-1])
+
+    def release(self):
+        self._w.release()
+
+
+class FFmpegWriter:
+    """
+    Manda quadros RGB crus por pipe para UM processo ffmpeg que já gera o
+    arquivo final: H.264/yuv420p com faststart e, se `audio_path` for dado,
+    a trilha de áudio do original mapeada no mesmo passo.
+
+    fragmented=True grava MP4 fragmentado (moov vazio no início, um
+    fragmento por keyframe a cada ~FRAGMENT_SECONDS), que o navegador já
+    toca enquanto o arquivo cresce; finalize_fragmented() gera depois o MP4
+    normal com faststart, sem re-encode.
+    """
+    backend = "ffmpeg"
+    web_ready = True
+
+    def __init__(self, out_path, fps, W, H, audio_path=None, crf=23, preset="veryfast", fragmented=False):
+        cmd = [
+            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{W}x{H}", "-framerate", f"{fps}",
+            "-i", "-",
+        ]
+        if audio_path:
+            cmd += ["-i", str(audio_path), "-map", "0:v:0", "-map", "1:a?", "-c:a", "aac", "-b:a", "128k", "-shortest"]
+        cmd += [
+            # libx264/yuv420p exige dimensões pares
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", preset, "-crf", str(crf),
+        ]
+        if fragmented:
+            gop = max(1, round(fps * FRAGMENT_SECONDS))
+            cmd += ["-g", str(gop), "-keyint_min", str(gop), "-flush_packets", "1",
+                    "-movflags", "+frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"]
+        else:
+            cmd += ["-movflags", "+faststart"]
+        cmd.append(str(out_path))
+        self.out_path = str(out_path)
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        _PIPED.add(self._proc)
+        self._broken = False
+
+    def write(self, frame):
+        if self._broken:
+            return
+        try:
+            self._proc.stdin.write(memoryview(np.ascontiguousarray(frame)))
+        except (BrokenPipeError, OSError):
+            # o ffmpeg morreu; o erro real aparece em release()
+            self._broken = True
+
+    def release(self):
+        try:
+            self._proc.stdin.close()
+        except Exception:
+            pass
+        err = self._proc.stderr.read().decode("utf-8", "replace").strip()
+        code = self._proc.wait()
+        if code != 0:
+            raise RuntimeError(f"ffmpeg terminou com código {code}: {err}")
+
+
+def finalize_fragmented(live_path, out_path):
+    """MP4 fragmentado -> MP4 normal com faststart (só remux, -c copy)."""
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", str(live_path),
+           "-map", "0", "-c", "copy", "-movflags", "+faststart", str(out_path)]
+    proc = subprocess.run(cmd, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        err = proc.stderr.decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg (remux) terminou com código {proc.returncode}: {err}")
+
+
+def open_writer(out_path, fps, W, H, backend="auto", audio_path=None):
+    """
+    backend: "ffmpeg" | "fmp4" (ffmpeg com MP4 fragmentado, para tocar
+    enquanto cresce) | "cv2" | "auto" (ffmpeg se estiver no PATH).
+    O writer devolvido expõe `.backend` e `.web_ready` (arquivo final já
+    pronto para o navegador, sem re-encode).
+    """
+    if backend == "auto":
+        backend = "ffmpeg" if ffmpeg_available() else "cv2"
+    if backend in ("ffmpeg", "fmp4"):
+        return FFmpegWriter(out_path, fps, W, H, audio_path=audio_path, fragmented=backend == "fmp4")
+    return Cv2Writer(out_path, fps, W, H)
@@ -0,0 +1,256 @@
+# scheduler.py
+"""
+Escalonador único para os jobs das duas APIs (main.py e api_jobs.py).
+Um pool fixo de MAX_WORKERS threads consome uma fila única; cada job que
+começa recebe `threads` threads do torch (núcleos / workers), então a soma
+nunca passa da máquina, por maior que seja a rajada de submissões.
+
+Ordem: menor job esperado primeiro (custo estimado / vazão medida), com
+envelhecimento para que jobs grandes não esperem para sempre. Jobs que
+estourariam o orçamento de trabalho pendente (COMPUTE_BUDGET_S) são
+recusados com `Overloaded`.
+
+`threads` só é garantido por job quando o job roda no próprio processo
+(api_jobs.py): torch.set_num_threads vale para o processo inteiro, então os
+jobs que rodam dentro do processo web (main.py) dividem uma cota única,
+fixada na subida.
+
+Quem submete chama forget(id) quando o job é descartado, senão os tickets
+encerrados se acumulam.
+
+Cancelamento: um job na fila sai dela na hora (e `on_cancel` é chamado);
+um job rodando recebe `cancel_event.set()` e cabe ao job parar.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import metrics
+
+MAX_WORKERS = int(os.environ.get("DUPLICAJA_MAX_WORKERS", 2))   # RNF-02
+DEFAULT_JOB_SECONDS = 60.0    # duração suposta de um job sem custo estimado, antes de medir algum
+HISTORY = 50                  # durações recentes usadas na estimativa
+
+# Custo ~ quadros × W × H × (multi + INFER_WEIGHT·down² + BASE_WEIGHT): warp/blend
+# por intermediário na resolução cheia, inferência na escala `down` e o custo
+# fixo de decode/encode. Pesos ajustados com tempos medidos em 720p na CPU.
+INFER_WEIGHT = 4.5
+BASE_WEIGHT = 0.4
+DEFAULT_THROUGHPUT = 12.5e6   # unidades de custo por segundo até o primeiro job medido
+CALIBRATION_ALPHA = 0.3       # peso de cada job concluído na média móvel da vazão
+AGING = 1.0                   # segundos de "tamanho" perdoados por segundo de espera
+COMPUTE_BUDGET_S = float(os.environ.get("DUPLICAJA_COMPUTE_BUDGET_S", 4 * 3600))
+
+
+def estimate_cost(frames: int, W: int, H: int, multi: int, down: float) -> float:
+    """Custo relativo de um job (unidades: ver DEFAULT_THROUGHPUT)."""
+    return max(1, int(frames)) * max(1, W) * max(1, H) * (max(1, multi) + INFER_WEIGHT * down * down + BASE_WEIGHT)
+
+
+class Overloaded(Exception):
+    """O job estouraria o orçamento de trabalho pendente; `retry_after` em segundos."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"fila acima do orçamento de processamento; tente em ~{int(retry_after)}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Estado de um job dentro do escalonador."""
+
+    def __init__(self, id: str, fn: Callable[["Ticket"], object], api: str,
+                 on_cancel: Optional[Callable[["Ticket"], None]] = None, cost: Optional[float] = None):
+        self.id = id
+        self.cost = cost
+        self.fn = fn
+        self.api = api
+        self.on_cancel = on_cancel
+        self.state = "queued"          # queued|running|done|canceled
+        self.threads = 1
+        self.cancel_event = threading.Event()
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+
+class Scheduler:
+    def __init__(self, workers: int = MAX_WORKERS, cores: Optional[int] = None,
+                 budget_s: float = COMPUTE_BUDGET_S):
+        self.workers = max(1, int(workers))
+        self.cores = cores or os.cpu_count() or 1
+        self.threads_per_job = max(1, self.cores // self.workers)
+        self.budget_s = budget_s
+        self.throughput = DEFAULT_THROUGHPUT
+        self._cond = threading.Condition()
+        self._queue: deque[Ticket] = deque()
+        self._running: Dict[str, Ticket] = {}
+        self._tickets: Dict[str, Ticket] = {}
+        self._durations: deque[float] = deque(maxlen=HISTORY)
+        for k in range(self.workers):
+            threading.Thread(target=self._loop, name=f"scheduler-{k}", daemon=True).start()
+
+    # ---------- submissão / cancelamento ----------
+    def submit(self, id: str, fn: Callable[[Ticket], object], api: str = "web",
+               on_cancel: Optional[Callable[[Ticket], None]] = None, cost: Optional[float] = None) -> Ticket:
+        """
+        Enfileira `fn(ticket)`; roda numa thread do pool quando houver vaga.
+        `cost` (estimate_cost) ordena a fila e calibra a vazão: se `fn`
+        devolver verdadeiro, a duração medida entra na calibração.
+        Levanta Overloaded se o trabalho pendente passaria de `budget_s`.
+        """
+        t = Ticket(id, fn, api, on_cancel, cost)
+        with self._cond:
+            # com a fila vazia aceita sempre, senão um job grande nunca entraria
+            backlog = self._backlog_s(time.time())
+            if backlog > 0 and backlog + self._expected_s(t) / self.workers > self.budget_s:
+                raise Overloaded(backlog + self._expected_s(t) / self.workers - self.budget_s)
+            self._tickets[id] = t
+            self._queue.append(t)
+            self._cond.notify()
+        return t
+
+    def cancel(self, id: str) -> Optional[str]:
+        """
+        "canceled" se o job saiu da fila, "canceling" se está rodando
+        (cancel_event setado), o estado final se já acabou, None se não existe.
+        """
+        with self._cond:
+            t = self._tickets.get(id)
+            if t is None:
+                return None
+            if t.state == "queued":
+                self._queue.remove(t)
+                t.state = "canceled"
+                t.finished_at = time.time()
+                t.cancel_event.set()
+            elif t.state == "running":
+                t.cancel_event.set()
+                return "canceling"
+            else:
+                return t.state
+        if t.on_cancel is not None:
+            t.on_cancel(t)
+        return "canceled"
+
+    def forget(self, id: str):
+        """Descarta o ticket de um job encerrado (limpeza por TTL)."""
+        with self._cond:
+            t = self._tickets.get(id)
+            if t is not None and t.state in ("done", "canceled"):
+                del self._tickets[id]
+
+    # ---------- consulta ----------
+    def _mean_duration(self) -> float:
+        return sum(self._durations) / len(self._durations) if self._durations else DEFAULT_JOB_SECONDS
+
+    def _expected_s(self, t: Ticket) -> float:
+        return t.cost / self.throughput if t.cost else self._mean_duration()
+
+    def _remaining_s(self, t: Ticket, now: float) -> float:
+        return max(0.0, self._expected_s(t) - (now - t.started_at))
+
+    def _backlog_s(self, now: float) -> float:
+        # tempo de parede para esvaziar a fila com todos os workers ocupados
+        work = sum(self._remaining_s(t, now) for t in self._running.values())
+        work += sum(self._expected_s(t) for t in self._queue)
+        return work / self.workers
+
+    def _ordered(self, now: float) -> List[Ticket]:
+        # menor job primeiro; cada segundo de espera desconta AGING do tamanho
+        return sorted(self._queue, key=lambda t: self._expected_s(t) - AGING * (now - t.submitted_at))
+
+    def _plan(self, now: float) -> Dict[str, tuple]:
+        # simula a fila na ordem atual: cada worker fica livre quando o job dele acabar
+        free = sorted(self._remaining_s(t, now) for t in self._running.values())
+        free += [0.0] * (self.workers - len(free))
+        plan = {}
+        for pos, t in enumerate(self._ordered(now)):
+            start = free.pop(0)
+            finish = start + self._expected_s(t)
+            free.append(finish); free.sort()
+            plan[t.id] = (pos, start, finish)
+        return plan
+
+    def info(self, id: str) -> Optional[Dict]:
+        """
+        {state, position, eta_start_s, eta_finish_s, est_start_at, est_finish_at,
+        expected_s, threads}: posição 0 = próximo; *_at em epoch segundos.
+        """
+        now = time.time()
+        with self._cond:
+            t = self._tickets.get(id)
+            if t is None:
+                return None
+            out = {"state": t.state, "position": None, "eta_start_s": None, "eta_finish_s": None,
+                   "est_start_at": None, "est_finish_at": None,
+                   "expected_s": round(self._expected_s(t), 1),
+                   "threads": t.threads if t.state != "queued" else self.threads_per_job}
+            if t.state == "queued":
+                pos, start, finish = self._plan(now)[id]
+            elif t.state == "running":
+                pos, start, finish = None, 0.0, self._remaining_s(t, now)
+            else:
+                return out
+            out.update(position=pos, eta_start_s=round(start, 1), eta_finish_s=round(finish, 1),
+                       est_start_at=round(now + start, 1), est_finish_at=round(now + finish, 1))
+            return out
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "threads_per_job": self.threads_per_job,
+                "queued": len(self._queue),
+                "running": len(self._running),
+                "mean_job_s": round(self._mean_duration(), 2),
+                "throughput": round(self.throughput),
+                "backlog_s": round(self._backlog_s(time.time()), 1),
+                "budget_s": self.budget_s,
+            }
+
+    # ---------- workers ----------
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                t = self._ordered(time.time())[0]
+                self._queue.remove(t)
+                t.state = "running"
+                t.started_at = time.time()
+                t.threads = self.threads_per_job
+                self._running[t.id] = t
+            ok = False
+            try:
+                ok = t.fn(t)
+            except Exception as e:
+                # o job deve tratar os próprios erros; isto só protege o worker
+                print(f"scheduler: job {t.id} falhou fora do tratamento: {e}")
+            finally:
+                with self._cond:
+                    t.finished_at = time.time()
+                    t.state = "done"
+                    self._running.pop(t.id, None)
+                    elapsed = t.finished_at - t.started_at
+                    if ok and not t.cancel_event.is_set():
+                        self._durations.append(elapsed)
+                        if t.cost and elapsed > 0:
+                            self.throughput += CALIBRATION_ALPHA * (t.cost / elapsed - self.throughput)
+
+
+SCHEDULER = Scheduler()
+
+
+@metrics.register_collector
+def _collect_scheduler():
+    s = SCHEDULER.stats()
+    yield ("scheduler_queued", "gauge", "Jobs na fila do escalonador.", [({}, s["queued"])])
+    yield ("scheduler_running", "gauge", "Jobs rodando no escalonador.", [({}, s["running"])])
+    yield ("scheduler_workers", "gauge", "Jobs simultâneos permitidos.", [({}, s["workers"])])
+    yield ("scheduler_threads_per_job", "gauge", "Threads do torch por job.", [({}, s["threads_per_job"])])
+    yield ("scheduler_backlog_seconds", "gauge", "Trabalho pendente estimado (s de parede).", [({}, s["backlog_s"])])
+    yield ("scheduler_throughput", "gauge", "Vazão calibrada (unidades de custo/s).", [({}, s["throughput"])])
@@ -0,0 +1,171 @@
+# spool.py
+"""
+Fila de jobs num diretório compartilhado (NFS/volume comum), para rodar a
+interpolação em outras máquinas (worker.py) enquanto o web só recebe uploads.
+
+    <raiz>/queued/<id>.json   job esperando worker
+    <raiz>/leased/<id>.json   job com dono; o mtime é o heartbeat
+    <raiz>/done/<id>.json     resultado, até o web recolher
+    <raiz>/cancel/<id>        pedido de cancelamento de um job em andamento
+    <raiz>/progress/<id>.json último progresso publicado pelo worker
+
+Tudo é trocado por os.rename (atômico no mesmo sistema de arquivos): dois
+workers disputando o mesmo job não conseguem os dois o rename, e um arquivo
+nunca é visto pela metade (escreve em tmp/ e renomeia). Um lease cujo
+heartbeat passou de `lease_s` volta para queued/ (até MAX_ATTEMPTS vezes).
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+LEASE_SECONDS = 60.0
+MAX_ATTEMPTS = 3
+
+
+class Spool:
+    def __init__(self, root: str, lease_s: float = LEASE_SECONDS):
+        self.root = os.path.abspath(root)
+        self.lease_s = lease_s
+        for d in ("queued", "leased", "done", "cancel", "progress", "tmp"):
+            os.makedirs(os.path.join(self.root, d), exist_ok=True)
+
+    def _path(self, state: str, id: str) -> str:
+        return os.path.join(self.root, state, id + ("" if state == "cancel" else ".json"))
+
+    def _write(self, state: str, id: str, data: Dict):
+        tmp = os.path.join(self.root, "tmp", f"{id}.{uuid.uuid4().hex}")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._path(state, id))
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # ---------- lado do web ----------
+    def enqueue(self, id: str, spec: Dict):
+        self._write("queued", id, dict(spec, id=id, attempts=0, submitted_at=time.time()))
+
+    def cancel(self, id: str) -> Optional[str]:
+        """"canceled" se ainda estava na fila, "canceling" se um worker já pegou."""
+        try:
+            os.unlink(self._path("queued", id))
+            return "canceled"
+        except FileNotFoundError:
+            pass
+        if os.path.exists(self._path("leased", id)):
+            open(self._path("cancel", id), "w").close()
+            return "canceling"
+        return None
+
+    def state(self, id: str) -> Optional[str]:
+        for st in ("leased", "queued", "done"):
+            if os.path.exists(self._path(st, id)):
+                return st
+        return None
+
+    def pop_results(self) -> List[Tuple[str, Dict]]:
+        """Resultados prontos (cada um é entregue uma vez)."""
+        out = []
+        for name in os.listdir(os.path.join(self.root, "done")):
+            id = name[:-5]
+            path = self._path("done", id)
+            data = self._read(path)
+            if data is None:
+                continue
+            os.unlink(path)
+            for st in ("cancel", "progress"):
+                try:
+                    os.unlink(self._path(st, id))
+                except FileNotFoundError:
+                    pass
+            out.append((id, data))
+        return out
+
+    def progress(self, id: str) -> Optional[Dict]:
+        return self._read(self._path("progress", id))
+
+    def depth(self) -> Dict[str, int]:
+        return {st: len(os.listdir(os.path.join(self.root, st))) for st in ("queued", "leased", "done")}
+
+    # ---------- lado do worker ----------
+    def claim(self, worker: str) -> Optional[Dict]:
+        """Pega o job mais antigo da fila (rename para leased/) ou None."""
+        qdir = os.path.join(self.root, "queued")
+        entries = sorted(os.scandir(qdir), key=lambda e: e.stat().st_mtime if e.is_file() else 0)
+        for e in entries:
+            id = e.name[:-5]
+            try:
+                os.rename(e.path, self._path("leased", id))
+            except FileNotFoundError:
+                continue   # outro worker levou
+            os.utime(self._path("leased", id))   # o mtime antigo faria o lease nascer expirado
+            spec = self._read(self._path("leased", id)) or {"id": id}
+            spec.update(worker=worker, leased_at=time.time(), attempts=spec.get("attempts", 0) + 1)
+            self._write("leased", id, spec)
+            return spec
+        return None
+
+    def heartbeat(self, id: str, worker: str) -> bool:
+        """Renova o lease; False se ele foi perdido (expirou e voltou para a fila)."""
+        path = self._path("leased", id)
+        spec = self._read(path)
+        if spec is None or spec.get("worker") != worker:
+            return False
+        os.utime(path)
+        return True
+
+    def report(self, id: str, progress: Dict):
+        """Publica o progresso do job (model.progress.progress_dict)."""
+        self._write("progress", id, progress)
+
+    def canceled(self, id: str) -> bool:
+        return os.path.exists(self._path("cancel", id))
+
+    def complete(self, id: str, worker: str, result: Dict) -> bool:
+        """Publica o resultado e solta o lease; False se o lease já não era nosso."""
+        spec = self._read(self._path("leased", id))
+        if spec is None or spec.get("worker") != worker:
+            return False
+        self._write("done", id, dict(result, worker=worker, attempts=spec.get("attempts", 1)))
+        try:
+            os.unlink(self._path("leased", id))
+        except FileNotFoundError:
+            pass
+        return True
+
+    # ---------- manutenção (qualquer lado pode rodar) ----------
+    def requeue_expired(self) -> List[str]:
+        """Devolve à fila os leases sem heartbeat há mais de lease_s."""
+        now = time.time()
+        moved = []
+        for e in os.scandir(os.path.join(self.root, "leased")):
+            try:
+                if now - e.stat().st_mtime <= self.lease_s:
+                    continue
+            except FileNotFoundError:
+                continue
+            id = e.name[:-5]
+            spec = self._read(e.path) or {"id": id}
+            if spec.get("attempts", 1) >= MAX_ATTEMPTS:
+                self._write("done", id, {"status": "failed",
+                                         "error": f"lease expirou {spec.get('attempts', 1)} vezes (worker caiu?)"})
+                try:
+                    os.unlink(e.path)
+                except FileNotFoundError:
+                    pass
+            else:
+                try:
+                    os.rename(e.path, self._path("queued", id))
+                except FileNotFoundError:
+                    continue
+            moved.append(id)
+        return moved
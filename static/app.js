@@ -44,7 +44,7 @@ let currentXhr = null; // se você ainda usar XHR em algum lugar
 // ======= storage (RF-18 / RF-20) =======
 const LS_PARAMS = "ffi:params";   // últimos valores
 const LS_PRESETS = "ffi:presets"; // presets locais
-const DEFAULT_PARAMS = { multi: 1, fps: "", down: 1, notify: false };
+const DEFAULT_PARAMS = { multi: 1, fps: "", down: 1, notify: false, live: false };
 
 function currentParams() {
   return {
@@ -52,6 +52,7 @@ function currentParams() {
     fps: fpsInput.value ? parseInt(fpsInput.value, 10) : "",
     down: parseFloat(downRange.value || "1"),
     notify: !!(document.getElementById("notify-toggle")?.checked),
+    live: !!(document.getElementById("live-toggle")?.checked),
   };
 }
 
@@ -65,6 +66,8 @@ function applyParams(p) {
   }
   const notifyToggle = document.getElementById("notify-toggle");
   if (notifyToggle) notifyToggle.checked = !!x.notify;
+  const liveToggle = document.getElementById("live-toggle");
+  if (liveToggle) liveToggle.checked = !!x.live;
 }
 
 function saveParamsToStorage(p = currentParams()) {
@@ -358,7 +361,7 @@ function clientValidate() {
 // carregar últimos valores + presets
 loadParamsFromStorage();
 refreshPresetSelect();
-["multi","fps","down","notify-toggle"].forEach(id => {
+["multi","fps","down","notify-toggle","live-toggle"].forEach(id => {
   const el = document.getElementById(id);
   if (el) el.addEventListener("input", () => saveParamsToStorage());
 });
@@ -486,6 +489,9 @@ async function createJob(inputFilename){
     fps_alvo: fpsInput.value ? parseInt(fpsInput.value,10) : undefined,
     downscale: parseFloat(downRange.value||"1"),
     manter_audio: !(audioRemove?.checked),
+    // opcional: MP4 fragmentado tocável em /live durante o processamento (uma
+    // conexão a mais aberta no servidor durante todo o job)
+    stream: !!(document.getElementById("live-toggle")?.checked),
   };
   Object.keys(body).forEach(k => body[k]===undefined && delete body[k]);
 
@@ -505,6 +511,70 @@ async function createJob(inputFilename){
   return data.data; // { id, token, ... }
 }
 
+const FINAL_STATUSES = ["completed","failed","canceled"];
+
+function formatEta(s){
+  s = Math.max(0, Math.round(s));
+  return s >= 60 ? `${Math.floor(s / 60)}min ${s % 60}s` : `${s}s`;
+}
+
+// barra + rótulo a partir do job (quadros, fps e ETA reais durante a interpolação)
+function renderJob(d){
+  if (typeof d.progresso !== "number") return;
+  let label = d.status_label_pt || "Processando…";
+  const p = d.progress;
+  if (d.status === "processing" && p && p.frames_total) {
+    label += ` · ${p.frames_done}/${p.frames_total} quadros`;
+    if (p.fps) label += ` · ${p.fps.toFixed(1)} fps`;
+    if (p.eta_s != null) label += ` · ~${formatEta(p.eta_s)}`;
+  } else if (d.status === "queued" && d.queue?.position != null) {
+    label += ` · posição ${d.queue.position + 1}`;
+  }
+  setProgress(Math.round(d.progresso * 100), label);
+  maybeShowLive(d);
+}
+
+let liveJobId = null;   // job cujo /live está no player
+function hideLive(){
+  if (!liveJobId) return;
+  liveJobId = null;
+  processedVideo.removeAttribute("src");
+  processedVideo.load();
+  colProcessed.classList.add("hidden");
+}
+
+// toca o resultado parcial (/live) assim que o primeiro fragmento existir
+function maybeShowLive(d){
+  if (!d.live_url || liveJobId === d.id || !(d.progress?.frames_done > 0)) return;
+  liveJobId = d.id;
+  processedVideo.srcObject = null;
+  processedVideo.preload = "auto";
+  processedVideo.muted = true;
+  processedVideo.src = d.live_url;
+  processedVideo.load();
+  processedVideo.play?.().catch(()=>{});
+  colProcessed.classList.remove("hidden");
+}
+
+// updates empurrados pelo servidor (SSE); cai no polling se o navegador não
+// suportar ou se o stream for recusado (ex.: token inválido -> mensagem do GET)
+function watchJob(id, token){
+  if (!("EventSource" in window)) return pollJob(id, token);
+  return new Promise((resolve, reject) => {
+    const es = new EventSource(`/api/jobs/${id}/events?token=${encodeURIComponent(token)}`);
+    es.onmessage = (ev) => {
+      let d;
+      try { d = JSON.parse(ev.data); } catch { return; }
+      renderJob(d);
+      if (FINAL_STATUSES.includes(d.status)) { es.close(); resolve(d); }
+    };
+    es.onerror = () => {
+      // CONNECTING = o navegador reconecta sozinho; CLOSED = desistiu
+      if (es.readyState === EventSource.CLOSED) pollJob(id, token).then(resolve, reject);
+    };
+  });
+}
+
 async function pollJob(id, token){
   while (true){
     const r = await fetch(`/api/jobs/${id}?token=${encodeURIComponent(token)}`);
@@ -516,10 +586,8 @@ async function pollJob(id, token){
     const d = data?.data;
     if (!d) throw new Error("Resposta inesperada no status do job.");
 
-    if (typeof d.progresso === "number") {
-      setProgress(Math.round(d.progresso * 100), d.status_label_pt || "Processando…");
-    }
-    if (["completed","failed","canceled"].includes(d.status)) return d;
+    renderJob(d);
+    if (FINAL_STATUSES.includes(d.status)) return d;
     await new Promise(res => setTimeout(res, 900));
   }
 }
@@ -529,10 +597,16 @@ function showResult(d){
   const playUrl = new URL(d.result_url);
   playUrl.searchParams.set("_", Date.now().toString()); // cache-buster
 
+  // vindo do /live: troca pelo arquivo final sem voltar ao início
+  const resumeAt = liveJobId === d.id ? processedVideo.currentTime : 0;
+  liveJobId = null;
   processedVideo.srcObject = null;
   processedVideo.preload = "auto";
   processedVideo.muted = true; // ajuda autoplay
   processedVideo.src = playUrl.toString();
+  if (resumeAt > 0) {
+    processedVideo.addEventListener("loadedmetadata", () => { processedVideo.currentTime = resumeAt; }, { once: true });
+  }
   processedVideo.load();
   processedVideo.play?.().catch(()=>{});
   colProcessed.classList.remove("hidden");
@@ -564,7 +638,7 @@ sendBtn.addEventListener("click", async () => {
     const job = await createJob(filename);      // => { id, token, ... }
 
     setProgress(45, "Na fila/Processando…");
-    const final = await pollJob(job.id, job.token);
+    const final = await watchJob(job.id, job.token);
 
     if (final.status === "completed" && final.result_url){
       setProgress(95, "Preparando player…");
@@ -573,10 +647,10 @@ sendBtn.addEventListener("click", async () => {
       setProgress(100, "Concluído");
     } else if (final.status === "failed"){
       setStatus(final.message || "Falha no job.", "error");
-      hideProgress();
+      hideProgress(); hideLive();
     } else if (final.status === "canceled"){
       setStatus("Job cancelado.", "warning");
-      hideProgress();
+      hideProgress(); hideLive();
     }
   } catch (e){
     console.error(e);
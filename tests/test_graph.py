@@ -0,0 +1,24 @@
+"""GraphFlowNet: lotes parciais reaproveitam o grafo do lote cheio; saída igual ao eager."""
+import torch
+
+from model.graph import GraphFlowNet
+from model.model import FlowNet
+
+
+def test_partial_batches_reuse_warmed_graph(tmp_path):
+    torch.manual_seed(0)
+    model = FlowNet(base=16).eval()
+    g = GraphFlowNet(model, "script", str(tmp_path))
+    g.warmup([(4, 32, 48)], log=lambda *a: None)
+    x0, x1 = torch.rand(4, 3, 32, 48), torch.rand(4, 3, 32, 48)
+    for B in (4, 3, 1):
+        f0, m0 = model.inference_to_size(x0[:B], x1[:B], 64, 96, scale=2.0)
+        f1, m1 = g.inference_to_size(x0[:B], x1[:B], 64, 96, scale=2.0)
+        assert torch.equal(f0, f1) and torch.equal(m0, m1)
+        assert all(torch.equal(a, b) for a, b in zip(model.inference(x0[:B], x1[:B]), g.inference(x0[:B], x1[:B])))
+    assert list(g._graphs) == [(4, 32, 48)] and g.stats["built"] == 1
+
+    # outro processo: acha o grafo de B=4 no disco em vez de compilar B=2
+    g2 = GraphFlowNet(model, "script", str(tmp_path))
+    g2.inference(x0[:2], x1[:2])
+    assert g2.stats == {"built": 0, "loaded": 1, "build_s": 0.0}
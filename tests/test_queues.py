@@ -0,0 +1,22 @@
+"""ByteQueue: close() acorda o produtor parado e devolve os orçamentos."""
+import threading
+
+import numpy as np
+
+from model.queues import ByteBudget, ByteQueue
+
+
+def test_close_unblocks_put_and_releases_budget():
+    process = ByteBudget(10_000)
+    q = ByteQueue(1000, process_budget=process)
+    assert q.put(np.zeros(800, np.uint8))
+    results = []
+    t = threading.Thread(target=lambda: results.append(q.put(np.zeros(800, np.uint8))))
+    t.start()
+    t.join(0.2)
+    assert t.is_alive()          # sem espaço: parado no put()
+    q.close()
+    t.join(2)
+    assert not t.is_alive() and results == [False]
+    assert q.budget.used == 0 and process.used == 0
+    assert q.put(None) is False and q.qsize() == 0
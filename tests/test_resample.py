@@ -0,0 +1,67 @@
+"""FlowNet.inference_to_size (model.model.reconstruct) contra inference + resize bilinear."""
+import pytest
+import torch
+import torch.nn.functional as F
+
+import model.model as mm
+from model.model import FlowNet, _resize_matrix, resize_rows
+
+TOL = 1e-3
+
+# (W, H, down) que já quebraram o índice da última coluna por arredondamento
+GEOMETRIES = [
+    (160, 96, 0.25), (640, 360, 0.75), (640, 480, 0.75), (360, 640, 0.75), (176, 144, 0.75),
+    (854, 480, 0.3), (1280, 720, 0.35), (1920, 1080, 0.35), (1280, 720, 0.5), (320, 240, 0.5),
+]
+
+SIZES = sorted({1, 2, 3, 5, 7, 11, 16, 23, 45, 64, 90, 120, 135, 176, 240, 256, 270, 480, 504, 720, 1080}
+               | {n * 16 for n in range(1, 34)})
+
+
+@pytest.mark.parametrize("n_in", SIZES[:40])
+def test_resize_matrix_matches_interpolate(n_in):
+    x = torch.rand(1, 1, 1, n_in, dtype=torch.float64)
+    for n_out in SIZES:
+        M = _resize_matrix(n_in, n_out)
+        ref = F.interpolate(x, size=(1, n_out), mode="bilinear", align_corners=True).flatten()
+        assert torch.allclose(M @ x.flatten(), ref, atol=1e-9), (n_in, n_out)
+        assert torch.allclose(M.sum(1), torch.ones(n_out, dtype=torch.float64))
+
+
+@pytest.mark.parametrize("h,w,H,W", [(1, 5, 7, 9), (17, 30, 270, 480), (33, 60, 540, 960), (45, 80, 45, 80)])
+def test_resize_rows_strips(h, w, H, W):
+    x = torch.rand(2, 3, h, w)
+    full = resize_rows(x, H, W, 0, H)
+    ref = F.interpolate(x, size=(H, W), mode="bilinear", align_corners=True)
+    assert (full - ref).abs().max() < 1e-5
+    for step in (1, 7, H // 3 or 1):
+        strips = torch.cat([resize_rows(x, H, W, y, min(H, y + step)) for y in range(0, H, step)], dim=2)
+        assert torch.equal(strips, full)
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return FlowNet(base=16).eval()
+
+
+def _chained(model, x0, x1, H, W, scale):
+    flow, mask = model.inference(x0, x1)
+    return (F.interpolate(flow, size=(H, W), mode="bilinear", align_corners=True) * scale,
+            F.interpolate(mask, size=(H, W), mode="bilinear", align_corners=True))
+
+
+@pytest.mark.parametrize("dense", [True, False], ids=["dense", "chained"])
+@pytest.mark.parametrize("W,H,down", GEOMETRIES)
+def test_inference_to_size_matches_chained(model, monkeypatch, W, H, down, dense):
+    if not dense:
+        monkeypatch.setattr(mm, "RESAMPLE_MAX_COARSE", 0)
+    h, w = int(H * down), int(W * down)
+    x0, x1 = torch.rand(2, 3, h, w), torch.rand(2, 3, h, w)
+    scale = H / float(h)
+    f0, m0 = _chained(model, x0, x1, H, W, scale)
+    fu, mu = torch.empty(2, 4, H, W), torch.empty(2, 1, H, W)
+    f1, m1 = model.inference_to_size(x0, x1, H, W, scale=scale, flow_out=fu, mask_out=mu)
+    assert f1.data_ptr() == fu.data_ptr() and m1.data_ptr() == mu.data_ptr()
+    assert (f0 - f1).abs().max() < TOL * max(1.0, scale)
+    assert (m0 - m1).abs().max() < TOL
@@ -0,0 +1,65 @@
+"""Readers com `start`: o trecho pulado por tempo sai igual ao da decodificação inteira."""
+import subprocess
+
+import cv2
+import numpy as np
+import pytest
+
+from model.video_io import ffmpeg_available, frame_times, open_reader
+
+W, H, N = 64, 48, 60
+STARTS = [1, 2, 11, 12, 13, 30, 47, 58, 59]
+
+needs_ffmpeg = pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg fora do PATH")
+
+
+@pytest.fixture(scope="module")
+def videos(tmp_path_factory):
+    d = tmp_path_factory.mktemp("vid")
+    avi = str(d / "in.avi")
+    w = cv2.VideoWriter(avi, cv2.VideoWriter_fourcc(*"mp4v"), 24, (W, H))
+    rng = np.random.default_rng(0)
+    for k in range(N):
+        frame = rng.integers(0, 256, (H, W, 3), dtype=np.uint8)
+        cv2.putText(frame, str(k), (4, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 3)
+        w.write(frame)
+    w.release()
+    out = {"avi": avi}
+    if ffmpeg_available():
+        # H.264 com B-frames e pts deslocado: ordem de decodificação != de apresentação
+        mp4 = str(d / "bf.mp4")
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", avi, "-c:v", "libx264", "-bf", "3",
+                        "-g", "12", "-pix_fmt", "yuv420p", "-output_ts_offset", "0.7", mp4], check=True)
+        out["mp4"] = mp4
+    return out
+
+
+def _read(path, backend, start=0, count=None):
+    reader = open_reader(path, W, H, backend=backend, start=start, count=count)
+    frames = []
+    try:
+        buf = np.empty((H, W, 3), np.uint8)
+        while reader.read_into(buf):
+            frames.append(buf.copy())
+    finally:
+        reader.release()
+    return frames
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("container", ["avi", "mp4"])
+def test_frame_times_one_per_frame(videos, container):
+    times = frame_times(videos[container])
+    assert len(times) == N and list(times) == sorted(times)
+
+
+@pytest.mark.parametrize("backend", ["cv2", pytest.param("ffmpeg", marks=needs_ffmpeg)])
+@pytest.mark.parametrize("container", ["avi", pytest.param("mp4", marks=needs_ffmpeg)])
+def test_start_matches_full_decode(videos, container, backend):
+    path = videos[container]
+    full = _read(path, backend)
+    assert len(full) == N
+    for start in STARTS:
+        part = _read(path, backend, start=start, count=5)
+        assert len(part) == min(5, N - start), start
+        assert all(np.array_equal(a, b) for a, b in zip(part, full[start:])), start
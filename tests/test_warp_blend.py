@@ -0,0 +1,45 @@
+"""_warp_blend (um grid_sample para os dois warps + lerp) contra warp(I0)*m + warp(I1)*(1-m)."""
+import pytest
+import torch
+
+from model.util import _grid, _warp_blend, timesteps, warp
+
+# a fusão só troca a ordem das contas em float: no máximo 1 LSB depois do truncamento
+LSB = 1
+
+CASES = [(1, 16, 24, 1), (2, 32, 48, 1), (2, 31, 45, 3), (3, 9, 64, 2), (1, 2, 7, 1)]
+
+
+def _reference(I0, I1, flow, mask, ts):
+    out = []
+    for t in ts:
+        w0 = warp(I0, flow[:, :2] * t)
+        w1 = warp(I1, flow[:, 2:] * (1 - t))
+        out.append((w0 * mask + w1 * (1 - mask)) * 255.0)
+    return torch.stack(out, 2)   # (B, 3, n, H, W)
+
+
+@pytest.mark.parametrize("channels_last", [False, True], ids=["nchw", "nhwc"])
+@pytest.mark.parametrize("B,H,W,multi", CASES)
+def test_warp_blend_matches_two_warps(B, H, W, multi, channels_last):
+    torch.manual_seed(B * H + W)
+    I0, I1 = torch.rand(B, 3, H, W), torch.rand(B, 3, H, W)
+    flow = torch.randn(B, 4, H, W) * 4     # passa da borda de propósito
+    mask = torch.rand(B, 1, H, W)
+    ts = timesteps(multi)
+    n = len(ts)
+
+    fmt = torch.channels_last if channels_last else torch.contiguous_format
+    base, norm = _grid(H, W, flow.device, flow.dtype)
+    fn = flow.permute(0, 2, 3, 1) * norm
+    t0 = torch.tensor(ts).view(1, n, 1, 1, 1)
+    t1 = torch.tensor([1 - t for t in ts]).view(1, n, 1, 1, 1)
+    vgrid = torch.empty(2 * B, n * H, W, 2)
+    warped = torch.empty(2 * B, 3, n * H, W).contiguous(memory_format=fmt)
+
+    out = _warp_blend(I0.contiguous(memory_format=fmt), I1.contiguous(memory_format=fmt),
+                      fn, base[:, None], mask, t0, t1, vgrid, warped)
+    ref = _reference(I0, I1, flow, mask, ts)
+    assert out.shape == ref.shape
+    assert (out.to(torch.uint8).int() - ref.to(torch.uint8).int()).abs().max() <= LSB
+    assert (out - ref).abs().max() < LSB
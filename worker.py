@@ -0,0 +1,160 @@
+# worker.py
+"""
+Worker de interpolação para rodar em outras máquinas.
+
+Carrega o FlowNet uma vez (por precisão, model.quantized) e consome jobs do spool compartilhado (spool.py)
+que o api_jobs.py preenche quando DUPLICAJA_SPOOL está definido. Entrada e
+saída dos jobs são caminhos absolutos, então uploads/ e outputs/ precisam
+estar no mesmo volume compartilhado, montado no mesmo caminho.
+
+Uso:
+    python worker.py --spool /mnt/duplicaja/spool --threads 8
+    DUPLICAJA_SPOOL=/mnt/duplicaja/spool python worker.py
+
+Enquanto roda um job, renova o lease a cada lease/3 segundos; se o worker
+morrer, o lease expira e o job volta para a fila (ver Spool.requeue_expired).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+
+import torch
+
+from model.progress import progress_dict
+from model.quantized import load_flownet
+from model.segments import interpolate_video_segmented
+from model.util import SCENE_CUT_THRESHOLD, STATIC_THRESHOLD, interpolate_video
+from model.video_io import ffmpeg_available
+from spool import LEASE_SECONDS, Spool
+
+CANCEL_CHECK_SECONDS = 1.0
+
+
+class _Models:
+    """FlowNet por precisão, carregado na primeira vez que um job pede."""
+
+    def __init__(self, weights):
+        self.weights = weights
+        self._loaded = {}
+
+    def get(self, precision):
+        if precision not in self._loaded:
+            self._loaded[precision] = load_flownet(self.weights, precision)
+        return self._loaded[precision]
+
+
+def _watch(spool: Spool, id: str, wid: str, done: threading.Event, cancel: threading.Event, latest: dict):
+    """Heartbeat do lease, progresso e pedido de cancelamento; perder o lease também cancela."""
+    last_beat = time.time()
+    reported = None
+    while not done.wait(CANCEL_CHECK_SECONDS):
+        if spool.canceled(id):
+            cancel.set()
+        snap = latest.get("progress")
+        if snap is not None and snap != reported:
+            spool.report(id, progress_dict(*snap))
+            reported = snap
+        if time.time() - last_beat >= spool.lease_s / 3:
+            if not spool.heartbeat(id, wid):
+                print(f"worker: lease de {id} perdido; abandonando")
+                cancel.set()
+                return
+            last_beat = time.time()
+
+
+def run_job(spool: Spool, spec: dict, wid: str, models: _Models, threads: int | None) -> dict:
+    """Roda um job do spool; devolve o resultado publicado em done/."""
+    id = spec["id"]
+    src, out = spec["input_path"], spec["output_path"]
+    done, cancel = threading.Event(), threading.Event()
+    latest = {}   # último (feitos, total, fps); o _watch publica no spool
+    progress = lambda *p: latest.__setitem__("progress", p)
+    watcher = threading.Thread(target=_watch, args=(spool, id, wid, done, cancel, latest), daemon=True)
+    watcher.start()
+    web_ready = ffmpeg_available()
+    stats = {}
+    try:
+        if not os.path.exists(src):
+            raise RuntimeError("arquivo de entrada não encontrado")
+        precision = spec.get("precision", "fp32")
+        model = models.get(precision)
+        segments = spec.get("segments")
+        if segments is not None and segments != 1:
+            res = interpolate_video_segmented(
+                src, out, multi=spec["multi"], fps_override=spec.get("fps_override"), down=spec["down"],
+                segments=segments or None, cores=threads, batch_size=spec.get("batch_size"),
+                reader=spec.get("reader", "cv2"), audio_path=src if spec.get("audio") else None,
+                cancel_event=cancel, stats=stats, model=model, progress=progress,
+                scene_threshold=spec.get("scene_threshold", SCENE_CUT_THRESHOLD),
+                static_threshold=spec.get("static_threshold", STATIC_THRESHOLD), precision=precision)
+        else:
+            res = interpolate_video(
+                in_path=src, out_path=out, multi=spec["multi"], fps_override=spec.get("fps_override"),
+                down=spec["down"], model=model, device=torch.device("cpu"), cancel_event=cancel,
+                batch_size=spec.get("batch_size"), writer="ffmpeg" if web_ready else "cv2",
+                audio_path=src if spec.get("audio") else None, reader=spec.get("reader", "cv2"),
+                stats=stats, progress=progress, live=bool(spec.get("stream")),
+                scene_threshold=spec.get("scene_threshold", SCENE_CUT_THRESHOLD),
+                static_threshold=spec.get("static_threshold", STATIC_THRESHOLD))
+        if cancel.is_set():
+            raise InterruptedError()
+        avg_fps, frames, fps_in, fps_out, W, H = res
+        # mesmo sidecar que o api_jobs grava quando roda o job localmente
+        with open(out + ".meta", "w", encoding="utf-8") as f:
+            f.write(f"{avg_fps}|{frames}|{fps_in}|{fps_out}|{W}|{H}|{json.dumps(stats, separators=(',', ':'))}")
+        return {"status": "completed", "web_ready": web_ready}
+    except Exception as e:
+        # cancelado: o web já apagou entrada/saída, então um erro aqui é esperado
+        if cancel.is_set():
+            try:
+                os.unlink(out)
+            except FileNotFoundError:
+                pass
+            return {"status": "canceled"}
+        return {"status": "failed", "error": str(e)}
+    finally:
+        done.set()
+        watcher.join()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Worker do DuplicaJa (consome o spool compartilhado).")
+    ap.add_argument("--spool", default=os.environ.get("DUPLICAJA_SPOOL"), help="diretório do spool (ou DUPLICAJA_SPOOL)")
+    ap.add_argument("--weights", default="best_model.pth")
+    ap.add_argument("--threads", type=int, default=None, help="torch.set_num_threads (padrão: todos os núcleos)")
+    ap.add_argument("--poll", type=float, default=1.0, help="segundos entre consultas com a fila vazia")
+    ap.add_argument("--lease", type=float, default=LEASE_SECONDS, help="segundos sem heartbeat até o job voltar à fila")
+    ap.add_argument("--id", default=f"{socket.gethostname()}:{os.getpid()}", help="nome do worker nos leases")
+    args = ap.parse_args(argv)
+    if not args.spool:
+        ap.error("informe --spool ou DUPLICAJA_SPOOL")
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    spool = Spool(args.spool, lease_s=args.lease)
+    models = _Models(args.weights)
+    models.get("fp32")
+    print(f"worker {args.id}: consumindo {spool.root}")
+
+    while True:
+        spool.requeue_expired()
+        spec = spool.claim(args.id)
+        if spec is None:
+            time.sleep(args.poll)
+            continue
+        print(f"worker {args.id}: job {spec['id']} (tentativa {spec['attempts']})")
+        t0 = time.time()
+        result = run_job(spool, spec, args.id, models, args.threads)
+        if not spool.complete(spec["id"], args.id, result):
+            print(f"worker {args.id}: job {spec['id']} já não era deste worker; resultado descartado")
+            continue
+        print(f"worker {args.id}: job {spec['id']} {result['status']} em {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())